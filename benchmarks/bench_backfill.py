@@ -0,0 +1,91 @@
+"""Compare backfilling archived uploads one by one and in column batches.
+
+Uploads of a synthetic fleet are decoded into a history directory, with
+metric units: first each through PWSRequestProcessor.process_request and
+WeatherStation.update_measurement, as the server would, then with the
+backfill command's column batches.
+
+Usage: PYTHONPATH=src python benchmarks/bench_backfill.py [--uploads N]
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+
+from pwsproto.backfill import Backfill, HistorySink
+from pwsproto.config import StationConfig
+from pwsproto.history import HistoryStore
+from pwsproto.ingest import parse_query
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.replay import SyntheticStation
+from pwsproto.station import WeatherStation
+from pwsproto.units import UnitNormalizer
+
+STATIONS = 100
+UPLOAD_INTERVAL = 16
+
+
+def synthetic_uploads(count: int) -> list[str]:
+    rng = random.Random(0)
+    stations = [SyntheticStation(f"SYNTH{i}", f"KEY{i}", rng) for i in range(STATIONS)]
+    start = 1.7e9
+    return [
+        stations[i % STATIONS].upload(start + i // STATIONS * UPLOAD_INTERVAL)
+        for i in range(count)
+    ]
+
+
+def one_by_one(uploads: list[str], directory: str) -> float:
+    history = HistoryStore(directory)
+    normalizer = UnitNormalizer("metric")
+    processor = PWSRequestProcessor(
+        [
+            WeatherStation(
+                f"SYNTH{i}", f"KEY{i}", unit_normalizer=normalizer, history=history
+            )
+            for i in range(STATIONS)
+        ]
+    )
+    start = time.perf_counter()
+    for query in uploads:
+        processor.process_request(parse_query(query))
+    history.flush()
+    return time.perf_counter() - start
+
+
+def column_batches(uploads: list[str], directory: str) -> float:
+    stations = [
+        StationConfig(f"SYNTH{i}", f"SYNTH{i}", f"KEY{i}", unit_system="metric")
+        for i in range(STATIONS)
+    ]
+    sink = HistorySink(directory)
+    start = time.perf_counter()
+    Backfill(stations, [sink]).run(uploads)
+    sink.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, required=False, default=200000)
+    args = parser.parse_args()
+    # The synthetic uploads carry the unknown "action" parameter
+    logging.disable(logging.WARNING)
+
+    uploads = synthetic_uploads(args.uploads)
+    for label, backfill in (
+        ("one by one", one_by_one),
+        ("column batches", column_batches),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            seconds = backfill(uploads, directory)
+        print(
+            f"{label:>14}: {len(uploads) / seconds:8.0f} uploads/s "
+            f"({len(uploads) * 60 / seconds / 1e6:.2f} M uploads/min)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Compare the dateutc parser with datetime.strptime.
+
+Usage: PYTHONPATH=src python benchmarks/bench_dateutc.py
+"""
+
+import datetime
+import timeit
+
+from pwsproto.pws_request import parse_dateutc
+
+
+def strptime_dateutc(x: str) -> datetime.datetime:
+    # Converter as it was before parse_dateutc
+    return datetime.datetime.strptime(x, "%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    number = 100000
+    for value in ("2000-01-01 10:32:35", "2000-01-01+10%3A32%3A35", "now"):
+        for label, parse in (
+            ("strptime", strptime_dateutc),
+            ("parse_dateutc", parse_dateutc),
+        ):
+            try:
+                parse(value)
+            except ValueError:
+                print(f"{value!r:>28} {label:>14}: unsupported")
+                continue
+            elapsed = min(timeit.repeat(lambda: parse(value), number=number, repeat=5))
+            print(f"{value!r:>28} {label:>14}: {elapsed / number * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
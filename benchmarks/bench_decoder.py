@@ -0,0 +1,100 @@
+"""Compare the compiled PWS decoder with the former linear-scan loop.
+
+Usage: PYTHONPATH=src python benchmarks/bench_decoder.py
+"""
+
+import logging
+import timeit
+
+from pwsproto.pws_request import (
+    pws_to_measurement_dict,
+    url_param_to_status_dict,
+)
+
+
+def linear_scan_decode(fields: dict[str, str]):
+    # Decoder as it was before the lookup table: one pass over every known
+    # parameter for each given parameter.
+    measurement_dict = {}
+    unmatched_params = {}
+    for given_param, value in fields.items():
+        param_matched = False
+        for expected_param in url_param_to_status_dict:
+            if given_param == expected_param:
+                param_matched = True
+                converter = url_param_to_status_dict[expected_param]
+                try:
+                    measurement_dict[converter.sensor_name] = converter.convert(value)
+                except ValueError as err:
+                    logging.warning(f"Parameter error for {given_param}: {err}")
+                break
+        if not param_matched:
+            unmatched_params[given_param] = value
+    return measurement_dict, unmatched_params
+
+
+UPLOAD_15 = {
+    "dateutc": "2000-01-01 10:32:35",
+    "winddir": "230",
+    "windspeedmph": "12",
+    "windgustmph": "12",
+    "tempf": "70",
+    "rainin": "0",
+    "dailyrainin": "0.12",
+    "baromin": "29.1",
+    "dewptf": "68.2",
+    "humidity": "90",
+    "weather": "sunny",
+    "clouds": "none",
+    "solarradiation": "512.3",
+    "UV": "4",
+    "softwaretype": "vws versionxx",
+    "action": "updateraw",
+}
+
+UPLOAD_40 = {
+    **UPLOAD_15,
+    "windgustdir": "240",
+    "windspdmph_avg2m": "10.2",
+    "winddir_avg2m": "235",
+    "windgustmph_10m": "15.1",
+    "windgustdir_10m": "250",
+    "indoortempf": "68.4",
+    "indoorhumidity": "45",
+    "soiltempf": "55.1",
+    "soilmoisture": "31",
+    "leafwetness": "10",
+    "temp2f": "69.8",
+    "temp3f": "71.0",
+    "soiltemp2f": "54.3",
+    "soilmoisture2": "28",
+    "AqNO": "12",
+    "AqNO2": "18",
+    "AqSO2": "3",
+    "AqCO": "1",
+    "AqPM2.5": "8.4",
+    "AqPM10": "14.2",
+    "AqOZONE": "31",
+    "AqBC": "0.8",
+    "AqOC": "1.2",
+    "realtime": "1",
+    "rtfreq": "5",
+}
+
+
+def main():
+    for upload in (UPLOAD_15, UPLOAD_40):
+        name = f"{len(upload)} fields"
+        number = 20000
+        for label, decode in (
+            ("linear scan", linear_scan_decode),
+            ("compiled", pws_to_measurement_dict),
+        ):
+            elapsed = min(
+                timeit.repeat(lambda: decode(upload), number=number, repeat=5)
+            )
+            print(f"{name:>10} {label:>12}: {elapsed / number * 1e6:8.2f} us/upload")
+
+
+if __name__ == "__main__":
+    main()
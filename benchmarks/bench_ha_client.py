@@ -0,0 +1,77 @@
+"""Compare per-sensor connections, the pooled session and batched pushes.
+
+Pushes station uploads to a local stub Home Assistant and reports the number
+of TCP connections (handshakes) and the wall time per upload.
+
+Usage: PYTHONPATH=src python benchmarks/bench_ha_client.py
+"""
+
+import time
+from datetime import datetime
+
+from pwsproto.ha_http_client import UpdateHAAPI, update_ha_sensor_via_api
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.station import SENSOR_MAPPING, Measurement, WeatherStation
+
+
+class UnpooledUpdateHAAPI(UpdateHAAPI):
+    # Client as it was before the session: one requests.post per sensor.
+    def __call__(self, station: WeatherStation):
+        for sensor_name, payload in station.get_ha_payloads().items():
+            update_ha_sensor_via_api(
+                self.ha_host,
+                self.LLT,
+                station.id,
+                sensor_name,
+                payload,
+                ha_port=self.ha_port,
+            )
+
+
+def _measurements(sensor_count: int) -> dict[str, Measurement]:
+    measurements = {
+        name: Measurement(float(i))
+        for i, name in enumerate(list(SENSOR_MAPPING)[:sensor_count])
+    }
+    measurements["date"] = Measurement(datetime(2000, 1, 1, 10, 32, 35))
+    return measurements
+
+
+def main():
+    uploads = 20
+    for sensor_count in (15, 40):
+        measurements = _measurements(sensor_count)
+        for label, client_class, batch_path in (
+            ("unpooled", UnpooledUpdateHAAPI, None),
+            ("pooled", UpdateHAAPI, None),
+            ("batched", UpdateHAAPI, "/api/pwsproto/states"),
+        ):
+            stub = HAStubServer(batch_path=batch_path).start()
+            client = client_class(
+                "token",
+                "127.0.0.1",
+                ha_port=stub.port,
+                concurrency=1,
+                wait=True,
+                delta=False,
+                batch_path=batch_path,
+            )
+            station = WeatherStation("bench", "password", update_callback=client)
+
+            start = time.perf_counter()
+            for _ in range(uploads):
+                station.update_measurement(measurements)
+            elapsed = time.perf_counter() - start
+
+            client.close()
+            stub.stop()
+            print(
+                f"{sensor_count} sensors {label:>8}: "
+                f"{stub.connections / uploads:6.1f} handshakes/upload, "
+                f"{stub.requests / uploads:6.1f} requests/upload, "
+                f"{elapsed / uploads * 1e3:7.2f} ms/upload"
+            )
+
+
+if __name__ == "__main__":
+    main()
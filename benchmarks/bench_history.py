@@ -0,0 +1,76 @@
+"""Measure history ingest throughput and 30-day query latency.
+
+Usage: PYTHONPATH=src python benchmarks/bench_history.py
+"""
+
+from array import array
+from datetime import datetime, timedelta, timezone
+import tempfile
+import time
+
+from pwsproto.history import HistoryStore
+from pwsproto.station import SENSOR_MAPPING, Measurement
+
+UPLOAD_INTERVAL = 16
+
+
+def main():
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    sensor_names = list(SENSOR_MAPPING)[:40]
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryStore(directory)
+
+        # Ingest: uploads of 40 sensors from 10 stations
+        uploads = 20000
+        measurements = {name: Measurement(1.5) for name in sensor_names}
+        begin = time.perf_counter()
+        for i in range(uploads):
+            history.record(
+                f"station{i % 10}",
+                start + timedelta(seconds=UPLOAD_INTERVAL * (i // 10)),
+                measurements,
+            )
+        elapsed = time.perf_counter() - begin
+        print(
+            f"ingest: {uploads / elapsed:8.0f} uploads/s "
+            f"({uploads * len(sensor_names) / elapsed:8.0f} samples/s)"
+        )
+
+        # 30 days of one sensor, every 16 seconds
+        timestamp = start.timestamp()
+        samples = 30 * 24 * 3600 // UPLOAD_INTERVAL
+        history.extend(
+            "month",
+            "outdoor_temperature",
+            array("d", (timestamp + i * UPLOAD_INTERVAL for i in range(samples))),
+            array("d", (float(i % 100) for i in range(samples))),
+        )
+        end = start + timedelta(days=30)
+
+        for label, query in (
+            (
+                "30-day hourly aggregate",
+                lambda: history.aggregate("month", "outdoor_temperature", start, end),
+            ),
+            (
+                "7-day minute aggregate",
+                lambda: history.aggregate(
+                    "month", "outdoor_temperature", end - timedelta(days=7), end, 60
+                ),
+            ),
+            (
+                "1-day raw samples",
+                lambda: history.query(
+                    "month", "outdoor_temperature", end - timedelta(days=1), end
+                ),
+            ),
+        ):
+            begin = time.perf_counter()
+            result = query()
+            elapsed = time.perf_counter() - begin
+            print(f"{label}: {elapsed * 1e3:7.2f} ms ({len(result)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare the upload throughput of the Bottle route and the WSGI ingest app.
+
+Both apps are called in-process with the WSGI environ of an upload, as a WSGI
+server would, on a single thread; the HTTP parsing of the server itself is
+left out. Stations have no update callback.
+
+Usage: PYTHONPATH=src python benchmarks/bench_ingest.py
+"""
+
+from wsgiref.util import setup_testing_defaults
+import timeit
+
+from bottle import Bottle
+
+from pwsproto.ingest import PWS_ROUTE, IngestApp
+from pwsproto.server import RequestProcessor
+from pwsproto.station import WeatherStation
+
+QUERY = (
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A30%3A20&winddir=230"
+    "&windspeedmph=12&windgustmph=12&tempf=70&rainin=0&baromin=29.1&dewptf=68.2"
+    "&humidity=40&weather=Sonnig&clouds=&softwaretype=vws%20versionxx"
+    "&action=updateraw&realtime=1&rtfreq=2.5"
+)
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+ENVIRON = {"PATH_INFO": PWS_ROUTE, "QUERY_STRING": QUERY}
+setup_testing_defaults(ENVIRON)
+
+
+def call(app):
+    # Bottle caches the parsed request in the environ: use a fresh one
+    for _ in app(dict(ENVIRON), start_response):
+        pass
+
+
+def main():
+    bottle_app = Bottle()
+    bottle_app.route(
+        PWS_ROUTE,
+        method="GET",
+        callback=RequestProcessor([WeatherStation("STATION", "KEY")]),
+    )
+    ingest_app = IngestApp(
+        RequestProcessor([WeatherStation("STATION", "KEY")]), fallback=bottle_app
+    )
+    number = 20000
+    for label, app in (("bottle route", bottle_app), ("ingest app", ingest_app)):
+        call(app)
+        seconds = min(timeit.repeat(lambda: call(app), number=number, repeat=5))
+        seconds /= number
+        print(
+            f"{label:>12}: {seconds * 1e6:6.2f} µs/upload, {1 / seconds:8.0f} uploads/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
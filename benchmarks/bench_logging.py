@@ -0,0 +1,90 @@
+"""Compare the per-upload logging cost before and after lazy logging.
+
+Uploads with two unknown parameters are processed by the station server and
+by the probe, with the root logger at INFO and WARNING levels. Records are
+written to an in-memory stream. The former logging (one eager f-string per
+field or unknown parameter, unknown parameters warned about on every upload)
+is reproduced for comparison.
+
+Usage: PYTHONPATH=src python benchmarks/bench_logging.py
+"""
+
+import io
+import logging
+import timeit
+
+from pwsproto.probe import process_params
+from pwsproto.pws_request import PWSRequestProcessor, pws_to_measurement_dict
+from pwsproto.station import WeatherStation
+
+PARAMS = {
+    "ID": "station",
+    "PASSWORD": "password",
+    "dateutc": "2000-01-01 10:32:35",
+    "winddir": "230",
+    "windspeedmph": "12",
+    "windgustmph": "12",
+    "tempf": "70",
+    "rainin": "0",
+    "baromin": "29.1",
+    "dewptf": "68.2",
+    "humidity": "90",
+    "softwaretype": "vws%20versionxx",
+    "action": "updateraw",
+    "realtime": "1",
+}
+
+
+class EagerProcessor(PWSRequestProcessor):
+    # Warnings as they were logged before, one per unknown parameter
+    def warn_unknown_parameters(self, id: str, unmatched_params: dict[str, str]):
+        for param, value in unmatched_params.items():
+            logging.warning(f"Unknown parameter: {param}={value}")
+
+
+def eager_probe(params: dict[str, str]):
+    # Probe logging as it was before, one record per line
+    session_id = 1234
+    station_id = params.get("ID", None)
+    station_key = params.get("PASSWORD", None)
+    logging.info(f"[{session_id}]: *** Begin Station Update ***")
+    logging.info(
+        f"[{session_id}]: Station ID = {station_id}, Station Key = {station_key}"
+    )
+    fields = {
+        key: value for key, value in params.items() if key not in ["ID", "PASSWORD"]
+    }
+    measurement_dict, unmatched_params = pws_to_measurement_dict(fields)
+    if len(measurement_dict) > 0:
+        logging.info(f"[{session_id}]: Recognized sensors:")
+        for sensor, measurement in measurement_dict.items():
+            logging.info(
+                f"[{session_id}]:   Sensor name = {sensor}; Value = {measurement.value}; Unit = {measurement.unit}"
+            )
+    if len(unmatched_params) > 0:
+        logging.info(f"[{session_id}]: Unrecognized parameters:")
+        for param, value in unmatched_params.items():
+            logging.info(f"[{session_id}]:   {param}={value}")
+    logging.info(f"[{session_id}]: *** End Station Update ***")
+
+
+def main():
+    logging.basicConfig(stream=io.StringIO())
+    processor = PWSRequestProcessor([WeatherStation("station", "password")])
+    eager_processor = EagerProcessor([WeatherStation("station", "password")])
+    number = 5000
+    for level in (logging.INFO, logging.WARNING):
+        logging.getLogger().setLevel(level)
+        print(f"{logging.getLevelName(level)}:")
+        for label, function in (
+            ("server, eager", lambda: eager_processor.process_request(PARAMS)),
+            ("server, lazy", lambda: processor.process_request(PARAMS)),
+            ("probe, eager", lambda: eager_probe(PARAMS)),
+            ("probe, lazy", lambda: process_params(PARAMS)),
+        ):
+            seconds = min(timeit.repeat(function, number=number, repeat=5)) / number
+            print(f"  {label:>14}: {seconds * 1e6:7.2f} µs/upload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Report the memory held per station for fleets of 1k and 10k stations.
+
+Each station receives one upload with all known sensors. The per-object size
+of the slotted Measurement is compared with an equivalent dict-backed class.
+
+Usage: PYTHONPATH=src python benchmarks/bench_memory.py
+"""
+
+from datetime import datetime
+import gc
+import sys
+import tracemalloc
+
+from pwsproto.station import SENSOR_MAPPING, Measurement, WeatherStation
+
+
+class DictMeasurement:
+    # Measurement as it was before __slots__
+    def __init__(self, value, unit=None):
+        self.value = value
+        self.unit = unit
+
+
+def _object_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def _upload(i: int) -> dict[str, Measurement]:
+    measurements = {
+        name: Measurement(float(i + j), None) for j, name in enumerate(SENSOR_MAPPING)
+    }
+    measurements["date"] = Measurement(datetime(2000, 1, 1, 10, 32, 35))
+    return measurements
+
+
+def main():
+    print(
+        f"Measurement: {_object_size(Measurement(1.0))} bytes, "
+        f"dict-backed: {_object_size(DictMeasurement(1.0))} bytes"
+    )
+    for count in (1000, 10000):
+        gc.collect()
+        tracemalloc.start()
+        stations = []
+        for i in range(count):
+            station = WeatherStation(f"station{i}", "password")
+            station.update_measurement(_upload(i))
+            stations.append(station)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{count:>6} stations, {len(SENSOR_MAPPING)} sensors: "
+            f"{current / count:8.0f} bytes/station"
+        )
+        del stations
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measure the overhead of the upload instrumentation.
+
+The instrumentation of one upload (timers and histogram observations of the
+request, authenticate, decode, update and payloads stages, and the station
+upload counter) is timed on its own and compared with a full upload.
+
+Usage: PYTHONPATH=src python benchmarks/bench_metrics.py
+"""
+
+import time
+import timeit
+
+from pwsproto import metrics
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import WeatherStation
+
+PARAMS = {
+    "ID": "station",
+    "PASSWORD": "password",
+    "dateutc": "2000-01-01 10:32:35",
+    "winddir": "230",
+    "windspeedmph": "12",
+    "windgustmph": "12",
+    "tempf": "70",
+    "rainin": "0",
+    "baromin": "29.1",
+    "dewptf": "68.2",
+    "humidity": "90",
+    "softwaretype": "vws%20versionxx",
+}
+
+
+def instrumentation():
+    # Same calls as an instrumented upload
+    start = time.perf_counter()
+    authenticated = time.perf_counter()
+    metrics.AUTHENTICATE_SECONDS.observe(authenticated - start)
+    metrics.STATION_UPLOADS.labels("station").inc()
+    decoded = time.perf_counter()
+    metrics.DECODE_SECONDS.observe(decoded - authenticated)
+    payloads = time.perf_counter()
+    metrics.PAYLOADS_SECONDS.observe(time.perf_counter() - payloads)
+    metrics.UPDATE_SECONDS.observe(time.perf_counter() - decoded)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+
+def main():
+    processor = PWSRequestProcessor([WeatherStation("station", "password")])
+    number = 20000
+    for label, function in (
+        ("instrumentation", instrumentation),
+        ("upload", lambda: processor.process_request(PARAMS)),
+    ):
+        seconds = min(timeit.repeat(function, number=number, repeat=5)) / number
+        print(f"{label:>16}: {seconds * 1e6:6.2f} µs/upload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure payload generation for stations with 10, 40 and 100 sensors.
+
+Compares WeatherStation.get_ha_payloads, which returns payloads cached on
+update, with rebuilding every payload on each call as was done before.
+
+Usage: PYTHONPATH=src python benchmarks/bench_payloads.py
+"""
+
+from datetime import datetime, timezone
+from typing import Any
+import timeit
+
+from pwsproto.station import SENSOR_MAPPING, Measurement, WeatherStation
+
+
+def rebuild_ha_payloads(station: WeatherStation) -> dict[str, dict[str, Any]]:
+    # get_ha_payloads as it was before payloads were cached
+    payloads = {}
+    for name, sensor in station.sensors.items():
+        if sensor.last_measurement is None:
+            continue
+        attributes = {}
+        if sensor.last_measurement.unit is not None:
+            attributes["unit_of_measurement"] = sensor.last_measurement.unit
+        elif sensor.entity_description.native_unit_of_measurement is not None:
+            attributes["unit_of_measurement"] = (
+                sensor.entity_description.native_unit_of_measurement
+            )
+        if sensor.entity_description.device_class is not None:
+            attributes["device_class"] = sensor.entity_description.device_class
+        attributes["friendly_name"] = name
+        if sensor.last_measurement_date is not None:
+            attributes["updated"] = str(
+                sensor.last_measurement_date.strftime("%Y-%m-%dT%H:%M:%S%z")
+            )
+        payloads[name] = {
+            "state": str(sensor.last_measurement.value),
+            "attributes": attributes,
+        }
+    return payloads
+
+
+def _sensor_names(count: int) -> list[str]:
+    # Extra numbered temperature sensors beyond the known ones
+    names = list(SENSOR_MAPPING)[:count]
+    names += [f"outdoor_temperature_{i}" for i in range(2, count - len(names) + 2)]
+    return names
+
+
+def main():
+    date = Measurement(datetime(2000, 1, 1, 10, 32, 35, tzinfo=timezone.utc))
+    number = 5000
+    for count in (10, 40, 100):
+        station = WeatherStation("bench", "password")
+        measurements = {name: Measurement(1.0) for name in _sensor_names(count)}
+        measurements["date"] = date
+        station.update_measurement(measurements)
+        # Upload touching a quarter of the sensors
+        partial = dict(list(measurements.items())[: count // 4])
+        partial["date"] = date
+
+        results = {
+            "rebuild": lambda: rebuild_ha_payloads(station),
+            "cached": station.get_ha_payloads,
+            "partial update + cached": lambda: (
+                station.update_measurement(partial),
+                station.get_ha_payloads(),
+            ),
+        }
+        print(
+            f"{count:>3} sensors: "
+            + ", ".join(
+                f"{label} "
+                f"{min(timeit.repeat(call, number=number, repeat=5)) / number * 1e6:7.2f} us"
+                for label, call in results.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measure the cost of uploads rejected by rate limiting.
+
+A single client floods one station, with the Bottle route and the WSGI ingest
+app called in-process: uploads accepted without limits, rejected for a wrong
+password, and rejected by the per-address and per-station token buckets. The
+memory taken by the buckets of a scan of random station IDs is also measured.
+
+Usage: PYTHONPATH=src python benchmarks/bench_ratelimit.py
+"""
+
+from wsgiref.util import setup_testing_defaults
+import timeit
+import tracemalloc
+
+from bottle import Bottle
+
+from pwsproto.ingest import PWS_ROUTE, IngestApp
+from pwsproto.ratelimit import TokenBuckets
+from pwsproto.server import RequestProcessor
+from pwsproto.station import WeatherStation
+
+QUERY = (
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A30%3A20&winddir=230"
+    "&windspeedmph=12&windgustmph=12&tempf=70&rainin=0&baromin=29.1&dewptf=68.2"
+    "&humidity=40&weather=Sonnig&clouds=&softwaretype=vws%20versionxx"
+    "&action=updateraw&realtime=1&rtfreq=2.5"
+)
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def environ(query: str) -> dict:
+    environ = {
+        "PATH_INFO": PWS_ROUTE,
+        "QUERY_STRING": query,
+        "REMOTE_ADDR": "192.0.2.1",
+    }
+    setup_testing_defaults(environ)
+    return environ
+
+
+def measure(app, query: str) -> float:
+    request = environ(query)
+
+    def call():
+        # Bottle caches the parsed request in the environ: use a fresh one
+        for _ in app(dict(request), start_response):
+            pass
+
+    number = 20000
+    call()
+    return min(timeit.repeat(call, number=number, repeat=5)) / number
+
+
+def main():
+    for label, limit in (
+        ("accepted", None),
+        ("wrong password", None),
+        ("address limited", "address"),
+        ("station limited", "station"),
+    ):
+        results = []
+        for app_type in ("bottle route", "ingest app"):
+            processor = RequestProcessor([WeatherStation("STATION", "KEY")])
+            # Exhausted after the first upload
+            buckets = TokenBuckets(rate=1e-9, burst=1)
+            if limit == "address":
+                processor.address_limiter = buckets
+            elif limit == "station":
+                processor.station_limiter = buckets
+            if app_type == "bottle route":
+                app = Bottle()
+                app.route(PWS_ROUTE, method="GET", callback=processor)
+            else:
+                app = IngestApp(processor)
+            query = (
+                QUERY.replace("KEY", "WRONG") if label == "wrong password" else QUERY
+            )
+            results.append(f"{app_type} {measure(app, query) * 1e6:6.2f} µs")
+        print(f"{label:>16}: {', '.join(results)}")
+
+    buckets = TokenBuckets(rate=1.0)
+    tracemalloc.start()
+    for i in range(1000000):
+        buckets.take(f"SCAN{i}")
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"scan of 1000000 IDs: {len(buckets.buckets)} buckets, "
+        f"{current / 2**20:.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
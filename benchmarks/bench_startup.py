@@ -0,0 +1,68 @@
+"""Measure the startup time and memory of the probe and server entry points.
+
+Each entry point is started with --help, which exits once its modules are
+imported and its arguments parsed. The former startup, which imported the
+Home Assistant constants and sensor descriptions, is reproduced by importing
+these modules first. The wall time (median of the runs) and the maximum
+resident set size of each process are reported.
+
+Usage: PYTHONPATH=src python benchmarks/bench_startup.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HOME_ASSISTANT_IMPORTS = (
+    "import homeassistant.const, homeassistant.components.sensor.const, "
+    "homeassistant.components.sensor"
+)
+
+
+def command(module: str, home_assistant: bool) -> list[str]:
+    code = (
+        f"import runpy, sys; sys.argv = ['{module}', '--help']; "
+        f"runpy.run_module('{module}', run_name='__main__')"
+    )
+    if home_assistant:
+        code = f"{HOME_ASSISTANT_IMPORTS}; {code}"
+    return [sys.executable, "-c", code]
+
+
+def measure(args: list[str]) -> tuple[float, float]:
+    """Wall time in seconds and maximum RSS in MiB of a process."""
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{args} exited with {process.returncode}")
+    # ru_maxrss is in KiB on Linux
+    return elapsed, rusage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, required=False, default=10)
+    args = parser.parse_args()
+
+    cases = [("python", [sys.executable, "-c", "pass"])]
+    for module in ("pwsproto.probe", "pwsproto.server"):
+        cases.append((f"{module}, with HA", command(module, True)))
+        cases.append((module, command(module, False)))
+
+    for label, case in cases:
+        # One warm-up run fills the bytecode cache
+        measure(case)
+        results = [measure(case) for _ in range(args.runs)]
+        seconds = statistics.median(elapsed for elapsed, _ in results)
+        rss = max(rss for _, rss in results)
+        print(f"{label:>30}: {seconds * 1e3:7.1f} ms, {rss:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measure per-request authentication cost against the fleet size.
+
+Usage: PYTHONPATH=src python benchmarks/bench_stations.py
+"""
+
+import timeit
+
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import WeatherStation
+
+
+def linear_scan_authenticate(
+    stations: list[WeatherStation], id: str, password: str
+) -> list[WeatherStation]:
+    # Lookup as it was before the station index.
+    return list(
+        filter(
+            lambda station: station.id == id and station.password == password,
+            stations,
+        )
+    )
+
+
+def main():
+    request = {
+        "dateutc": "2000-01-01 10:32:35",
+        "tempf": "70",
+        "humidity": "90",
+        "baromin": "29.1",
+    }
+    for count in (1, 10, 100, 1000, 10000):
+        stations = [WeatherStation(f"station{i}", f"password{i}") for i in range(count)]
+        processor = PWSRequestProcessor(stations)
+        # Worst case for the former lookup: the last station of the fleet.
+        id, password = f"station{count - 1}", f"password{count - 1}"
+        params = {"ID": id, "PASSWORD": password, **request}
+
+        number = 2000
+        results = {
+            "linear scan auth": timeit.repeat(
+                lambda: linear_scan_authenticate(stations, id, password),
+                number=number,
+                repeat=5,
+            ),
+            "indexed auth": timeit.repeat(
+                lambda: processor.authenticate(id, password),
+                number=number,
+                repeat=5,
+            ),
+            "process_request": timeit.repeat(
+                lambda: processor.process_request(params),
+                number=number,
+                repeat=5,
+            ),
+        }
+        print(
+            f"{count:>6} stations: "
+            + ", ".join(
+                f"{label} {min(elapsed) / number * 1e6:8.2f} us"
+                for label, elapsed in results.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
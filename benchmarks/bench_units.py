@@ -0,0 +1,90 @@
+"""Compare precomputed linear unit conversion with Home Assistant converters.
+
+Converts a full imperial station update to metric, either with a
+UnitNormalizer or by calling Home Assistant's unit converters per value.
+
+Usage: PYTHONPATH=src python benchmarks/bench_units.py
+"""
+
+import timeit
+
+from homeassistant.util.unit_conversion import (
+    DistanceConverter,
+    PressureConverter,
+    SpeedConverter,
+    TemperatureConverter,
+)
+
+from pwsproto.pws_request import pws_to_measurement_dict
+from pwsproto.station import Measurement
+from pwsproto.units import UNIT_SYSTEMS, UnitNormalizer
+
+CONVERTERS = {
+    unit: converter
+    for converter in (
+        DistanceConverter,
+        PressureConverter,
+        SpeedConverter,
+        TemperatureConverter,
+    )
+    for unit in converter.VALID_UNITS
+}
+
+UPLOAD = {
+    "dateutc": "2000-01-01 10:32:35",
+    "winddir": "230",
+    "windspeedmph": "12",
+    "windgustmph": "12",
+    "windspdmph_avg2m": "10.2",
+    "windgustmph_10m": "15.1",
+    "tempf": "70",
+    "temp2f": "69.8",
+    "temp3f": "71.0",
+    "dewptf": "68.2",
+    "indoortempf": "68.4",
+    "soiltempf": "55.1",
+    "rainin": "0",
+    "dailyrainin": "0.12",
+    "baromin": "29.1",
+    "humidity": "90",
+}
+
+
+def ha_convert(measurements: dict[str, Measurement]) -> dict[str, Measurement]:
+    metric_units = UNIT_SYSTEMS["metric"]
+    converted = {}
+    for sensor_name, measurement in measurements.items():
+        unit = measurement.unit
+        if unit in metric_units and isinstance(measurement.value, float):
+            measurement = Measurement(
+                round(
+                    CONVERTERS[unit].convert(
+                        measurement.value, unit, metric_units[unit]
+                    ),
+                    3,
+                ),
+                metric_units[unit],
+            )
+        converted[sensor_name] = measurement
+    return converted
+
+
+def main():
+    measurements, _ = pws_to_measurement_dict(UPLOAD)
+    normalizer = UnitNormalizer("metric")
+    number = 20000
+    for label, convert in (
+        ("HA converters", ha_convert),
+        ("UnitNormalizer", normalizer.normalize),
+    ):
+        elapsed = min(
+            timeit.repeat(lambda: convert(measurements), number=number, repeat=5)
+        )
+        print(
+            f"{label:>15}: {elapsed / number * 1e6:6.2f} us/update "
+            f"({len(measurements)} measurements)"
+        )
+
+
+if __name__ == "__main__":
+    main()
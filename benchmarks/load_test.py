@@ -0,0 +1,127 @@
+"""Replay station uploads against each server backend at increasing concurrency.
+
+Starts a stub Home Assistant and, for each backend, a pwsproto.server process,
+then replays the recorded uploads (one query string per line of the given
+file, or a built-in sample) and reports p50/p99 latencies.
+
+Usage: PYTHONPATH=src python benchmarks/load_test.py [--uploads FILE]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from pwsproto.backends import SERVER_BACKENDS
+from pwsproto.ha_stub import HAStubServer
+
+SAMPLE_UPLOAD = (
+    "ID=TEST&PASSWORD=KEY&dateutc=2000-01-01+10%3A32%3A35&winddir=230"
+    "&windspeedmph=12&windgustmph=12&tempf=70&rainin=0&baromin=29.1&dewptf=68.2"
+    "&humidity=90&weather=&clouds=&softwaretype=vws%20versionxx&action=updateraw"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_listening(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Server did not listen on port {port}")
+
+
+def _upload(url: str) -> tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def _percentile(latencies: list[float], percentile: int) -> float:
+    return statistics.quantiles(latencies, n=100)[percentile - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=str, required=False)
+    parser.add_argument("--requests", type=int, required=False, default=500)
+    parser.add_argument("--workers", type=int, required=False, default=4)
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", required=False, default=[1, 4, 16, 64]
+    )
+    args = parser.parse_args()
+
+    uploads = [SAMPLE_UPLOAD]
+    if args.uploads is not None:
+        with open(args.uploads) as uploads_file:
+            uploads = [line.strip() for line in uploads_file if line.strip()]
+
+    ha_stub = HAStubServer().start()
+    for backend in SERVER_BACKENDS:
+        port = _free_port()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "pwsproto.server",
+                "--ha-host=127.0.0.1",
+                f"--ha-port={ha_stub.port}",
+                f"--pws-port={port}",
+                f"--server-backend={backend}",
+                f"--workers={args.workers}",
+                "--pws-station-id=TEST",
+                "--pws-station-password=KEY",
+            ],
+            env={**os.environ, "LLT": "token"},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_listening(port)
+            base_url = (
+                f"http://127.0.0.1:{port}/weatherstation/updateweatherstation.php"
+            )
+            urls = [
+                f"{base_url}?{uploads[i % len(uploads)]}" for i in range(args.requests)
+            ]
+            for concurrency in args.concurrency:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    start = time.perf_counter()
+                    results = list(executor.map(_upload, urls))
+                    elapsed = time.perf_counter() - start
+                latencies = [latency for latency, _ in results]
+                errors = sum(1 for _, ok in results if not ok)
+                print(
+                    f"{backend:>8} c={concurrency:<3}: "
+                    f"{len(results) / elapsed:8.1f} req/s, "
+                    f"p50 {_percentile(latencies, 50) * 1e3:7.2f} ms, "
+                    f"p99 {_percentile(latencies, 99) * 1e3:7.2f} ms, "
+                    f"{errors} errors"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+    ha_stub.stop()
+
+
+if __name__ == "__main__":
+    main()
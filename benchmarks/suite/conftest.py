@@ -0,0 +1,111 @@
+"""Workloads of the benchmark suite.
+
+Uploads are generated for a fleet of stations with a given number of sensors,
+uploading every interval seconds. Values follow random walks whose steps grow
+with the interval, and are reported with the station's precision: the faster
+stations upload, the fewer values change from one upload to the next.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+import itertools
+import math
+import random
+
+from pwsproto.ha_stub import HAStubServer
+
+import pytest
+
+# Numeric upload parameters: (parameter, initial value, standard deviation of
+# the change in 16 seconds, decimals)
+BASE_SENSOR_PARAMS = [
+    ("windspeedmph", 5.0, 0.8, 1),
+    ("windgustmph", 8.0, 1.2, 1),
+    ("winddir", 180.0, 10.0, 0),
+    ("tempf", 60.0, 0.05, 1),
+    ("humidity", 60.0, 0.3, 0),
+    ("dewptf", 50.0, 0.05, 1),
+    ("baromin", 29.9, 0.002, 2),
+    ("dailyrainin", 0.0, 0.0, 2),
+    ("rainin", 0.0, 0.0, 2),
+    ("solarradiation", 300.0, 5.0, 0),
+    ("UV", 3.0, 0.05, 0),
+    ("indoortempf", 68.0, 0.02, 1),
+    ("indoorhumidity", 45.0, 0.1, 0),
+    ("soiltempf", 55.0, 0.01, 1),
+    ("soilmoisture", 30.0, 0.05, 0),
+    ("leafwetness", 5.0, 0.05, 0),
+    ("AqPM10", 20.0, 0.5, 0),
+    ("AqCO", 200.0, 2.0, 0),
+    ("AqSO2", 5.0, 0.1, 0),
+    ("AqNO2", 10.0, 0.2, 0),
+    ("AqOZONE", 30.0, 0.3, 0),
+]
+# Extra sensors of the numbered families
+SENSOR_PARAMS = BASE_SENSOR_PARAMS + [
+    (f"{prefix}{n}{suffix}", initial, step, decimals)
+    for n in range(2, 10)
+    for prefix, suffix, initial, step, decimals in (
+        ("temp", "f", 60.0, 0.05, 1),
+        ("soiltemp", "f", 55.0, 0.01, 1),
+        ("soilmoisture", "", 30.0, 0.05, 0),
+    )
+]
+
+SENSOR_COUNTS = (5, 20, 40)
+STATION_COUNTS = (1, 100, 1000)
+# Seconds between uploads: rapid-fire, default and slow stations
+UPLOAD_INTERVALS = (2.5, 16.0, 60.0)
+
+
+class Workload:
+    def __init__(
+        self, stations: int, sensors: int, interval: float = 16.0, seed: int = 0
+    ):
+        if sensors > len(SENSOR_PARAMS):
+            raise ValueError(f"At most {len(SENSOR_PARAMS)} sensors")
+        self.stations = stations
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.params = SENSOR_PARAMS[:sensors]
+        self.scale = math.sqrt(interval / 16.0)
+        self.values = [
+            [initial for _, initial, _, _ in self.params] for _ in range(stations)
+        ]
+        self.date = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+    def station_ids(self) -> list[str]:
+        return [f"BENCH{station}" for station in range(self.stations)]
+
+    def upload(self, station: int) -> dict[str, str]:
+        values = self.values[station]
+        upload = {
+            "ID": f"BENCH{station}",
+            "PASSWORD": "KEY",
+            "dateutc": self.date.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        for index, (param, _, step, decimals) in enumerate(self.params):
+            values[index] = max(
+                0.0, values[index] + self.rng.gauss(0, step * self.scale)
+            )
+            upload[param] = f"{values[index]:.{decimals}f}"
+        return upload
+
+    def uploads(self, rounds: int) -> list[dict[str, str]]:
+        """rounds uploads of every station, round-robin."""
+        uploads = []
+        for _ in range(rounds):
+            uploads.extend(self.upload(station) for station in range(self.stations))
+            self.date += timedelta(seconds=self.interval)
+        return uploads
+
+
+def cycle(uploads: list[dict[str, str]]) -> Iterator[dict[str, str]]:
+    return itertools.cycle(uploads)
+
+
+@pytest.fixture
+def ha_stub():
+    server = HAStubServer().start()
+    yield server
+    server.stop()
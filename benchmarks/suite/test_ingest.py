@@ -0,0 +1,57 @@
+from pwsproto.pws_request import PWSRequestProcessor, pws_to_measurement_dict
+from pwsproto.station import WeatherStation
+
+import pytest
+
+from conftest import SENSOR_COUNTS, STATION_COUNTS, Workload, cycle
+
+
+def _fields(upload: dict[str, str]) -> dict[str, str]:
+    return {
+        key: value for key, value in upload.items() if key not in ("ID", "PASSWORD")
+    }
+
+
+@pytest.mark.benchmark(group="decode")
+@pytest.mark.parametrize("sensors", SENSOR_COUNTS)
+def test_decode(benchmark, sensors: int):
+    uploads = cycle([_fields(upload) for upload in Workload(1, sensors).uploads(100)])
+    benchmark(lambda: pws_to_measurement_dict(next(uploads)))
+
+
+@pytest.mark.benchmark(group="process_request")
+@pytest.mark.parametrize("stations", STATION_COUNTS)
+@pytest.mark.parametrize("sensors", SENSOR_COUNTS)
+def test_process_request(benchmark, stations: int, sensors: int):
+    workload = Workload(stations, sensors)
+    processor = PWSRequestProcessor(
+        [WeatherStation(id, "KEY") for id in workload.station_ids()]
+    )
+    # Sensors are created by the first upload of each station
+    for upload in workload.uploads(1):
+        processor.process_request(upload)
+    uploads = cycle(workload.uploads(max(2, 2000 // stations)))
+    benchmark(lambda: processor.process_request(next(uploads)))
+
+
+@pytest.mark.benchmark(group="update_measurement")
+@pytest.mark.parametrize("sensors", SENSOR_COUNTS)
+def test_update_measurement(benchmark, sensors: int):
+    station = WeatherStation("BENCH0", "KEY")
+    measurements = cycle(
+        [
+            pws_to_measurement_dict(_fields(upload))[0]
+            for upload in Workload(1, sensors).uploads(100)
+        ]
+    )
+    benchmark(lambda: station.update_measurement(next(measurements)))
+
+
+@pytest.mark.benchmark(group="get_ha_payloads")
+@pytest.mark.parametrize("sensors", SENSOR_COUNTS)
+def test_get_ha_payloads(benchmark, sensors: int):
+    station = WeatherStation("BENCH0", "KEY")
+    upload = Workload(1, sensors).upload(0)
+    station.update_measurement(pws_to_measurement_dict(_fields(upload))[0])
+    payloads = benchmark(station.get_ha_payloads)
+    assert len(payloads) == sensors
@@ -0,0 +1,64 @@
+from pwsproto.ha_http_client import UpdateHAAPI
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.pws_request import PWSRequestProcessor, pws_to_measurement_dict
+from pwsproto.station import WeatherStation
+
+import pytest
+
+from conftest import UPLOAD_INTERVALS, Workload, cycle
+
+BATCH_PATH = "/api/pwsproto/states"
+
+
+def _payload_snapshots(workload: Workload, rounds: int) -> list[dict]:
+    # Payloads of the successive uploads of a station
+    station = WeatherStation("BENCH0", "KEY")
+    snapshots = []
+    for upload in workload.uploads(rounds):
+        fields = {
+            key: value for key, value in upload.items() if key not in ("ID", "PASSWORD")
+        }
+        station.update_measurement(pws_to_measurement_dict(fields)[0])
+        snapshots.append(station.get_ha_payloads())
+    return snapshots
+
+
+@pytest.mark.benchmark(group="publish")
+@pytest.mark.parametrize("batch", (False, True), ids=("states", "batch"))
+@pytest.mark.parametrize("interval", UPLOAD_INTERVALS)
+def test_publish(benchmark, interval: float, batch: bool):
+    ha_stub = HAStubServer(batch_path=BATCH_PATH if batch else None).start()
+    update_ha_api = UpdateHAAPI(
+        "token",
+        "127.0.0.1",
+        ha_port=ha_stub.port,
+        wait=True,
+        batch_path=BATCH_PATH if batch else None,
+    )
+    payloads = cycle(_payload_snapshots(Workload(1, 20, interval), 200))
+    try:
+        benchmark(lambda: update_ha_api.publish("BENCH0", next(payloads)))
+    finally:
+        update_ha_api.close()
+        ha_stub.stop()
+
+
+@pytest.mark.benchmark(group="ingest_to_publish")
+@pytest.mark.parametrize("interval", UPLOAD_INTERVALS)
+@pytest.mark.parametrize("stations", (1, 100))
+def test_ingest_to_publish(benchmark, ha_stub, stations: int, interval: float):
+    update_ha_api = UpdateHAAPI("token", "127.0.0.1", ha_port=ha_stub.port, wait=True)
+    workload = Workload(stations, 20, interval)
+    processor = PWSRequestProcessor(
+        [
+            WeatherStation(id, "KEY", update_callback=update_ha_api)
+            for id in workload.station_ids()
+        ]
+    )
+    uploads = cycle(workload.uploads(max(2, 400 // stations)))
+    try:
+        for upload in workload.uploads(1):
+            processor.process_request(upload)
+        benchmark(lambda: processor.process_request(next(uploads)))
+    finally:
+        update_ha_api.close()
@@ -0,0 +1,151 @@
+"""Personal Weather Station (PWS) protocol integration.
+
+Stations upload their measurements to the HTTP server of Home Assistant, and
+the measurements are written to the state of sensor entities in place, without
+going through the REST API. The integration also receives the batched states
+of the standalone update module (--ha-batch-path).
+"""
+
+from http import HTTPStatus
+
+from aiohttp import web
+import voluptuous as vol
+
+from homeassistant.components.http import (
+    KEY_HASS,
+    HomeAssistantView,
+    require_admin,
+)
+from homeassistant.const import (
+    CONF_ID,
+    CONF_PASSWORD,
+    CONF_SENSORS,
+    CONF_UNIT_SYSTEM,
+    Platform,
+)
+from homeassistant.core import HomeAssistant, valid_entity_id
+from homeassistant.exceptions import InvalidStateError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.discovery import async_load_platform
+from homeassistant.helpers.typing import ConfigType
+
+from pwsproto.derived import DerivedQuantities
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import WeatherStation
+from pwsproto.units import UNIT_SYSTEMS, UnitNormalizer
+
+from .const import BATCH_ROUTE, CONF_DERIVE, CONF_STATIONS, DOMAIN, PWS_ROUTE
+
+STATION_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_ID): cv.string,
+        vol.Required(CONF_PASSWORD): cv.string,
+        vol.Optional(CONF_SENSORS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_UNIT_SYSTEM, default="native"): vol.In(list(UNIT_SYSTEMS)),
+        vol.Optional(CONF_DERIVE, default=False): cv.boolean,
+    }
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {
+        DOMAIN: vol.Schema(
+            {
+                vol.Optional(CONF_STATIONS, default=[]): vol.All(
+                    cv.ensure_list, [STATION_SCHEMA]
+                )
+            }
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+
+class PWSView(HomeAssistantView):
+    """Upload endpoint of the stations, authenticated by station password."""
+
+    url = PWS_ROUTE
+    name = "api:pwsproto"
+    requires_auth = False
+
+    def __init__(self, processor: PWSRequestProcessor):
+        self.processor = processor
+
+    async def get(self, request: web.Request) -> web.Response:
+        # Decoding and updating the station are short and run in the event
+        # loop, where entity states are written.
+        try:
+            self.processor.process_request(dict(request.query))
+        except PermissionError as err:
+            return web.Response(status=HTTPStatus.FORBIDDEN, text=str(err))
+        except ValueError as err:
+            # Missing station ID/password, or invalid date
+            return web.Response(status=HTTPStatus.BAD_REQUEST, text=str(err))
+        return web.Response()
+
+
+class PWSStatesView(HomeAssistantView):
+    """Batch endpoint of the update module, setting the states of entities.
+
+    The body maps entity IDs to the payloads the update module would otherwise
+    post one by one to /api/states/<entity_id>. The response gives the number
+    of states applied, which the update module checks: entities with an
+    invalid ID or state are skipped.
+    """
+
+    url = BATCH_ROUTE
+    name = "api:pwsproto:states"
+
+    @require_admin
+    async def post(self, request: web.Request) -> web.Response:
+        hass: HomeAssistant = request.app[KEY_HASS]
+        try:
+            data = await request.json()
+            states = data["states"]
+            items = list(states.items())
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self.json_message("Invalid batch", HTTPStatus.BAD_REQUEST)
+
+        applied = 0
+        context = self.context(request)
+        for entity_id, payload in items:
+            if not valid_entity_id(entity_id) or not isinstance(payload, dict):
+                continue
+            if (state := payload.get("state")) is None:
+                continue
+            try:
+                hass.states.async_set(
+                    entity_id, str(state), payload.get("attributes"), context=context
+                )
+            except InvalidStateError:
+                continue
+            applied += 1
+        return self.json({"applied": applied})
+
+
+def create_station(config: ConfigType) -> WeatherStation:
+    unit_normalizer = None
+    if config[CONF_UNIT_SYSTEM] != "native":
+        unit_normalizer = UnitNormalizer(config[CONF_UNIT_SYSTEM])
+    sensor_allowlist = None
+    if CONF_SENSORS in config:
+        sensor_allowlist = frozenset(config[CONF_SENSORS])
+    return WeatherStation(
+        config[CONF_ID],
+        config[CONF_PASSWORD],
+        unit_normalizer=unit_normalizer,
+        derived=DerivedQuantities() if config[CONF_DERIVE] else None,
+        sensor_allowlist=sensor_allowlist,
+    )
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    stations = [create_station(station) for station in config[DOMAIN][CONF_STATIONS]]
+    processor = PWSRequestProcessor(stations)
+    hass.data[DOMAIN] = processor
+    hass.http.register_view(PWSView(processor))
+    hass.http.register_view(PWSStatesView())
+    # The sensor platform sets the update callback of the stations
+    hass.async_create_task(
+        async_load_platform(hass, Platform.SENSOR, DOMAIN, {}, config)
+    )
+    return True
@@ -0,0 +1,8 @@
+DOMAIN = "pwsproto"
+
+PWS_ROUTE = "/weatherstation/updateweatherstation.php"
+# Receives the batched states of the update module (--ha-batch-path)
+BATCH_ROUTE = "/api/pwsproto/states"
+
+CONF_DERIVE = "derive"
+CONF_STATIONS = "stations"
@@ -0,0 +1,110 @@
+"""Sensor entities of the stations, created on their first measurement."""
+
+import functools
+import logging
+from typing import Any
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+)
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import (
+    Measurement,
+    SensorDescription,
+    WeatherStation,
+    WeatherStationSensor,
+)
+
+from .const import DOMAIN
+
+
+@functools.cache
+def entity_description(description: SensorDescription) -> SensorEntityDescription:
+    return SensorEntityDescription(
+        key=description.key,
+        device_class=(
+            SensorDeviceClass(description.device_class)
+            if description.device_class is not None
+            else None
+        ),
+        native_unit_of_measurement=description.native_unit_of_measurement,
+    )
+
+
+class PWSSensor(SensorEntity):
+    """Entity reading the last measurement of a station sensor."""
+
+    _attr_should_poll = False
+
+    def __init__(self, station_id: str, sensor: WeatherStationSensor):
+        self.sensor = sensor
+        self.entity_description = entity_description(sensor.entity_description)
+        self._attr_unique_id = f"{station_id}_{sensor.name}"
+        # Entity IDs are those the REST API publishes to:
+        # sensor.<station>_<sensor>
+        self._attr_name = f"{station_id} {sensor.name.replace('_', ' ')}"
+        # Last measurement written to the state machine
+        self.written_measurement: Measurement | None = None
+
+    @property
+    def native_value(self) -> Any:
+        measurement = self.sensor.last_measurement
+        return measurement.value if measurement is not None else None
+
+    @property
+    def native_unit_of_measurement(self) -> str | None:
+        measurement = self.sensor.last_measurement
+        if measurement is not None and measurement.unit is not None:
+            return measurement.unit
+        return self.entity_description.native_unit_of_measurement
+
+
+class SensorUpdater:
+    """Update callback of the stations, writing the state of their entities."""
+
+    def __init__(self, async_add_entities: AddEntitiesCallback):
+        self.async_add_entities = async_add_entities
+        self.entities: dict[tuple[str, str], PWSSensor] = {}
+
+    def __call__(self, station: WeatherStation):
+        new_entities = []
+        for name, sensor in station.sensors.items():
+            entity = self.entities.get((station.id, name))
+            if entity is None:
+                entity = PWSSensor(station.id, sensor)
+                self.entities[(station.id, name)] = entity
+                new_entities.append(entity)
+            elif (
+                entity.hass is not None
+                and entity.written_measurement is not sensor.last_measurement
+            ):
+                try:
+                    entity.async_write_ha_state()
+                except ValueError as err:
+                    logging.warning(f"Could not update {entity.entity_id}: {err}")
+            # Entities being added write their state once added
+            entity.written_measurement = sensor.last_measurement
+        if len(new_entities) > 0:
+            self.async_add_entities(new_entities)
+
+
+async def async_setup_platform(
+    hass: HomeAssistant,
+    config: ConfigType,
+    async_add_entities: AddEntitiesCallback,
+    discovery_info: DiscoveryInfoType | None = None,
+) -> None:
+    if discovery_info is None:
+        return
+    processor: PWSRequestProcessor = hass.data[DOMAIN]
+    updater = SensorUpdater(async_add_entities)
+    for station in processor.stations:
+        station.update_callback = updater
+        # Measurements received while the platform was loading
+        updater(station)
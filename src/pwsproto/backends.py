@@ -0,0 +1,315 @@
+from bottle import HTTPError, WSGIRefServer, run
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable
+from wsgiref.simple_server import WSGIServer
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+
+from pwsproto import metrics
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.ratelimit import RateLimited
+
+
+SERVER_BACKENDS = ("wsgiref", "threaded", "prefork", "asyncio")
+
+# Request threads of each pre-forked process
+PREFORK_THREADS = 8
+
+
+def pooled_wsgi_server(workers: int, reuse_port: bool = False) -> type[WSGIServer]:
+    """WSGI server class handling requests in a bounded thread pool."""
+
+    class PooledWSGIServer(WSGIServer):
+        allow_reuse_port = reuse_port
+        request_queue_size = 128
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+
+        def process_request(self, request: Any, client_address: Any):
+            self.executor.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request: Any, client_address: Any):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown(wait=True)
+
+    return PooledWSGIServer
+
+
+class PreforkWorkers:
+    """Pre-forked processes accepting the connections of a port (SO_REUSEPORT).
+
+    The processes are meant to be started before the application and its
+    threads are created: they only parse the HTTP requests, and forward them
+    through pipes to this process, where the application handles them. Station
+    state, configuration reloads, rate limits, metrics and logs thus all live in
+    this process.
+    """
+
+    def __init__(
+        self, host: str, port: int, workers: int, threads: int = PREFORK_THREADS
+    ):
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.context = multiprocessing.get_context("fork")
+        # One pipe per request thread of each process: (this end, worker end)
+        self.pipes = [
+            [self.context.Pipe() for _ in range(threads)] for _ in range(workers)
+        ]
+        self.processes = [
+            self.context.Process(
+                target=self.run_worker,
+                args=([end for _, end in pipes],),
+                daemon=True,
+            )
+            for pipes in self.pipes
+        ]
+
+    def start(self) -> "PreforkWorkers":
+        if any(
+            isinstance(handler, QueueHandler)
+            for handler in logging.getLogger().handlers
+        ):
+            # The processes would inherit the queue, but not the thread writing it
+            raise RuntimeError(
+                "Server processes must be forked before starting queue logging"
+            )
+        if threading.active_count() > 1:
+            logging.warning("Forking server processes while threads are running")
+        for process in self.processes:
+            process.start()
+        return self
+
+    def run_worker(self, connections: list[Connection]):
+        parent = multiprocessing.parent_process()
+
+        def exit_with_parent():
+            # Stop accepting connections that could no longer be handled
+            if parent is not None:
+                wait([parent.sentinel])
+                os._exit(0)
+
+        threading.Thread(target=exit_with_parent, daemon=True).start()
+        free: queue.SimpleQueue[Connection] = queue.SimpleQueue()
+        for connection in connections:
+            free.put(connection)
+
+        def forward(environ: dict[str, Any], start_response: Callable[..., Any]):
+            request = {
+                key: value
+                for key, value in environ.items()
+                if key in FORWARDED_ENVIRON or key.startswith("HTTP_")
+            }
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            body = environ["wsgi.input"].read(length) if length > 0 else b""
+            connection = free.get()
+            try:
+                connection.send((request, body))
+                status, headers, response_body = connection.recv()
+            except (EOFError, OSError):
+                status, headers, response_body = (
+                    "503 Service Unavailable",
+                    [("Content-Type", "text/plain")],
+                    b"Service unavailable",
+                )
+            finally:
+                free.put(connection)
+            start_response(status, headers)
+            return [response_body]
+
+        server = WSGIRefServer(
+            self.host,
+            self.port,
+            server_class=pooled_wsgi_server(self.threads, reuse_port=True),
+        )
+        try:
+            # run() accepts adapter instances, though its parameter is typed str
+            run(forward, server=server, quiet=True)  # pyright: ignore[reportArgumentType]
+        except KeyboardInterrupt:
+            pass
+
+    def serve(self, app: Callable[..., Any]):
+        """Handle the forwarded requests with the app until the processes exit."""
+
+        def handle_requests(connection: Connection):
+            while True:
+                try:
+                    request, body = connection.recv()
+                except (EOFError, OSError):
+                    return
+                connection.send(call_wsgi_app(app, request, body))
+
+        for pipes in self.pipes:
+            for connection, _ in pipes:
+                threading.Thread(
+                    target=handle_requests, args=(connection,), daemon=True
+                ).start()
+        logging.info(
+            f"Listening on http://{self.host}:{self.port}/ "
+            f"with {len(self.processes)} processes"
+        )
+        try:
+            for process in self.processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        for process in self.processes:
+            if process.pid is not None:
+                process.terminate()
+                process.join()
+
+
+# Request variables forwarded by the pre-forked processes, with the headers
+FORWARDED_ENVIRON = frozenset(
+    (
+        "REQUEST_METHOD",
+        "SCRIPT_NAME",
+        "PATH_INFO",
+        "QUERY_STRING",
+        "CONTENT_TYPE",
+        "CONTENT_LENGTH",
+        "SERVER_NAME",
+        "SERVER_PORT",
+        "SERVER_PROTOCOL",
+        "REMOTE_ADDR",
+    )
+)
+
+
+def call_wsgi_app(
+    app: Callable[..., Any], request: dict[str, str], body: bytes
+) -> tuple[str, list[tuple[str, str]], bytes]:
+    """Call a WSGI app with the given request variables and body.
+
+    Returns the status, headers and body of the response.
+    """
+    environ: dict[str, Any] = {
+        **request,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    response: dict[str, Any] = {}
+    chunks: list[bytes] = []
+
+    def start_response(
+        status: str, headers: list[tuple[str, str]], exc_info: Any = None
+    ):
+        response["status"] = status
+        response["headers"] = headers
+        return chunks.append
+
+    try:
+        result = app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    except Exception:
+        logging.exception("Could not handle a forwarded request")
+        return "500 Internal Server Error", [], b""
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+def run_asyncio(
+    handler: Callable[[dict[str, str]], None],
+    route: str,
+    host: str,
+    port: int,
+    processor: PWSRequestProcessor | None = None,
+    workers: int = 4,
+):
+    """Serve the route and the metrics from an aiohttp event loop.
+
+    The handler may block (e.g. waiting for Home Assistant), so it is called by
+    a pool of threads rather than on the event loop.
+    """
+    from aiohttp import web
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+
+    async def handle(request: web.Request) -> web.Response:
+        try:
+            if processor is not None:
+                processor.admit_address(
+                    request.remote, request.headers.get("X-Forwarded-For")
+                )
+            await asyncio.get_running_loop().run_in_executor(
+                executor, handler, dict(request.query)
+            )
+        except RateLimited as err:
+            return web.Response(
+                status=429,
+                text=str(err),
+                headers={"Retry-After": err.retry_after_header},
+            )
+        except HTTPError as err:
+            return web.Response(status=err.status_code, text=str(err.body))
+        return web.Response()
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            text=metrics.REGISTRY.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get(route, handle)
+    app.router.add_get("/metrics", handle_metrics)
+    try:
+        web.run_app(app, host=host, port=port)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def run_server(
+    app: Callable[..., Any],
+    handler: Callable[[dict[str, str]], None],
+    route: str,
+    backend: str,
+    host: str,
+    port: int,
+    workers: int,
+    processor: PWSRequestProcessor | None = None,
+    prefork_workers: PreforkWorkers | None = None,
+):
+    """Serve the app with the given backend until interrupted.
+
+    With the prefork backend, the processes are best started beforehand with
+    prefork_workers, before any thread is created.
+    """
+    if backend == "wsgiref":
+        run(app, host=host, port=port)
+    elif backend == "threaded":
+        server = WSGIRefServer(host, port, server_class=pooled_wsgi_server(workers))
+        run(app, server=server)  # pyright: ignore[reportArgumentType]
+    elif backend == "prefork":
+        if prefork_workers is None:
+            prefork_workers = PreforkWorkers(host, port, workers).start()
+        prefork_workers.serve(app)
+    elif backend == "asyncio":
+        run_asyncio(handler, route, host, port, processor, workers)
+    else:
+        raise ValueError(f"Unknown server backend: {backend}")
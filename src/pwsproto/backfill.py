@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+
+from array import array
+from itertools import repeat
+from typing import Any, Iterable, Iterator, Protocol
+from urllib.parse import unquote_plus
+import argparse
+import csv
+import gzip
+import logging
+import sys
+import time
+
+from pwsproto.config import (
+    ConfigError,
+    StationConfig,
+    TargetConfig,
+    load_config,
+    parse_sensor_units,
+)
+from pwsproto.history import HistoryLocked, HistoryStore
+from pwsproto.pws_request import (
+    ParameterConversion,
+    parse_dateutc,
+    pws_decoder,
+    str_to_float,
+    str_to_int,
+)
+from pwsproto.units import UNIT_SYSTEMS, UnitNormalizer
+
+
+# Converters of the parameters recorded, those of numeric sensors
+NUMERIC_CONVERTERS = (str_to_float, str_to_int)
+
+# Decoded values of a sensor: (sensor name, unit, timestamps, values)
+Series = tuple[str, str | None, array, array]
+
+
+def open_log(path: str) -> Iterator[str]:
+    """Lines of a log file, gzip-compressed or not ("-" for stdin)."""
+    if path == "-":
+        yield from sys.stdin
+        return
+    with open(path, "rb") as log_file:
+        compressed = log_file.read(2) == b"\x1f\x8b"
+    if compressed:
+        log = gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    else:
+        log = open(path, "rt", encoding="utf-8", errors="replace")
+    with log:
+        yield from log
+
+
+def upload_query(line: str) -> str:
+    """Query string of the upload logged on a line.
+
+    Lines are either access log lines holding the upload URL (the query string
+    follows the first "?"), files of the replay tool ("<offset>\\t<query>") or
+    raw query strings.
+    """
+    index = line.find("?")
+    if index < 0:
+        return line.rpartition("\t")[2].strip()
+    end = index + 1
+    length = len(line)
+    while end < length and line[end] not in ' "\t\r\n':
+        end += 1
+    return line[index + 1 : end]
+
+
+class Sink(Protocol):
+    def write(self, station_id: str, series: list[Series]): ...
+
+    def close(self): ...
+
+
+class HistorySink:
+    """Writes the series to the segment files of a history directory.
+
+    Rollups are not maintained: the server adds the segments written after its
+    saved rollups to them when it loads a sensor. The directory is locked, so
+    that the server cannot use it meanwhile (HistoryLocked is raised if it
+    does). Each open sensor buffers up to capacity samples: once more than
+    max_sensors are open, all are spilled and closed.
+    """
+
+    def __init__(self, directory: str, capacity: int = 4096, max_sensors: int = 4096):
+        self.history = HistoryStore(directory, capacity=capacity, resolutions={})
+        self.history.lock_directory()
+        self.max_sensors = max_sensors
+
+    def write(self, station_id: str, series: list[Series]):
+        for sensor_name, _, timestamps, values in series:
+            self.history.extend(station_id, sensor_name, timestamps, values)
+        if len(self.history.sensors) > self.max_sensors:
+            self.history.evict()
+
+    def close(self):
+        self.history.close()
+
+
+class CSVSink:
+    """Writes the series as station,timestamp,sensor,value,unit rows.
+
+    Timestamps are in seconds since the epoch. Files ending in .gz are
+    gzip-compressed, at the fastest level: the default level takes longer than
+    decoding the uploads.
+    """
+
+    def __init__(self, path: str):
+        if path.endswith(".gz"):
+            self.file = gzip.open(
+                path, "wt", compresslevel=1, encoding="utf-8", newline=""
+            )
+        else:
+            self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["station", "timestamp", "sensor", "value", "unit"])
+
+    def write(self, station_id: str, series: list[Series]):
+        for sensor_name, unit, timestamps, values in series:
+            self.writer.writerows(
+                zip(
+                    repeat(station_id),
+                    timestamps,
+                    repeat(sensor_name),
+                    values,
+                    repeat(unit or ""),
+                )
+            )
+
+    def close(self):
+        self.file.close()
+
+
+class BackfillReport:
+    def __init__(self):
+        self.lines = 0
+        self.uploads = 0
+        # Uploads of unknown stations or with a wrong password
+        self.rejected = 0
+        # Uploads without a valid date ("now" cannot be backfilled)
+        self.undated = 0
+        self.values = 0
+        self.invalid_values = 0
+        self.elapsed = 0.0
+
+    def summary(self) -> str:
+        rate = self.uploads / self.elapsed if self.elapsed > 0 else 0.0
+        return "\n".join(
+            [
+                f"lines:      {self.lines}",
+                f"uploads:    {self.uploads} in {self.elapsed:.2f} s "
+                f"({rate:.0f} uploads/s, {rate * 60 / 1e6:.2f} M uploads/min)",
+                f"values:     {self.values} ({self.invalid_values} invalid)",
+                f"rejected:   {self.rejected} (unknown station or password)",
+                f"undated:    {self.undated}",
+            ]
+        )
+
+
+class Backfill:
+    """Decodes archived uploads in column batches and writes them to sinks.
+
+    Uploads are authenticated against the stations, and their raw values are
+    gathered per station and parameter. Once batch_size uploads are buffered,
+    each column is converted at once: its distinct values are converted and
+    normalized into the station's units, then the column is mapped through
+    them into an array of doubles (which numpy.frombuffer can wrap without a
+    copy).
+
+    Only the numeric sensors are decoded, as the history records, and derived
+    quantities are not computed.
+    """
+
+    def __init__(
+        self,
+        stations: list[StationConfig],
+        sinks: list[Sink],
+        batch_size: int = 10000,
+    ):
+        self.stations_by_id: dict[str, list[StationConfig]] = {}
+        for station in stations:
+            self.stations_by_id.setdefault(station.id, []).append(station)
+        self.sinks = sinks
+        self.batch_size = batch_size
+        # Per unit system and sensor units, as the stations of the server
+        self.normalizers: dict[tuple[Any, ...], UnitNormalizer] = {}
+        self.credentials: dict[tuple[str, str], StationConfig | None] = {}
+        self.timestamps: dict[str, float] = {}
+        self.conversions: dict[str, ParameterConversion | None] = {}
+        # Converted values per parameter and normalizer, for the current batch
+        self.tables: dict[tuple[str, UnitNormalizer], dict[str, float]] = {}
+        # Raw columns (timestamps, values) per station name and parameter,
+        # None for the parameters not decoded
+        self.columns: dict[str, dict[str, tuple[array, list[str]] | None]] = {}
+        self.stations: dict[str, StationConfig] = {}
+        self.buffered = 0
+        self.report = BackfillReport()
+
+    def authenticate(self, id: str, password: str) -> StationConfig | None:
+        key = (id, password)
+        if key not in self.credentials:
+            if len(self.credentials) >= 10000:
+                # Bound the cache when logs hold many bogus credentials
+                self.credentials.clear()
+            self.credentials[key] = next(
+                (
+                    station
+                    for station in self.stations_by_id.get(id, [])
+                    if station.password == password
+                ),
+                None,
+            )
+        return self.credentials[key]
+
+    def add(self, query: str) -> bool:
+        """Buffer an upload, given as a query string.
+
+        Values are kept quoted: numeric values seldom need unquoting, which is
+        left to the decoding of the columns where a value fails to convert.
+        Returns whether the upload was accepted.
+        """
+        fields = {}
+        for pair in query.split("&"):
+            name, _, value = pair.partition("=")
+            fields[name] = value
+        id = fields.pop("ID", None)
+        password = fields.pop("PASSWORD", None)
+        if id is None or password is None:
+            return False
+        report = self.report
+        report.uploads += 1
+        if "%" in id or "+" in id:
+            id = unquote_plus(id)
+        if "%" in password or "+" in password:
+            password = unquote_plus(password)
+        station = self.authenticate(id, password)
+        if station is None:
+            report.rejected += 1
+            return False
+        timestamp = self.timestamp(fields.pop("dateutc", "now"))
+        if timestamp is None:
+            report.undated += 1
+            return False
+
+        columns = self.columns.get(station.name)
+        if columns is None:
+            columns = self.columns[station.name] = {}
+            self.stations[station.name] = station
+        for param, value in fields.items():
+            column = columns.get(param)
+            if column is None:
+                if param in columns:
+                    # Not a numeric sensor
+                    continue
+                column = columns[param] = self.new_column(param)
+                if column is None:
+                    continue
+            column[0].append(timestamp)
+            column[1].append(value)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+        return True
+
+    def timestamp(self, dateutc: str) -> float | None:
+        # Uploads of a fleet share their dates: parse each once per batch
+        timestamp = self.timestamps.get(dateutc)
+        if timestamp is None:
+            try:
+                if dateutc == "now":
+                    raise ValueError
+                timestamp = parse_dateutc(unquote_plus(dateutc)).timestamp()
+            except ValueError:
+                return None
+            self.timestamps[dateutc] = timestamp
+        return timestamp
+
+    def conversion(self, param: str) -> ParameterConversion | None:
+        if param not in self.conversions:
+            conversion = pws_decoder.lookup(unquote_plus(param))
+            if conversion is not None and conversion.converter in NUMERIC_CONVERTERS:
+                self.conversions[param] = conversion
+            else:
+                self.conversions[param] = None
+        return self.conversions[param]
+
+    def new_column(self, param: str) -> tuple[array, list[str]] | None:
+        """Empty column of a parameter, None if it is not decoded."""
+        if self.conversion(param) is None:
+            return None
+        return array("d"), []
+
+    def decode_column(
+        self,
+        param: str,
+        conversion: ParameterConversion,
+        normalizer: UnitNormalizer,
+        timestamps: array,
+        raw: list[str],
+    ) -> Series:
+        unit = conversion.reported_unit
+        kernel = None
+        if unit is not None:
+            kernel = normalizer.kernel(conversion.sensor_name, unit)
+            if kernel is not None:
+                unit = kernel[2]
+        # Columns hold few distinct values (e.g. temperatures to a tenth of a
+        # degree): convert each once per batch, then map the column through
+        # the table of converted values.
+        converter = conversion.converter
+        table = self.tables.get((param, normalizer))
+        if table is None:
+            table = self.tables[(param, normalizer)] = {}
+        for raw_value in set(raw).difference(table):
+            text = raw_value
+            if "%" in text or "+" in text:
+                text = unquote_plus(text)
+            try:
+                value = converter(text)
+            except ValueError:
+                continue
+            if kernel is not None:
+                scale, offset, _ = kernel
+                value = round(value * scale + offset, normalizer.precision)
+            table[raw_value] = value
+        try:
+            values = array("d", map(table.__getitem__, raw))
+        except KeyError:
+            # Drop the invalid values, as the server does
+            valid_timestamps = array("d")
+            values = array("d")
+            for timestamp, raw_value in zip(timestamps, raw):
+                value = table.get(raw_value)
+                if value is not None:
+                    valid_timestamps.append(timestamp)
+                    values.append(value)
+            self.report.invalid_values += len(raw) - len(values)
+            timestamps = valid_timestamps
+        self.report.values += len(values)
+        return conversion.sensor_name, unit, timestamps, values
+
+    def decode(
+        self,
+        station: StationConfig,
+        columns: dict[str, tuple[array, list[str]] | None],
+    ) -> list[Series]:
+        units = (station.unit_system, station.sensor_units)
+        normalizer = self.normalizers.get(units)
+        if normalizer is None:
+            normalizer = self.normalizers[units] = UnitNormalizer(
+                station.unit_system, dict(station.sensor_units)
+            )
+        series = []
+        for param, column in columns.items():
+            conversion = self.conversion(param)
+            if column is not None and conversion is not None:
+                series.append(
+                    self.decode_column(param, conversion, normalizer, *column)
+                )
+        return series
+
+    def flush(self):
+        """Decode the buffered uploads and write them to the sinks."""
+        columns, self.columns = self.columns, {}
+        self.timestamps = {}
+        self.tables = {}
+        for name, station_columns in columns.items():
+            station = self.stations[name]
+            series = self.decode(station, station_columns)
+            for sink in self.sinks:
+                sink.write(station.id, series)
+        self.buffered = 0
+
+    def run(self, lines: Iterable[str]) -> BackfillReport:
+        start = time.perf_counter()
+        lines_count = 0
+        for line in lines:
+            lines_count += 1
+            query = upload_query(line)
+            if query:
+                self.add(query)
+        self.flush()
+        report = self.report
+        report.lines += lines_count
+        report.elapsed += time.perf_counter() - start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode archived PWS uploads into the history or a CSV file"
+    )
+    parser.add_argument("logs", type=str, nargs="+")
+    parser.add_argument("--config", type=str, required=False)
+    parser.add_argument("--station-id", type=str, required=False)
+    parser.add_argument("--station-password", type=str, required=False)
+    parser.add_argument(
+        "--unit-system",
+        choices=UNIT_SYSTEMS,
+        required=False,
+        default="native",
+    )
+    parser.add_argument(
+        "--sensor-unit", type=str, action="append", required=False, default=[]
+    )
+    parser.add_argument("--history-dir", type=str, required=False)
+    parser.add_argument("--csv", type=str, required=False)
+    parser.add_argument("--batch-size", type=int, required=False, default=10000)
+    parser.add_argument("--max-open-sensors", type=int, required=False, default=4096)
+    parser.add_argument("--log-level", type=str, required=False, default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+
+    if args.config is None and (
+        args.station_id is None or args.station_password is None
+    ):
+        parser.error(
+            "--station-id and --station-password are required without --config"
+        )
+    if args.history_dir is None and args.csv is None:
+        parser.error("--history-dir or --csv is required")
+    try:
+        sensor_units = parse_sensor_units(args.sensor_unit)
+    except ConfigError as err:
+        parser.error(str(err))
+
+    if args.config is not None:
+        try:
+            # Targets are not used: stations may rely on the --ha-host option
+            # of the server
+            stations = load_config(
+                args.config, default_target=TargetConfig(host="")
+            ).stations
+        except ConfigError as err:
+            logging.error(f"Invalid configuration: {err}")
+            exit(1)
+    else:
+        stations = [
+            StationConfig(
+                name=args.station_id,
+                id=args.station_id,
+                password=args.station_password,
+                unit_system=args.unit_system,
+                sensor_units=sensor_units,
+            )
+        ]
+
+    sinks: list[Sink] = []
+    if args.history_dir is not None:
+        try:
+            sinks.append(
+                HistorySink(args.history_dir, max_sensors=args.max_open_sensors)
+            )
+        except HistoryLocked as err:
+            logging.error(f"{err}: stop the server during the backfill")
+            exit(1)
+    if args.csv is not None:
+        sinks.append(CSVSink(args.csv))
+
+    backfill = Backfill(stations, sinks, batch_size=args.batch_size)
+    try:
+        for path in args.logs:
+            logging.info(f"Backfilling {path}")
+            backfill.run(open_log(path))
+    finally:
+        for sink in sinks:
+            sink.close()
+    print(backfill.report.summary())
+
+
+if __name__ == "__main__":
+    main()
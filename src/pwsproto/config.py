@@ -0,0 +1,544 @@
+from pathlib import Path
+from typing import Any, Callable
+import dataclasses
+import logging
+import os
+import re
+import signal
+import threading
+import tomllib
+import types
+import typing
+
+from pwsproto import metrics
+from pwsproto.derived import DerivedQuantities
+from pwsproto.ha_http_client import UpdateHAAPI
+from pwsproto.history import HistoryStore
+from pwsproto.pipeline import OVERFLOW_POLICIES, PublishQueue
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.spool import PublishSpool
+from pwsproto.station import WeatherStation
+from pwsproto.units import UNIT_SYSTEMS, UNIT_TO_REFERENCE, UnitNormalizer
+
+
+class ConfigError(ValueError):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class TargetConfig:
+    """Home Assistant instance the sensors of stations are published to."""
+
+    host: str
+    port: int | None = 8123
+    use_https: bool = False
+    token_env: str = "LLT"
+    pool_size: int = 10
+    retries: int = 0
+    concurrency: int = 4
+    deadline: float = 10.0
+    wait: bool = False
+    delta: bool = True
+    heartbeat: float = 300.0
+    batch_path: str | None = None
+
+    def create(self) -> UpdateHAAPI:
+        if self.token_env not in os.environ:
+            raise ConfigError(f"Set the {self.token_env} environment variable")
+        return UpdateHAAPI(
+            LLT=os.environ[self.token_env],
+            ha_host=self.host,
+            ha_port=self.port,
+            ha_use_https=self.use_https,
+            pool_size=self.pool_size,
+            retries=self.retries,
+            concurrency=self.concurrency,
+            deadline=self.deadline,
+            wait=self.wait,
+            delta=self.delta,
+            heartbeat_interval=self.heartbeat if self.heartbeat > 0 else None,
+            batch_path=self.batch_path,
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class PolicyConfig:
+    """How station updates are handed over to their target."""
+
+    queue_size: int = 1000
+    workers: int = 1
+    overflow: str = "drop-oldest"
+    spool_dir: str | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class StationConfig:
+    name: str
+    id: str
+    password: str
+    target: str = "default"
+    policy: str = "default"
+    # Sensors published, all if None
+    sensors: frozenset[str] | None = None
+    unit_system: str = "native"
+    # Units of sensors overriding those of the unit system, as sorted
+    # (sensor, unit) pairs
+    sensor_units: tuple[tuple[str, str], ...] = ()
+    derive: bool = False
+
+    def create_normalizer(self) -> UnitNormalizer | None:
+        if self.unit_system == "native" and len(self.sensor_units) == 0:
+            return None
+        return UnitNormalizer(self.unit_system, dict(self.sensor_units))
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    targets: dict[str, TargetConfig]
+    policies: dict[str, PolicyConfig]
+    stations: list[StationConfig]
+
+
+def _matches(value: Any, annotation: Any) -> bool:
+    """Whether a TOML value may be given for a field with the annotation."""
+    if isinstance(annotation, types.UnionType):
+        return any(_matches(value, arg) for arg in typing.get_args(annotation))
+    if annotation is type(None):
+        return value is None
+    # TOML booleans are not numbers, and integers are valid floats
+    if annotation is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    if annotation is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    origin = typing.get_origin(annotation)
+    if origin is frozenset:
+        # An array of items, e.g. the sensors of a station
+        (item,) = typing.get_args(annotation)
+        return isinstance(value, list) and all(_matches(v, item) for v in value)
+    if origin is tuple:
+        # A table of strings, sorted into (key, value) pairs, e.g. sensor units
+        return isinstance(value, dict) and all(
+            isinstance(v, str) for v in value.values()
+        )
+    return isinstance(value, annotation)
+
+
+def _fields(cls: type, table: dict[str, Any], context: str) -> dict[str, Any]:
+    """The table, checked against the fields of the dataclass.
+
+    The context is the path of the table in the document, for error messages.
+    """
+    if not isinstance(table, dict):
+        raise ConfigError(f"{context} is not a table")
+    fields = {field.name: field.type for field in dataclasses.fields(cls)}
+    unknown = set(table) - set(fields)
+    if len(unknown) > 0:
+        raise ConfigError(f"Unknown keys in {context}: {', '.join(sorted(unknown))}")
+    for key, value in table.items():
+        if not _matches(value, fields[key]):
+            raise ConfigError(f"Invalid value of {context}.{key}: {value!r}")
+    return table
+
+
+def parse_config(
+    document: dict[str, Any],
+    default_target: TargetConfig | None = None,
+    default_policy: PolicyConfig = PolicyConfig(),
+) -> Config:
+    """Config of a parsed TOML document.
+
+    [targets.<name>] tables declare Home Assistant targets, [policies.<name>]
+    tables publish policies, and [[stations]] entries the stations. Stations
+    use the "default" target and policy unless specified; these default to the
+    given ones.
+    """
+    try:
+        targets = {
+            name: TargetConfig(**_fields(TargetConfig, table, f"targets.{name}"))
+            for name, table in document.get("targets", {}).items()
+        }
+        policies = {
+            name: PolicyConfig(**_fields(PolicyConfig, table, f"policies.{name}"))
+            for name, table in document.get("policies", {}).items()
+        }
+        if default_target is not None:
+            targets.setdefault("default", default_target)
+        policies.setdefault("default", default_policy)
+
+        stations = []
+        names = set()
+        for index, table in enumerate(document.get("stations", [])):
+            table = dict(_fields(StationConfig, table, f"stations[{index}]"))
+            table.setdefault("name", table.get("id"))
+            if table.get("sensors") is not None:
+                table["sensors"] = frozenset(table["sensors"])
+            if "sensor_units" in table:
+                table["sensor_units"] = tuple(sorted(table["sensor_units"].items()))
+            station = StationConfig(**table)
+            if station.name in names:
+                raise ConfigError(f"Duplicate station name: {station.name}")
+            names.add(station.name)
+            stations.append(station)
+    except (TypeError, AttributeError) as err:
+        raise ConfigError(str(err)) from err
+
+    for policy_name, policy in policies.items():
+        if policy.overflow not in OVERFLOW_POLICIES:
+            raise ConfigError(
+                f"Unknown overflow policy in policy {policy_name}: {policy.overflow}"
+            )
+    for station in stations:
+        if station.target not in targets:
+            raise ConfigError(
+                f"Unknown target of station {station.name}: {station.target}"
+            )
+        if station.policy not in policies:
+            raise ConfigError(
+                f"Unknown policy of station {station.name}: {station.policy}"
+            )
+        if station.unit_system not in UNIT_SYSTEMS:
+            raise ConfigError(
+                f"Unknown unit system of station {station.name}: {station.unit_system}"
+            )
+        for sensor_name, unit in station.sensor_units:
+            if unit not in UNIT_TO_REFERENCE:
+                raise ConfigError(
+                    f"Unknown unit of sensor {sensor_name} of station "
+                    f"{station.name}: {unit}"
+                )
+    return Config(targets, policies, stations)
+
+
+def parse_sensor_units(values: list[str]) -> tuple[tuple[str, str], ...]:
+    """Sensor units of a station given as "<sensor>=<unit>" options."""
+    sensor_units = {}
+    for value in values:
+        sensor_name, separator, unit = value.partition("=")
+        if separator == "" or unit not in UNIT_TO_REFERENCE:
+            raise ConfigError(f"Invalid sensor unit: {value}")
+        sensor_units[sensor_name] = unit
+    return tuple(sorted(sensor_units.items()))
+
+
+def load_config(
+    path: str | Path,
+    default_target: TargetConfig | None = None,
+    default_policy: PolicyConfig = PolicyConfig(),
+) -> Config:
+    try:
+        with open(path, "rb") as config_file:
+            document = tomllib.load(config_file)
+    except (OSError, tomllib.TOMLDecodeError) as err:
+        raise ConfigError(f"Could not read {path}: {err}") from err
+    return parse_config(document, default_target, default_policy)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class Publisher:
+    """Update callback of the stations sharing a target and a policy.
+
+    The Home Assistant client may be replaced while updates are queued.
+    """
+
+    def __init__(
+        self,
+        target_name: str,
+        client: UpdateHAAPI,
+        policy_name: str,
+        policy: PolicyConfig,
+    ):
+        self.client = client
+        self.callback: Callable[[WeatherStation], Any] = self.publish_station
+        self.queue: PublishQueue | PublishSpool | None = None
+        self.gauges = None
+        suffix = ""
+        if (target_name, policy_name) != ("default", "default"):
+            suffix = f"_{_metric_name(target_name)}_{_metric_name(policy_name)}"
+        spool_dir = spool_directory(target_name, policy)
+        if spool_dir is not None:
+            self.queue = PublishSpool(self.publish, spool_dir)
+            self.gauges = metrics.GaugeCallback(
+                f"pws_spool{suffix}", "Publish spool", self.queue.metrics
+            )
+        elif policy.queue_size > 0:
+            self.queue = PublishQueue(
+                self.publish,
+                max_size=policy.queue_size,
+                workers=policy.workers,
+                overflow=policy.overflow,
+            )
+            self.gauges = metrics.GaugeCallback(
+                f"pws_publish_queue{suffix}", "Publish queue", self.queue.metrics
+            )
+        if self.queue is not None:
+            self.callback = self.queue
+
+    def publish(self, station_id: str, payloads: dict[str, dict[str, Any]]) -> bool:
+        return self.client.publish(station_id, payloads, wait_completion=True)
+
+    def publish_station(self, station: WeatherStation):
+        self.client(station)
+
+    def unregister(self):
+        if self.gauges is not None:
+            metrics.REGISTRY.unregister(self.gauges)
+            self.gauges = None
+
+    def stop(self):
+        self.unregister()
+        if self.queue is not None:
+            self.queue.stop()
+
+
+def spool_directory(target_name: str, policy: PolicyConfig) -> Path | None:
+    if policy.spool_dir is None:
+        return None
+    if target_name == "default":
+        return Path(policy.spool_dir)
+    return Path(policy.spool_dir) / target_name
+
+
+def _publisher_key(target_name: str, policy: PolicyConfig) -> tuple[Any, ...]:
+    # Publishers are shared by equivalent policies, and a spool directory is
+    # owned by a single publisher.
+    spool_dir = spool_directory(target_name, policy)
+    if spool_dir is not None:
+        return ("spool", spool_dir)
+    if policy.queue_size > 0:
+        return (
+            "queue",
+            target_name,
+            policy.queue_size,
+            policy.workers,
+            policy.overflow,
+        )
+    return ("direct", target_name)
+
+
+class StationFleet:
+    """Stations of a configuration, loaded into a request processor.
+
+    Applying a new configuration keeps the stations (and their sensor state)
+    whose name is still configured, as well as the publish queues and spools
+    whose policy did not change. The processor's station index is replaced at
+    once, so that requests being processed complete with the stations they
+    started with. Replaced Home Assistant clients and queues are stopped after
+    a grace period.
+    """
+
+    def __init__(
+        self,
+        processor: PWSRequestProcessor,
+        history: HistoryStore | None = None,
+        grace_period: float = 5.0,
+    ):
+        self.processor = processor
+        self.history = history
+        self.grace_period = grace_period
+        self.lock = threading.Lock()
+        self.config: Config | None = None
+        self.clients: dict[str, tuple[TargetConfig, UpdateHAAPI]] = {}
+        self.publishers: dict[tuple[Any, ...], Publisher] = {}
+        # Clients and publishers removed by a reload, until their grace period
+        # elapses
+        self.retirements: dict[
+            threading.Timer, tuple[list[UpdateHAAPI], list[Publisher]]
+        ] = {}
+        self.stations: dict[str, WeatherStation] = {}
+        # Shared by the stations with the same units
+        self.normalizers: dict[tuple[Any, ...], UnitNormalizer | None] = {}
+
+    def apply(self, config: Config):
+        with self.lock:
+            retired_clients = self.update_clients(config)
+            station_publishers, retired_publishers = self.update_publishers(config)
+            stations = {}
+            for station_config, publisher in zip(config.stations, station_publishers):
+                stations[station_config.name] = self.configure_station(
+                    station_config, publisher
+                )
+            self.processor.replace_stations(list(stations.values()))
+            self.stations = stations
+            self.config = config
+        logging.info(f"Configured {len(stations)} station(s)")
+        if len(retired_clients) > 0 or len(retired_publishers) > 0:
+            timer = threading.Timer(
+                self.grace_period, lambda: self.retire_after_grace_period(timer)
+            )
+            timer.daemon = True
+            with self.lock:
+                self.retirements[timer] = (retired_clients, retired_publishers)
+            timer.start()
+
+    def update_clients(self, config: Config) -> list[UpdateHAAPI]:
+        clients = {}
+        for name in {station.target for station in config.stations}:
+            target = config.targets[name]
+            current = self.clients.get(name)
+            if current is not None and current[0] == target:
+                clients[name] = current
+            else:
+                clients[name] = (target, target.create())
+        retired = [
+            client
+            for name, (_, client) in self.clients.items()
+            if name not in clients or clients[name][1] is not client
+        ]
+        self.clients = clients
+        return retired
+
+    def update_publishers(
+        self, config: Config
+    ) -> tuple[list[Publisher], list[Publisher]]:
+        publishers: dict[tuple[Any, ...], Publisher] = {}
+        station_publishers = []
+        for station in config.stations:
+            policy = config.policies[station.policy]
+            key = _publisher_key(station.target, policy)
+            publisher = publishers.get(key)
+            if publisher is None:
+                publisher = self.publishers.get(key)
+                client = self.clients[station.target][1]
+                if publisher is None:
+                    publisher = Publisher(
+                        station.target, client, station.policy, policy
+                    )
+                else:
+                    publisher.client = client
+                publishers[key] = publisher
+            station_publishers.append(publisher)
+        retired = [
+            publisher
+            for key, publisher in self.publishers.items()
+            if key not in publishers
+        ]
+        for publisher in retired:
+            # The metrics of a replacing publisher may have the same names
+            publisher.unregister()
+        self.publishers = publishers
+        return station_publishers, retired
+
+    def configure_station(
+        self, config: StationConfig, publisher: Publisher
+    ) -> WeatherStation:
+        units = (config.unit_system, config.sensor_units)
+        if units not in self.normalizers:
+            self.normalizers[units] = config.create_normalizer()
+        unit_normalizer = self.normalizers[units]
+
+        station = self.stations.get(config.name)
+        if station is None or station.id != config.id:
+            return WeatherStation(
+                config.id,
+                config.password,
+                update_callback=publisher.callback,
+                unit_normalizer=unit_normalizer,
+                history=self.history,
+                derived=DerivedQuantities() if config.derive else None,
+                sensor_allowlist=config.sensors,
+            )
+        # Keep the sensors of the station
+        station.password = config.password
+        station.update_callback = publisher.callback
+        station.unit_normalizer = unit_normalizer
+        station.set_sensor_allowlist(config.sensors)
+        if not config.derive:
+            station.derived = None
+        elif station.derived is None:
+            station.derived = DerivedQuantities()
+        return station
+
+    def retire_after_grace_period(self, timer: threading.Timer):
+        with self.lock:
+            # None if already retired by close()
+            retired = self.retirements.pop(timer, None)
+        if retired is not None:
+            self.retire(*retired)
+
+    def retire(self, clients: list[UpdateHAAPI], publishers: list[Publisher]):
+        # Queues first, as they publish through the clients
+        for publisher in publishers:
+            publisher.stop()
+        for client in clients:
+            client.close()
+
+    def close(self):
+        with self.lock:
+            self.retire(
+                [client for _, client in self.clients.values()],
+                list(self.publishers.values()),
+            )
+            self.clients = {}
+            self.publishers = {}
+            retirements = self.retirements
+            self.retirements = {}
+        # Clients and publishers retired by a reload are not given the rest of
+        # their grace period
+        for timer, retired in retirements.items():
+            timer.cancel()
+            timer.join()
+            self.retire(*retired)
+
+
+class ConfigWatcher:
+    """Reloads the configuration file on SIGHUP or when it is modified."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        load: Callable[[str | Path], Config],
+        fleet: StationFleet,
+        poll_interval: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.load = load
+        self.fleet = fleet
+        self.poll_interval = poll_interval
+        self.reload_requested = threading.Event()
+        self.stopping = threading.Event()
+        self.mtime = self.current_mtime()
+        self.thread = threading.Thread(target=self.run, name="config", daemon=True)
+
+    def current_mtime(self) -> float | None:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def start(self, handle_sighup: bool = True) -> "ConfigWatcher":
+        if handle_sighup and hasattr(signal, "SIGHUP"):
+            # The handler only wakes up the watcher thread, which reloads
+            signal.signal(signal.SIGHUP, lambda *_: self.reload_requested.set())
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.reload_requested.wait(self.poll_interval)
+            if self.stopping.is_set():
+                break
+            mtime = self.current_mtime()
+            if self.reload_requested.is_set() or mtime != self.mtime:
+                self.reload_requested.clear()
+                self.mtime = mtime
+                self.reload()
+
+    def reload(self):
+        try:
+            config = self.load(self.path)
+            self.fleet.apply(config)
+        except ConfigError as err:
+            logging.error(f"Configuration not reloaded: {err}")
+        except Exception:
+            # Keep watching: a later version of the file may be valid
+            logging.exception("Configuration not reloaded")
+        else:
+            logging.info(f"Reloaded configuration {self.path}")
+
+    def stop(self):
+        self.stopping.set()
+        self.reload_requested.set()
+        self.thread.join()
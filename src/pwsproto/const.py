@@ -0,0 +1,64 @@
+"""Units and device classes of the sensors, as named by Home Assistant.
+
+These mirror the members of homeassistant.const and
+homeassistant.components.sensor.const used by this package, whose values are
+those Home Assistant expects, so that the standalone modules start without
+importing Home Assistant.
+"""
+
+from enum import StrEnum
+
+
+class UnitOfTemperature(StrEnum):
+    CELSIUS = "°C"
+    FAHRENHEIT = "°F"
+    KELVIN = "K"
+
+
+class UnitOfPressure(StrEnum):
+    PA = "Pa"
+    HPA = "hPa"
+    KPA = "kPa"
+    BAR = "bar"
+    CBAR = "cbar"
+    MBAR = "mbar"
+    MMHG = "mmHg"
+    INHG = "inHg"
+    PSI = "psi"
+
+
+class UnitOfSpeed(StrEnum):
+    FEET_PER_SECOND = "ft/s"
+    METERS_PER_SECOND = "m/s"
+    KILOMETERS_PER_HOUR = "km/h"
+    KNOTS = "kn"
+    MILES_PER_HOUR = "mph"
+
+
+class UnitOfPrecipitationDepth(StrEnum):
+    INCHES = "in"
+    MILLIMETERS = "mm"
+    CENTIMETERS = "cm"
+
+
+class UnitOfIrradiance(StrEnum):
+    WATTS_PER_SQUARE_METER = "W/m²"
+
+
+PERCENTAGE = "%"
+UV_INDEX = "UV index"
+CONCENTRATION_PARTS_PER_MILLION = "ppm"
+CONCENTRATION_PARTS_PER_BILLION = "ppb"
+CONCENTRATION_MICROGRAMS_PER_CUBIC_METER = "µg/m³"
+
+
+class SensorDeviceClass(StrEnum):
+    ATMOSPHERIC_PRESSURE = "atmospheric_pressure"
+    CO = "carbon_monoxide"
+    HUMIDITY = "humidity"
+    IRRADIANCE = "irradiance"
+    MOISTURE = "moisture"
+    PM10 = "pm10"
+    PRECIPITATION = "precipitation"
+    TEMPERATURE = "temperature"
+    WIND_SPEED = "wind_speed"
@@ -0,0 +1,115 @@
+from collections import deque
+import datetime
+
+from pwsproto.station import Measurement
+
+
+class SlidingMax:
+    """Maximum of the samples of the last window seconds.
+
+    Samples are kept in a deque of decreasing values: each sample is pushed
+    and popped at most once, so adding a sample is amortized O(1).
+    """
+
+    __slots__ = ("window", "samples")
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples: deque[tuple[float, float]] = deque()
+
+    def add(self, timestamp: float, value: float) -> float:
+        samples = self.samples
+        while samples and samples[-1][1] <= value:
+            samples.pop()
+        samples.append((timestamp, value))
+        expiry = timestamp - self.window
+        while samples[0][0] <= expiry:
+            samples.popleft()
+        return samples[0][1]
+
+
+class SlidingSum:
+    """Sum and mean of the samples of the last window seconds."""
+
+    __slots__ = ("window", "samples", "total")
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples: deque[tuple[float, float]] = deque()
+        self.total = 0.0
+
+    def add(self, timestamp: float, value: float):
+        samples = self.samples
+        samples.append((timestamp, value))
+        self.total += value
+        expiry = timestamp - self.window
+        while samples[0][0] <= expiry:
+            self.total -= samples.popleft()[1]
+        if len(samples) == 1:
+            # Reset the running sum to avoid accumulating rounding errors
+            self.total = value
+
+    def mean(self) -> float:
+        return self.total / len(self.samples)
+
+
+class DerivedQuantities:
+    """Windowed aggregates computed from the instantaneous measurements.
+
+    Many stations only send the instantaneous wind speed and gust, and the
+    daily rain accumulation. The 2-minute average wind speed, 10-minute gust
+    and hourly rain are derived from them when the station does not send
+    these fields itself.
+    """
+
+    def __init__(self, precision: int = 3):
+        self.precision = precision
+        self.wind_speed_avg = SlidingSum(2 * 60)
+        self.wind_gust_max = SlidingMax(10 * 60)
+        self.rain_hourly = SlidingSum(60 * 60)
+        self.last_timestamp: float | None = None
+        self.last_rain_daily: float | None = None
+
+    def derive(
+        self, date: datetime.datetime, measurements: dict[str, Measurement]
+    ) -> dict[str, Measurement]:
+        """Derived measurements missing from the measurements of date."""
+        timestamp = date.timestamp()
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            # Windows only move forward: ignore late uploads
+            return {}
+        self.last_timestamp = timestamp
+        precision = self.precision
+        derived = {}
+
+        wind_speed = measurements.get("wind_speed")
+        if wind_speed is not None and isinstance(wind_speed.value, (int, float)):
+            self.wind_speed_avg.add(timestamp, wind_speed.value)
+            if "wind_speed_avg_2m" not in measurements:
+                derived["wind_speed_avg_2m"] = Measurement(
+                    round(self.wind_speed_avg.mean(), precision), wind_speed.unit
+                )
+
+        wind_gust = measurements.get("wind_gust_speed")
+        if wind_gust is not None and isinstance(wind_gust.value, (int, float)):
+            gust = self.wind_gust_max.add(timestamp, wind_gust.value)
+            if "wind_gust_speed_10m" not in measurements:
+                derived["wind_gust_speed_10m"] = Measurement(gust, wind_gust.unit)
+
+        rain_daily = measurements.get("rain_daily")
+        if rain_daily is not None and isinstance(rain_daily.value, (int, float)):
+            # Rain fallen since the last upload; the daily accumulation is
+            # reset at midnight.
+            rain = rain_daily.value
+            if self.last_rain_daily is None:
+                rain = 0.0
+            elif rain >= self.last_rain_daily:
+                rain -= self.last_rain_daily
+            self.last_rain_daily = rain_daily.value
+            self.rain_hourly.add(timestamp, rain)
+            if "rain_hourly" not in measurements:
+                derived["rain_hourly"] = Measurement(
+                    round(self.rain_hourly.total, precision), rain_daily.unit
+                )
+
+        return derived
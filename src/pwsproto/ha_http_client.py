@@ -1,34 +1,376 @@
 import requests
-from typing import Any
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable
+from urllib3.util.retry import Retry
+import functools
 import logging
+import re
+import threading
+import time
 
+from pwsproto import metrics
 from pwsproto.station import WeatherStation
 
 
+def create_ha_session(pool_size: int = 10, retries: int = 0) -> requests.Session:
+    """Create a keep-alive session to Home Assistant.
+
+    Connections are pooled and reused across sensors and uploads. Setting a
+    state is idempotent, so POST requests are retried on connection errors and
+    on gateway/unavailability responses.
+    """
+    # Passed as a dict: urllib3 1.26 hides the constructor of Retry from type
+    # checkers behind a metaclass, and some stubs annotate backoff_factor as int
+    retry_options: dict[str, Any] = {
+        "total": retries,
+        "backoff_factor": 0.1,
+        "status_forcelist": (502, 503, 504),
+        "allowed_methods": None,
+        "raise_on_status": False,
+    }
+    retry = Retry(**retry_options)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PublishRejected(Exception):
+    """Home Assistant rejected states for good, so retrying them is useless.
+
+    Raised for answers other than 2xx, 5xx and 429 (Too Many Requests), such
+    as 400 for an invalid entity ID.
+    """
+
+    def __init__(self, station_id: str, sensor_names: list[str]):
+        super().__init__(
+            f"Home Assistant rejected {', '.join(sensor_names)} of station {station_id}"
+        )
+        self.station_id = station_id
+        self.sensor_names = sensor_names
+
+
+def retryable_status(status_code: int) -> bool:
+    """Whether a request that failed with this status may succeed later."""
+    return status_code >= 500 or status_code == 429
+
+
+def all_pushed(station_id: str, pushes: Iterable[Callable[[], bool]]) -> bool:
+    """Run all pushes, returns whether they all succeeded.
+
+    Raises PublishRejected if some pushes were rejected and none failed
+    otherwise: retrying would not help the rejected ones.
+    """
+    pushed = True
+    rejected = []
+    for push in pushes:
+        try:
+            pushed = push() and pushed
+        except PublishRejected as err:
+            rejected.extend(err.sensor_names)
+    if len(rejected) > 0 and pushed:
+        raise PublishRejected(station_id, rejected)
+    return pushed
+
+
+def sensor_entity_id(station_id: str, sensor_name: str) -> str:
+    """Entity ID of a station sensor.
+
+    Home Assistant rejects entity IDs that are not lowercase: the station ID
+    is converted as Home Assistant does for the entities of the integration.
+    """
+    station_slug = re.sub(r"[^a-z0-9_]", "_", station_id.lower())
+    return f"sensor.{station_slug}_{sensor_name}"
+
+
+class PublishedStates:
+    """Tracks the last state pushed for each sensor.
+
+    A sensor is only pushed again once its state or attributes (other than the
+    update date) change, or once the heartbeat interval has elapsed since its
+    last push. States are recorded when their push is issued, and forgotten if
+    it fails so that the next update retries them.
+    """
+
+    def __init__(self, heartbeat_interval: float | None = 300.0):
+        self.heartbeat_interval = heartbeat_interval
+        self.lock = threading.Lock()
+        self.last_pushed: dict[tuple[str, str], tuple[Any, float]] = {}
+        self.pushes_sent = 0
+        self.pushes_suppressed = 0
+
+    @staticmethod
+    def state_key(payload: dict[str, Any]) -> Any:
+        attributes = payload.get("attributes", {})
+        return (
+            payload.get("state"),
+            {key: value for key, value in attributes.items() if key != "updated"},
+        )
+
+    def changed(
+        self, station_id: str, payloads: dict[str, dict[str, Any]]
+    ) -> dict[str, dict[str, Any]]:
+        now = time.monotonic()
+        changed_payloads = {}
+        with self.lock:
+            for sensor_name, payload in payloads.items():
+                state_key = self.state_key(payload)
+                last_pushed = self.last_pushed.get((station_id, sensor_name))
+                if (
+                    last_pushed is None
+                    or last_pushed[0] != state_key
+                    or (
+                        self.heartbeat_interval is not None
+                        and now - last_pushed[1] >= self.heartbeat_interval
+                    )
+                ):
+                    changed_payloads[sensor_name] = payload
+                    self.last_pushed[(station_id, sensor_name)] = (state_key, now)
+            sent = len(changed_payloads)
+            self.pushes_sent += sent
+            self.pushes_suppressed += len(payloads) - sent
+            metrics.HA_PUSHES_SENT.inc(sent)
+            metrics.HA_PUSHES_SUPPRESSED.inc(len(payloads) - sent)
+        return changed_payloads
+
+    def forget(self, station_id: str, sensor_name: str, payload: dict[str, Any]):
+        with self.lock:
+            last_pushed = self.last_pushed.get((station_id, sensor_name))
+            # Keep the state of a more recent push
+            if last_pushed is not None and last_pushed[0] == self.state_key(payload):
+                del self.last_pushed[(station_id, sensor_name)]
+
+
 class UpdateHAAPI:
+    """Pushes station sensors to the Home Assistant states API.
+
+    Sensors of an update are posted concurrently by concurrency lanes, each a
+    single thread: all posts of a sensor go through the same lane, so that
+    successive states of a sensor reach Home Assistant in order even when the
+    caller does not wait for them. All posts of an update must complete before
+    its deadline; posts still pending past the deadline are abandoned. Unless
+    wait is set, the caller (and hence the station's HTTP response) does not
+    wait for Home Assistant.
+
+    Unless delta is disabled, sensors whose state did not change since their
+    last push are skipped until the heartbeat interval elapses.
+
+    When a batch path is given, all sensors of an update are sent in a single
+    request to that endpoint, through the lane of the station. If it fails, the
+    sensors are posted one by one to the states API and the batch endpoint is
+    not used again until the batch retry interval elapses; posts then keep
+    going through the lane of the station, so that they cannot overtake a
+    batch still in progress.
+    """
+
     def __init__(
         self,
         LLT: str,
         ha_host: str,
         ha_port: int | None = None,
         ha_use_https: bool = False,
+        pool_size: int = 10,
+        retries: int = 0,
+        concurrency: int = 4,
+        deadline: float = 10.0,
+        timeout: float = 1.0,
+        wait: bool = False,
+        delta: bool = True,
+        heartbeat_interval: float | None = 300.0,
+        batch_path: str | None = None,
+        batch_retry_interval: float = 60.0,
     ):
         self.LLT = LLT
         self.ha_host = ha_host
         self.ha_port = ha_port
         self.ha_use_https = ha_use_https
+        self.deadline = deadline
+        self.timeout = timeout
+        self.wait = wait
+        self.published_states = PublishedStates(heartbeat_interval) if delta else None
+        self.batch_path = batch_path
+        self.batch_retry_interval = batch_retry_interval
+        self.batch_unavailable_until = 0.0
+        self.session = create_ha_session(pool_size=pool_size, retries=retries)
+        self.lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ha-push-{lane}")
+            for lane in range(concurrency)
+        ]
+
+    def lane(self, *key: str) -> ThreadPoolExecutor:
+        return self.lanes[hash(key) % len(self.lanes)]
 
     def __call__(self, station: WeatherStation):
-        for sensor_name, payload in station.get_ha_payloads().items():
-            update_ha_sensor_via_api(
+        self.publish(station.id, station.get_ha_payloads())
+
+    def publish(
+        self,
+        station_id: str,
+        payloads: dict[str, dict[str, Any]],
+        wait_completion: bool | None = None,
+    ) -> bool:
+        """Push the given sensor payloads of a station.
+
+        Returns whether all payloads were accepted by Home Assistant, or True
+        without waiting for them if waiting is not requested. When waiting,
+        raises PublishRejected if the only failures were rejections.
+        """
+        if self.published_states is not None:
+            payloads = self.published_states.changed(station_id, payloads)
+        if len(payloads) == 0:
+            return True
+        deadline = time.monotonic() + self.deadline
+        if self.batch_available():
+            futures = {
+                self.lane(station_id).submit(
+                    self.push_batch, station_id, payloads, deadline
+                ): list(payloads.items())
+            }
+        elif self.batch_path is not None:
+            futures = {
+                self.lane(station_id).submit(
+                    self.push_sensors, station_id, payloads, deadline
+                ): list(payloads.items())
+            }
+        else:
+            futures = {
+                self.lane(station_id, sensor_name).submit(
+                    self.push_sensor, station_id, sensor_name, payload, deadline
+                ): [(sensor_name, payload)]
+                for sensor_name, payload in payloads.items()
+            }
+        if not (self.wait if wait_completion is None else wait_completion):
+            return True
+
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+        for future in not_done:
+            if future.cancel() and self.published_states is not None:
+                for sensor_name, payload in futures[future]:
+                    self.published_states.forget(station_id, sensor_name, payload)
+        if len(not_done) > 0:
+            not_updated = sum(len(futures[future]) for future in not_done)
+            metrics.HA_TIMEOUTS.inc(not_updated)
+            logging.warning(
+                f"Deadline exceeded for station {station_id}: "
+                f"{not_updated} sensor(s) not updated"
+            )
+            return False
+        return all_pushed(station_id, (future.result for future in done))
+
+    def batch_available(self) -> bool:
+        return (
+            self.batch_path is not None
+            and time.monotonic() >= self.batch_unavailable_until
+        )
+
+    def push_batch(
+        self,
+        station_id: str,
+        payloads: dict[str, dict[str, Any]],
+        deadline: float,
+    ) -> bool:
+        assert self.batch_path is not None
+        start = time.perf_counter()
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining > 0 and update_ha_sensors_via_batch(
                 self.ha_host,
                 self.LLT,
-                station.id,
-                sensor_name,
-                payload,
+                station_id,
+                payloads,
+                self.batch_path,
                 ha_use_https=self.ha_use_https,
                 ha_port=self.ha_port,
-            )
+                session=self.session,
+                timeout=min(self.timeout, remaining),
+            ):
+                metrics.HA_POST_SECONDS.observe(time.perf_counter() - start)
+                return True
+        except requests.RequestException as err:
+            logging.warning(f"Could not update {station_id} via batch: {err}")
+        metrics.HA_POST_SECONDS.observe(time.perf_counter() - start)
+
+        # Fall back to one request per sensor, and leave the batch endpoint
+        # alone for a while.
+        self.batch_unavailable_until = time.monotonic() + self.batch_retry_interval
+        return self.push_sensors(station_id, payloads, deadline)
+
+    def push_sensors(
+        self,
+        station_id: str,
+        payloads: dict[str, dict[str, Any]],
+        deadline: float,
+    ) -> bool:
+        return all_pushed(
+            station_id,
+            (
+                functools.partial(
+                    self.push_sensor, station_id, sensor_name, payload, deadline
+                )
+                for sensor_name, payload in payloads.items()
+            ),
+        )
+
+    def push_sensor(
+        self,
+        station_id: str,
+        sensor_name: str,
+        payload: dict[str, Any],
+        deadline: float,
+    ) -> bool:
+        pushed = False
+        start = time.perf_counter()
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining > 0:
+                pushed = update_ha_sensor_via_api(
+                    self.ha_host,
+                    self.LLT,
+                    station_id,
+                    sensor_name,
+                    payload,
+                    ha_use_https=self.ha_use_https,
+                    ha_port=self.ha_port,
+                    session=self.session,
+                    timeout=min(self.timeout, remaining),
+                )
+                metrics.HA_POST_SECONDS.observe(time.perf_counter() - start)
+                if not pushed:
+                    metrics.HA_FAILURES.inc()
+            else:
+                metrics.HA_TIMEOUTS.inc()
+        except requests.Timeout as err:
+            metrics.HA_TIMEOUTS.inc()
+            logging.warning(f"Could not update {station_id}_{sensor_name}: {err}")
+        except requests.RequestException as err:
+            metrics.HA_FAILURES.inc()
+            logging.warning(f"Could not update {station_id}_{sensor_name}: {err}")
+        except PublishRejected:
+            metrics.HA_FAILURES.inc()
+            raise
+        finally:
+            if not pushed and self.published_states is not None:
+                self.published_states.forget(station_id, sensor_name, payload)
+        return pushed
+
+    def close(self):
+        for lane in self.lanes:
+            lane.shutdown(wait=True)
+        self.session.close()
+
+
+def ha_base_url(
+    ha_host: str,
+    ha_use_https: bool = False,
+    ha_port: int | None = None,
+) -> str:
+    return f"http{'s' if ha_use_https else ''}://{ha_host}{':' + str(ha_port) if ha_port is not None else ''}"
 
 
 def update_ha_sensor_via_api(
@@ -39,14 +381,22 @@ def update_ha_sensor_via_api(
     payload: dict[str, Any],
     ha_use_https: bool = False,
     ha_port: int | None = None,
-):
-    response = requests.post(
-        f"http{'s' if ha_use_https else ''}://{ha_host}{':' + str(ha_port) if ha_port is not None else ''}/api/states/sensor.{station_id}_{sensor_name}",
+    session: requests.Session | None = None,
+    timeout: float = 1,
+) -> bool:
+    """Post the state of a sensor to the states API.
+
+    Returns whether it was accepted, and raises PublishRejected if it was
+    refused for good rather than because Home Assistant is unavailable.
+    """
+    post = session.post if session is not None else requests.post
+    response = post(
+        f"{ha_base_url(ha_host, ha_use_https, ha_port)}/api/states/{sensor_entity_id(station_id, sensor_name)}",
         headers={
             "Authorization": f"Bearer {ha_token}",
         },
         json=payload,
-        timeout=1,
+        timeout=timeout,
     )
 
     if not response.ok:
@@ -54,3 +404,57 @@ def update_ha_sensor_via_api(
         logging.warning(f"Headers: {response.request.headers}")
         logging.warning(f"JSON sent: {response.request.body}")
         logging.warning(f"Response: {response.text}")
+        if not retryable_status(response.status_code):
+            raise PublishRejected(station_id, [sensor_name])
+
+    return response.ok
+
+
+def update_ha_sensors_via_batch(
+    ha_host: str,
+    ha_token: str,
+    station_id: str,
+    payloads: dict[str, dict[str, Any]],
+    batch_path: str,
+    ha_use_https: bool = False,
+    ha_port: int | None = None,
+    session: requests.Session | None = None,
+    timeout: float = 1,
+) -> bool:
+    """Send the states of several sensors of a station in one request.
+
+    The body maps entity IDs to the payloads that would have been posted to
+    /api/states/<entity_id>. The endpoint (BATCH_ROUTE of the Home Assistant
+    integration) answers with the number of states applied: any other answer,
+    such as that of a webhook nobody registered, counts as a failure.
+    """
+    post = session.post if session is not None else requests.post
+    states = {
+        sensor_entity_id(station_id, sensor_name): payload
+        for sensor_name, payload in payloads.items()
+    }
+    response = post(
+        f"{ha_base_url(ha_host, ha_use_https, ha_port)}{batch_path}",
+        headers={
+            "Authorization": f"Bearer {ha_token}",
+        },
+        json={"station_id": station_id, "states": states},
+        timeout=timeout,
+    )
+
+    if not response.ok:
+        logging.warning(
+            f"Batch update to {response.request.url} failed: {response.text}"
+        )
+        return False
+    try:
+        applied = response.json().get("applied")
+    except (ValueError, AttributeError):
+        applied = None
+    if applied != len(states):
+        logging.warning(
+            f"Batch update to {response.request.url} applied {applied} "
+            f"of {len(states)} states: {response.text}"
+        )
+        return False
+    return True
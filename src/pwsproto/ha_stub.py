@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, cast
+import argparse
+import json
+import logging
+import re
+import socket
+import threading
+
+# Entity IDs accepted by Home Assistant
+ENTITY_ID = re.compile(r"[a-z0-9_]+\.[a-z0-9_]+")
+
+
+class HAStubRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, as served by Home Assistant
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def stub(self) -> "HAStubServer":
+        return cast(HAStubServer, self.server)
+
+    def setup(self):
+        super().setup()
+        self.stub.open_connection(self.request)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.stub.close_connection(self.request)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        status, response = self.stub.handle_post(self.path, body)
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any):
+        logging.debug(format, *args)
+
+
+class HAStubServer(ThreadingHTTPServer):
+    """Minimal stand-in for the Home Assistant REST API.
+
+    Records the states posted to /api/states/<entity_id>, or in one request to
+    the batch path when one is set, and the order in which the states of each
+    entity were received. Invalid entity IDs are rejected with a 400 error,
+    or skipped in batches. Counts the TCP
+    connections it accepts, and can be made unavailable or slow to simulate
+    an unhealthy Home Assistant instance.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, batch_path: str | None = None
+    ):
+        super().__init__((host, port), HAStubRequestHandler)
+        self.lock = threading.Lock()
+        self.states: dict[str, dict[str, Any]] = {}
+        self.history: dict[str, list[Any]] = {}
+        self.connections = 0
+        # Handler thread of each open connection
+        self.open_connections: dict[socket.socket, threading.Thread] = {}
+        self.requests = 0
+        self.available = True
+        self.delay = 0.0
+        self.batch_path = batch_path
+        self.thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def open_connection(self, connection: socket.socket):
+        with self.lock:
+            self.connections += 1
+            self.open_connections[connection] = threading.current_thread()
+
+    def close_connection(self, connection: socket.socket):
+        with self.lock:
+            self.open_connections.pop(connection, None)
+
+    def handle_post(self, path: str, body: bytes) -> tuple[int, Any]:
+        with self.lock:
+            self.requests += 1
+        if self.delay > 0:
+            threading.Event().wait(self.delay)
+        if not self.available:
+            return 503, {"message": "Service unavailable"}
+        if self.batch_path is not None and path == self.batch_path:
+            states = {
+                entity_id: state
+                for entity_id, state in json.loads(body)["states"].items()
+                if ENTITY_ID.fullmatch(entity_id)
+            }
+            with self.lock:
+                self.record(states)
+            return 200, {"applied": len(states)}
+        if not path.startswith("/api/states/"):
+            return 404, {"message": "Not found"}
+        if not ENTITY_ID.fullmatch(path.removeprefix("/api/states/")):
+            return 400, {"message": "Invalid entity ID specified."}
+        state = json.loads(body)
+        with self.lock:
+            self.record({path.removeprefix("/api/states/"): state})
+        return 200, state
+
+    def record(self, states: dict[str, dict[str, Any]]):
+        self.states.update(states)
+        for entity_id, state in states.items():
+            self.history.setdefault(entity_id, []).append(state["state"])
+
+    def handle_error(self, request: Any, client_address: Any):
+        # Clients giving up on a slow response are expected
+        logging.debug(f"Connection from {client_address} closed")
+
+    def start(self) -> "HAStubServer":
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # End the keep-alive connections that clients left open
+        with self.lock:
+            open_connections = list(self.open_connections.items())
+        for connection, thread in open_connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            thread.join()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listen", type=str, required=False, default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=False, default=8123)
+    parser.add_argument("--delay", type=float, required=False, default=0.0)
+    parser.add_argument("--batch-path", type=str, required=False)
+
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    server = HAStubServer(args.listen, args.port, batch_path=args.batch_path)
+    server.delay = args.delay
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
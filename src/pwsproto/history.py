@@ -0,0 +1,570 @@
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import IO
+import datetime
+import fcntl
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+from pwsproto.station import Measurement
+
+
+# Rollup resolutions in seconds (1 minute, 1 hour), with the number of buckets
+# kept for each (1 week, 1 year)
+DEFAULT_RESOLUTIONS = {60: 7 * 24 * 60, 3600: 366 * 24}
+
+SEGMENT_NAME = re.compile(r"([0-9]+)\.seg")
+# Segments that cannot be read are renamed with this suffix and skipped
+QUARANTINE_SUFFIX = ".bad"
+ROLLUP_NAME = "{}.rollup"
+LOCK_NAME = ".lock"
+
+
+class HistoryLocked(Exception):
+    pass
+
+
+class Rollup:
+    """Min/max/mean of samples per time bucket, maintained on ingest."""
+
+    __slots__ = ("resolution", "retention", "starts", "mins", "maxs", "sums", "counts")
+
+    def __init__(self, resolution: int, retention: int):
+        self.resolution = resolution
+        self.retention = retention
+        self.starts = array("d")
+        self.mins = array("d")
+        self.maxs = array("d")
+        self.sums = array("d")
+        self.counts = array("q")
+
+    def add(self, timestamp: float, value: float):
+        start = timestamp - timestamp % self.resolution
+        starts = self.starts
+        if len(starts) > 0 and starts[-1] == start:
+            index = len(starts) - 1
+        elif len(starts) == 0 or starts[-1] < start:
+            if len(starts) >= self.retention:
+                self.expire(len(starts) - self.retention + 1)
+            starts.append(start)
+            self.mins.append(value)
+            self.maxs.append(value)
+            self.sums.append(value)
+            self.counts.append(1)
+            return
+        else:
+            # Late sample, dropped if older than the retained buckets
+            if len(starts) >= self.retention and start < starts[0]:
+                return
+            index = bisect_left(starts, start)
+            if index == len(starts) or starts[index] != start:
+                starts.insert(index, start)
+                self.mins.insert(index, value)
+                self.maxs.insert(index, value)
+                self.sums.insert(index, value)
+                self.counts.insert(index, 1)
+                return
+        if value < self.mins[index]:
+            self.mins[index] = value
+        if value > self.maxs[index]:
+            self.maxs[index] = value
+        self.sums[index] += value
+        self.counts[index] += 1
+
+    def expire(self, count: int):
+        # Drop at least a tenth of the buckets at once, so that expiring is
+        # amortized over many samples.
+        count = max(count, self.retention // 10)
+        for buckets in (self.starts, self.mins, self.maxs, self.sums, self.counts):
+            del buckets[:count]
+
+    def save(self, path: Path, covered: int):
+        """Write the buckets, built from the covered first segments of a sensor.
+
+        The file holds covered and the number n of buckets (int64), followed by
+        the n starts, mins, maxs, sums (doubles) and counts (int64).
+        """
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "wb") as rollup_file:
+            array("q", [covered, len(self.starts)]).tofile(rollup_file)
+            for buckets in (self.starts, self.mins, self.maxs, self.sums, self.counts):
+                buckets.tofile(rollup_file)
+        os.replace(temporary, path)
+
+    def load(self, path: Path) -> int:
+        """Read the buckets written by save, returns the segments they cover."""
+        columns = (self.starts, self.mins, self.maxs, self.sums, self.counts)
+        try:
+            with open(path, "rb") as rollup_file:
+                header = array("q")
+                header.fromfile(rollup_file, 2)
+                covered, count = header
+                for buckets in columns:
+                    buckets.fromfile(rollup_file, count)
+        except (OSError, EOFError):
+            # Missing or truncated: rebuilt from all segments
+            for buckets in columns:
+                del buckets[:]
+            return 0
+        if count > self.retention:
+            for buckets in columns:
+                del buckets[: count - self.retention]
+        return covered
+
+    def query(
+        self, start: float, end: float
+    ) -> list[tuple[float, float, float, float, int]]:
+        """Buckets (start, min, max, mean, count) starting within [start, end)."""
+        first = bisect_left(self.starts, start - start % self.resolution)
+        last = bisect_left(self.starts, end)
+        return [
+            (
+                self.starts[i],
+                self.mins[i],
+                self.maxs[i],
+                self.sums[i] / self.counts[i],
+                self.counts[i],
+            )
+            for i in range(first, last)
+        ]
+
+
+class Segment:
+    """Samples spilled to disk: n timestamps followed by n values (doubles).
+
+    The samples of a segment are sorted by timestamp, but the time ranges of
+    segments may overlap when samples arrive out of order.
+    """
+
+    __slots__ = ("path", "first", "last", "count")
+
+    def __init__(self, path: Path, first: float, last: float, count: int):
+        self.path = path
+        self.first = first
+        self.last = last
+        self.count = count
+
+    @classmethod
+    def write(cls, path: Path, timestamps: array, values: array) -> "Segment":
+        """Write the samples, sorted, to a temporary file renamed to path.
+
+        A crash while writing thus leaves no truncated segment.
+        """
+        if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            timestamps = array("d", (timestamps[i] for i in order))
+            values = array("d", (values[i] for i in order))
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "wb") as segment_file:
+            timestamps.tofile(segment_file)
+            values.tofile(segment_file)
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+        os.replace(temporary, path)
+        return cls(path, timestamps[0], timestamps[-1], len(timestamps))
+
+    @classmethod
+    def open(cls, path: Path) -> "Segment":
+        """Open a segment file; raises ValueError if its size is invalid."""
+        size = path.stat().st_size
+        if size == 0 or size % 16 != 0:
+            raise ValueError(f"Invalid segment size {size}")
+        count = size // 16
+        with open(path, "rb") as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                samples = memoryview(data).cast("d")
+                first, last = samples[0], samples[count - 1]
+                samples.release()
+        return cls(path, first, last, count)
+
+    def samples(self) -> list[tuple[float, float]]:
+        return self.read(float("-inf"), float("inf"))
+
+    def read(self, start: float, end: float) -> list[tuple[float, float]]:
+        with open(self.path, "rb") as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                samples = memoryview(data).cast("d")
+                timestamps = samples[: self.count]
+                first = bisect_left(timestamps, start)
+                last = bisect_left(timestamps, end)
+                result = [
+                    (timestamps[i], samples[self.count + i]) for i in range(first, last)
+                ]
+                timestamps.release()
+                samples.release()
+        return result
+
+
+class SensorHistory:
+    """Time series of one sensor.
+
+    Recent samples are kept in an in-memory ring buffer, grown up to capacity
+    samples. When it is full, its oldest half is spilled to a segment file (or
+    discarded without a directory). Rollups are updated on every sample, and
+    saved when flushed so that only the segments written since are replayed
+    on load.
+
+    Samples may arrive out of order (delayed station clocks, late or
+    backfilled uploads): they are kept in arrival order in the ring buffer,
+    sorted within each segment, and sorted again by queries.
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        capacity: int = 4096,
+        resolutions: dict[int, int] = DEFAULT_RESOLUTIONS,
+    ):
+        self.directory = directory
+        self.capacity = capacity
+        # Until the buffer has grown to capacity, head is 0 and the arrays hold
+        # exactly the size samples
+        self.timestamps = array("d")
+        self.values = array("d")
+        self.head = 0
+        self.size = 0
+        self.segments: list[Segment] = []
+        self.next_segment = 0
+        # Number of first segments included in the saved rollups
+        self.rollups_covered = 0
+        self.rollups = {
+            resolution: Rollup(resolution, retention)
+            for resolution, retention in resolutions.items()
+        }
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+            self.load_segments()
+
+    def load_segments(self):
+        assert self.directory is not None
+        numbered_paths = []
+        for path in self.directory.iterdir():
+            match = SEGMENT_NAME.fullmatch(path.name)
+            if match is not None and path.stat().st_size > 0:
+                numbered_paths.append((int(match.group(1)), path))
+        numbered_paths.sort()
+        covered = {
+            resolution: rollup.load(self.directory / ROLLUP_NAME.format(resolution))
+            for resolution, rollup in self.rollups.items()
+        }
+        for number, path in numbered_paths:
+            try:
+                segment = Segment.open(path)
+            except ValueError as err:
+                # E.g. written by an older version that crashed while spilling
+                logging.warning(f"Skipped history segment {path}: {err}")
+                path.replace(path.with_name(path.name + QUARANTINE_SUFFIX))
+                continue
+            self.segments.append(segment)
+            self.next_segment = number + 1
+            stale = [
+                rollup
+                for resolution, rollup in self.rollups.items()
+                if number >= covered[resolution]
+            ]
+            if stale:
+                for timestamp, value in segment.samples():
+                    for rollup in stale:
+                        rollup.add(timestamp, value)
+        self.rollups_covered = self.next_segment
+
+    @property
+    def growing(self) -> bool:
+        return len(self.timestamps) < self.capacity
+
+    def append(self, timestamp: float, value: float):
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, value)
+        if self.size == self.capacity:
+            self.spill(self.capacity // 2)
+        if self.growing:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            index = (self.head + self.size) % self.capacity
+            self.timestamps[index] = timestamp
+            self.values[index] = value
+        self.size += 1
+
+    def extend(self, timestamps: array, values: array):
+        """Append samples in bulk, copied into the ring buffer by slices."""
+        for rollup in self.rollups.values():
+            add = rollup.add
+            for timestamp, value in zip(timestamps, values):
+                add(timestamp, value)
+        start = 0
+        while start < len(timestamps):
+            if self.size == self.capacity:
+                self.spill(self.capacity // 2)
+            if self.growing:
+                count = min(len(timestamps) - start, self.capacity - self.size)
+                self.timestamps.extend(timestamps[start : start + count])
+                self.values.extend(values[start : start + count])
+            else:
+                index = (self.head + self.size) % self.capacity
+                count = min(
+                    len(timestamps) - start,
+                    self.capacity - self.size,
+                    self.capacity - index,
+                )
+                self.timestamps[index : index + count] = timestamps[
+                    start : start + count
+                ]
+                self.values[index : index + count] = values[start : start + count]
+            self.size += count
+            start += count
+
+    def buffered(self, count: int) -> tuple[array, array]:
+        """The count oldest samples of the ring buffer."""
+        timestamps = array("d")
+        values = array("d")
+        end = self.head + count
+        for start, stop in (
+            (self.head, min(end, self.capacity)),
+            (0, end - self.capacity),
+        ):
+            if stop > start:
+                timestamps.extend(self.timestamps[start:stop])
+                values.extend(self.values[start:stop])
+        return timestamps, values
+
+    def spill(self, count: int):
+        count = min(count, self.size)
+        if count == 0:
+            return
+        if self.directory is not None:
+            timestamps, values = self.buffered(count)
+            path = self.directory / f"{self.next_segment}.seg"
+            self.segments.append(Segment.write(path, timestamps, values))
+            self.next_segment += 1
+        if self.growing:
+            del self.timestamps[:count]
+            del self.values[:count]
+        else:
+            self.head = (self.head + count) % self.capacity
+        self.size -= count
+        if self.size == 0:
+            # Release the buffer, grown again on the next samples
+            self.timestamps = array("d")
+            self.values = array("d")
+            self.head = 0
+
+    def flush(self):
+        """Spill the whole ring buffer and save the rollups to disk."""
+        if self.directory is not None:
+            self.spill(self.size)
+            if self.rollups_covered != self.next_segment:
+                for resolution, rollup in self.rollups.items():
+                    rollup.save(
+                        self.directory / ROLLUP_NAME.format(resolution),
+                        self.next_segment,
+                    )
+                self.rollups_covered = self.next_segment
+
+    def query(self, start: float, end: float) -> list[tuple[float, float]]:
+        """Samples (timestamp, value) within [start, end), by timestamp."""
+        samples = []
+        for segment in self.segments:
+            if segment.last >= start and segment.first < end:
+                samples.extend(segment.read(start, end))
+        timestamps, values = self.buffered(self.size)
+        samples.extend(
+            (timestamp, value)
+            for timestamp, value in zip(timestamps, values)
+            if start <= timestamp < end
+        )
+        # Stable, and cheap when the samples are already in order
+        samples.sort(key=lambda sample: sample[0])
+        return samples
+
+    def aggregate(
+        self, start: float, end: float, resolution: int
+    ) -> list[tuple[float, float, float, float, int]]:
+        if resolution not in self.rollups:
+            raise ValueError(f"No rollup with resolution {resolution}")
+        return self.rollups[resolution].query(start, end)
+
+
+class HistoryStore:
+    """History of the numeric sensors of all stations.
+
+    With a directory, samples spilled from memory are stored in
+    <directory>/<station id>/<sensor name>/<n>.seg, with the rollups in
+    <resolution>.rollup, and reloaded on first use. A process writing to the
+    directory should take its lock (lock_directory), so that a server and a
+    backfill do not write segments with the same numbers.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path | None = None,
+        capacity: int = 4096,
+        resolutions: dict[int, int] = DEFAULT_RESOLUTIONS,
+    ):
+        self.directory = Path(directory) if directory is not None else None
+        self.capacity = capacity
+        self.resolutions = resolutions
+        self.lock = threading.Lock()
+        self.sensors: dict[tuple[str, str], SensorHistory] = {}
+        # Monotonic time of the last use of each sensor
+        self.last_used: dict[tuple[str, str], float] = {}
+        self.evictions = 0
+        self.lock_file: IO[str] | None = None
+
+    def lock_directory(self):
+        """Take the lock of the directory, held until close().
+
+        Raises HistoryLocked if another process holds it.
+        """
+        assert self.directory is not None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.directory / LOCK_NAME, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise HistoryLocked(
+                f"History directory {self.directory} is used by another process"
+            ) from None
+        self.lock_file = lock_file
+
+    def sensor(self, station_id: str, sensor_name: str) -> SensorHistory:
+        """The history of a sensor, loaded from its directory on first use.
+
+        Called with the lock held, which is released while the sensor is loaded
+        so that other sensors remain usable.
+        """
+        key = (station_id, sensor_name)
+        history = self.sensors.get(key)
+        while history is None:
+            evictions = self.evictions
+            self.lock.release()
+            try:
+                loaded = SensorHistory(
+                    self.directory / station_id / sensor_name
+                    if self.directory is not None
+                    else None,
+                    capacity=self.capacity,
+                    resolutions=self.resolutions,
+                )
+            finally:
+                self.lock.acquire()
+            history = self.sensors.get(key)
+            # Loaded again if an eviction wrote to its directory meanwhile
+            if history is None and self.evictions == evictions:
+                history = self.sensors[key] = loaded
+        self.last_used[key] = time.monotonic()
+        return history
+
+    def record(
+        self,
+        station_id: str,
+        date: datetime.datetime,
+        measurements: dict[str, Measurement],
+    ):
+        timestamp = date.timestamp()
+        with self.lock:
+            for sensor_name, measurement in measurements.items():
+                value = measurement.value
+                if isinstance(value, (int, float)):
+                    self.sensor(station_id, sensor_name).append(timestamp, value)
+
+    def extend(
+        self,
+        station_id: str,
+        sensor_name: str,
+        timestamps: array,
+        values: array,
+    ):
+        """Record samples of a sensor in bulk, as timestamps and values."""
+        with self.lock:
+            self.sensor(station_id, sensor_name).extend(timestamps, values)
+
+    def query(
+        self,
+        station_id: str,
+        sensor_name: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> list[tuple[float, float]]:
+        with self.lock:
+            return self.sensor(station_id, sensor_name).query(
+                start.timestamp(), end.timestamp()
+            )
+
+    def aggregate(
+        self,
+        station_id: str,
+        sensor_name: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        resolution: int = 3600,
+    ) -> list[tuple[float, float, float, float, int]]:
+        """Buckets (start, min, max, mean, count) of the sensor's rollup."""
+        with self.lock:
+            return self.sensor(station_id, sensor_name).aggregate(
+                start.timestamp(), end.timestamp(), resolution
+            )
+
+    def flush(self):
+        with self.lock:
+            for history in self.sensors.values():
+                history.flush()
+
+    def close(self):
+        """Flush, and release the lock of the directory."""
+        self.flush()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def evict(self, max_idle: float | None = None) -> int:
+        """Spill and drop the sensors unused for max_idle seconds (by default all).
+
+        Sensors are reloaded from their directory when used again, so this
+        only frees memory for a store with a directory. Returns the number of
+        evicted sensors.
+        """
+        with self.lock:
+            now = time.monotonic()
+            keys = [
+                key
+                for key, last_used in self.last_used.items()
+                if max_idle is None or now - last_used >= max_idle
+            ]
+            for key in keys:
+                self.sensors.pop(key).flush()
+                del self.last_used[key]
+            if keys:
+                self.evictions += 1
+            return len(keys)
+
+
+class HistoryEvictor:
+    """Evicts the sensors of a history store unused for max_idle seconds."""
+
+    def __init__(self, history: HistoryStore, max_idle: float):
+        self.history = history
+        self.max_idle = max_idle
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="history", daemon=True)
+
+    def start(self) -> "HistoryEvictor":
+        self.thread.start()
+        return self
+
+    def run(self):
+        # Idle sensors are evicted at most max_idle / 2 seconds late
+        while not self.stopping.wait(self.max_idle / 2):
+            evicted = self.history.evict(self.max_idle)
+            if evicted > 0:
+                logging.debug(f"Evicted {evicted} idle sensors from the history")
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
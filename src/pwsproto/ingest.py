@@ -0,0 +1,115 @@
+from typing import Any, Callable, Iterable
+from urllib.parse import unquote_plus
+import time
+
+from pwsproto import metrics
+from pwsproto.pipeline import PublishQueueFull
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.ratelimit import RateLimited
+
+
+PWS_ROUTE = "/weatherstation/updateweatherstation.php"
+
+WSGIApp = Callable[[dict[str, Any], Callable[..., Any]], Iterable[bytes]]
+
+
+def parse_query(query: str) -> dict[str, str]:
+    """Fields of a query string, the last value of a repeated field winning.
+
+    Only names and values containing "%" or "+" are unquoted, as UTF-8.
+    """
+    fields = {}
+    for pair in query.split("&"):
+        if not pair:
+            continue
+        name, _, value = pair.partition("=")
+        if "%" in name or "+" in name:
+            name = unquote_plus(name)
+        if "%" in value or "+" in value:
+            value = unquote_plus(value)
+        fields[name] = value
+    return fields
+
+
+def _response(
+    start_response: Callable[..., Any],
+    status: str,
+    body: str,
+    headers: list[tuple[str, str]] | None = None,
+) -> list[bytes]:
+    data = body.encode()
+    start_response(
+        status,
+        [("Content-Type", "text/plain"), ("Content-Length", str(len(data)))]
+        + (headers or []),
+    )
+    return [data]
+
+
+class IngestApp:
+    """WSGI app decoding station uploads straight from the query string.
+
+    Requests to other paths are passed to fallback (e.g. the Bottle app serving
+    /metrics), or answered with 404. The app can also be mounted under Bottle,
+    with path set to the route relative to the mount point.
+    """
+
+    def __init__(
+        self,
+        processor: PWSRequestProcessor,
+        fallback: WSGIApp | None = None,
+        path: str = PWS_ROUTE,
+    ):
+        self.processor = processor
+        self.fallback = fallback
+        self.path = path
+
+    def __call__(
+        self, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> Iterable[bytes]:
+        if environ.get("PATH_INFO") != self.path or environ.get(
+            "REQUEST_METHOD"
+        ) not in ("GET", "HEAD"):
+            if self.fallback is not None:
+                return self.fallback(environ, start_response)
+            return _response(start_response, "404 Not Found", "Not found")
+
+        start = time.perf_counter()
+        try:
+            return self.handle(environ, start_response)
+        finally:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+    def handle(
+        self, environ: dict[str, Any], start_response: Callable[..., Any]
+    ) -> list[bytes]:
+        try:
+            # Rejected before the query string is parsed
+            self.processor.admit_address(
+                environ.get("REMOTE_ADDR"), environ.get("HTTP_X_FORWARDED_FOR")
+            )
+            fields = parse_query(environ.get("QUERY_STRING", ""))
+            id = fields.pop("ID", None)
+            password = fields.pop("PASSWORD", None)
+            if id is None or password is None:
+                return _response(
+                    start_response, "400 Bad Request", "Missing station ID/password"
+                )
+            self.processor.process_fields(id, password, fields)
+        except RateLimited as err:
+            return _response(
+                start_response,
+                "429 Too Many Requests",
+                str(err),
+                [("Retry-After", err.retry_after_header)],
+            )
+        except PermissionError as err:
+            return _response(start_response, "403 Forbidden", str(err))
+        except PublishQueueFull as err:
+            return _response(start_response, "503 Service Unavailable", str(err))
+        except ValueError as err:
+            return _response(start_response, "400 Bad Request", str(err))
+        start_response(
+            "200 OK", [("Content-Type", "text/plain"), ("Content-Length", "0")]
+        )
+        return [b""]
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+import logging
+import queue
+import threading
+import time
+
+
+class LazyFields:
+    """Formats "name=value" pairs only when the log record is emitted."""
+
+    __slots__ = ("fields", "separator")
+
+    def __init__(self, fields: dict[str, Any], separator: str = ", "):
+        self.fields = fields
+        self.separator = separator
+
+    def __str__(self) -> str:
+        return self.separator.join(
+            f"{name}={value}" for name, value in self.fields.items()
+        )
+
+
+class LazyMeasurements:
+    """Formats measurements as "sensor=value unit" only when emitted."""
+
+    __slots__ = ("measurements", "separator")
+
+    def __init__(self, measurements: dict[str, Any], separator: str = ", "):
+        self.measurements = measurements
+        self.separator = separator
+
+    def __str__(self) -> str:
+        return self.separator.join(
+            f"{sensor}={measurement.value}"
+            + (f" {measurement.unit}" if measurement.unit is not None else "")
+            for sensor, measurement in self.measurements.items()
+        )
+
+
+class WarningRateLimiter:
+    """Limits repeated warnings about the same key to one per interval.
+
+    The last warning time of at most max_keys keys is kept, least recently
+    warned keys being forgotten first. The number of warnings suppressed since
+    the last one is returned when a key may be warned about again.
+    """
+
+    def __init__(self, interval: float = 3600.0, max_keys: int = 4096):
+        self.interval = interval
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        # Key: (last warning time, suppressed warnings since)
+        self.warned: OrderedDict[Any, tuple[float, int]] = OrderedDict()
+
+    def allow(self, key: Any) -> int | None:
+        """Suppressed warnings count if key may be warned about, else None."""
+        now = time.monotonic()
+        with self.lock:
+            warned = self.warned.get(key)
+            if warned is not None:
+                last, suppressed = warned
+                if now - last < self.interval:
+                    self.warned[key] = (last, suppressed + 1)
+                    return None
+                self.warned.move_to_end(key)
+            elif len(self.warned) >= self.max_keys:
+                self.warned.popitem(last=False)
+            self.warned[key] = (now, 0)
+            return warned[1] if warned is not None else 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler leaving the formatting of records to the listener.
+
+    Arguments of log records must then not be modified after logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_queue_logging(logger: logging.Logger | None = None) -> QueueListener:
+    """Move the handlers of logger (the root logger by default) to a thread.
+
+    Records are put in an unbounded queue by the logging thread, and formatted
+    and written by a listener thread. The returned listener must be
+    stopped to flush the queue.
+    """
+    if logger is None:
+        logger = logging.getLogger()
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    handlers = list(logger.handlers)
+    if len(handlers) == 0:
+        handlers = [logging.StreamHandler()]
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(DeferredQueueHandler(records))
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
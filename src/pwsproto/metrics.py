@@ -0,0 +1,248 @@
+from bisect import bisect_left
+from typing import Callable
+import threading
+
+
+# Latency buckets in seconds, from 5µs to 2.5s
+LATENCY_BUCKETS = (
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if len(names) == 0:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format.
+
+    Metrics are updated on the hot path of uploads, without locks: two threads
+    updating the same metric at the same instant may rarely lose an update,
+    which is acceptable for monitoring. Only the creation of labelled children
+    is locked.
+    """
+
+    def __init__(self):
+        self.metrics: list["Counter | Histogram | GaugeCallback"] = []
+
+    def register(self, metric: "Counter | Histogram | GaugeCallback"):
+        self.metrics.append(metric)
+
+    def unregister(self, metric: "Counter | Histogram | GaugeCallback"):
+        self.metrics.remove(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Registry | None = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.children: dict[tuple[str, ...], CounterChild] = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values: str) -> CounterChild:
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, CounterChild())
+        return child
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, child in list(self.children.items()):
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}{labels} {child.value}")
+        return lines
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # Non-cumulative counts, the last one for values above all buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        registry: Registry | None = REGISTRY,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.children: dict[tuple[str, ...], HistogramChild] = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values: str) -> HistogramChild:
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in list(self.children.items()):
+            counts = list(child.counts)
+            total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames + ("le",), values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauges read from a function returning a dict of values on each render.
+
+    Each key of the dict is rendered as the gauge <prefix>_<key>.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        help: str,
+        collect: Callable[[], dict[str, float]],
+        registry: Registry | None = REGISTRY,
+    ):
+        self.prefix = prefix
+        self.help = help
+        self.collect = collect
+        if registry is not None:
+            registry.register(self)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, value in self.collect().items():
+            name = f"{self.prefix}_{key}"
+            lines.append(f"# HELP {name} {self.help}: {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "pws_stage_seconds",
+    "Time spent in each stage of station uploads",
+    ("stage",),
+)
+STATION_UPLOADS = Counter(
+    "pws_station_uploads_total",
+    "Authenticated uploads per station",
+    ("station",),
+)
+UNKNOWN_PARAMETERS = Counter(
+    "pws_unknown_parameters_total",
+    "Upload parameters that are not decoded",
+)
+REJECTED_UPLOADS = Counter(
+    "pws_rejected_uploads_total",
+    "Uploads with an invalid station ID or password",
+)
+RATE_LIMITED_UPLOADS = Counter(
+    "pws_rate_limited_uploads_total",
+    "Uploads rejected by rate limiting, per limit",
+    ("limit",),
+)
+HA_ERRORS = Counter(
+    "pws_ha_errors_total",
+    "Sensor updates not accepted by Home Assistant",
+    ("kind",),
+)
+HA_PUSHES = Counter(
+    "pws_ha_pushes_total",
+    "Sensor states pushed to Home Assistant or suppressed as unchanged",
+    ("outcome",),
+)
+
+# Children of the hot path, resolved once
+REQUEST_SECONDS = STAGE_SECONDS.labels("request")
+AUTHENTICATE_SECONDS = STAGE_SECONDS.labels("authenticate")
+DECODE_SECONDS = STAGE_SECONDS.labels("decode")
+UPDATE_SECONDS = STAGE_SECONDS.labels("update")
+PAYLOADS_SECONDS = STAGE_SECONDS.labels("payloads")
+HA_POST_SECONDS = STAGE_SECONDS.labels("ha_post")
+RATE_LIMITED_ADDRESS = RATE_LIMITED_UPLOADS.labels("address")
+RATE_LIMITED_STATION = RATE_LIMITED_UPLOADS.labels("station")
+HA_FAILURES = HA_ERRORS.labels("error")
+HA_TIMEOUTS = HA_ERRORS.labels("timeout")
+HA_PUSHES_SENT = HA_PUSHES.labels("sent")
+HA_PUSHES_SUPPRESSED = HA_PUSHES.labels("suppressed")
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Any, Callable
+import logging
+import threading
+import time
+
+from pwsproto.station import WeatherStation
+
+
+OVERFLOW_POLICIES = ("drop-oldest", "block", "reject")
+
+
+class PublishQueueFull(Exception):
+    pass
+
+
+class PendingUpdate:
+    def __init__(self, payloads: dict[str, dict[str, Any]], enqueued_at: float):
+        self.payloads = payloads
+        self.enqueued_at = enqueued_at
+
+
+class PublishQueue:
+    """Bounded queue between station updates and their publication.
+
+    Used as a station update callback, it snapshots the station's payloads and
+    returns immediately; worker threads drain the queue into the publish
+    function. Pending updates of a station are coalesced into the latest state
+    of each sensor, and a station is never published by two workers at once.
+
+    When the queue is full, the overflow policy either drops the oldest pending
+    update, blocks the caller until room is available, or rejects the update
+    with PublishQueueFull.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, dict[str, dict[str, Any]]], Any],
+        max_size: int = 1000,
+        workers: int = 1,
+        overflow: str = "drop-oldest",
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.publish = publish
+        self.max_size = max_size
+        self.overflow = overflow
+        self.condition = threading.Condition()
+        self.pending: OrderedDict[str, PendingUpdate] = OrderedDict()
+        self.in_flight: set[str] = set()
+        self.stopping = False
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.published = 0
+        self.last_lag = 0.0
+
+        self.workers = [
+            threading.Thread(target=self.run_worker, name=f"publish-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def __call__(self, station: WeatherStation):
+        self.put(station.id, station.get_ha_payloads())
+
+    def put(self, station_id: str, payloads: dict[str, dict[str, Any]]):
+        with self.condition:
+            self.enqueued += 1
+            pending = self.pending.get(station_id)
+            if pending is not None:
+                pending.payloads.update(payloads)
+                self.coalesced += 1
+                return
+
+            while len(self.pending) >= self.max_size:
+                if self.overflow == "drop-oldest":
+                    dropped_id, _ = self.pending.popitem(last=False)
+                    self.dropped += 1
+                    logging.warning(f"Publish queue full, dropped {dropped_id}")
+                elif self.overflow == "block":
+                    self.condition.wait()
+                else:
+                    self.rejected += 1
+                    raise PublishQueueFull("Publish queue full")
+
+            self.pending[station_id] = PendingUpdate(dict(payloads), time.monotonic())
+            self.condition.notify_all()
+
+    def take(self) -> tuple[str, PendingUpdate] | None:
+        with self.condition:
+            while True:
+                for station_id in self.pending:
+                    if station_id not in self.in_flight:
+                        self.in_flight.add(station_id)
+                        # Wake up callers blocked on a full queue
+                        self.condition.notify_all()
+                        return station_id, self.pending.pop(station_id)
+                if self.stopping and len(self.pending) == 0:
+                    return None
+                self.condition.wait()
+
+    def run_worker(self):
+        while (item := self.take()) is not None:
+            station_id, pending = item
+            self.last_lag = time.monotonic() - pending.enqueued_at
+            try:
+                self.publish(station_id, pending.payloads)
+            except Exception:
+                logging.exception(f"Could not publish station {station_id}")
+            finally:
+                with self.condition:
+                    self.in_flight.discard(station_id)
+                    self.published += 1
+                    self.condition.notify_all()
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    @property
+    def lag(self) -> float:
+        """Age in seconds of the oldest pending update."""
+        with self.condition:
+            if len(self.pending) == 0:
+                return 0.0
+            oldest = next(iter(self.pending.values()))
+            return time.monotonic() - oldest.enqueued_at
+
+    def metrics(self) -> dict[str, float]:
+        return {
+            "depth": self.depth,
+            "lag": self.lag,
+            "last_lag": self.last_lag,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "published": self.published,
+        }
+
+    def stop(self):
+        """Publish the pending updates, then stop the workers."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join()
@@ -6,21 +6,23 @@ import argparse
 import random
 
 from pwsproto.pws_request import pws_to_measurement_dict
+from pwsproto.log import LazyFields, LazyMeasurements, start_queue_logging
+from pwsproto.backends import SERVER_BACKENDS, PreforkWorkers, run_server
+from pwsproto.ingest import PWS_ROUTE
 
 
 def process_request():
     params: FormsDict = request.params  # type: ignore
     params_dict: dict[str, str] = {key: params[key] for key in params}
+    process_params(params_dict)
 
+
+def process_params(params_dict: dict[str, str]):
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
     session_id = random.randint(a=0, b=65536)
 
     station_id: str | None = params_dict.get("ID", None)
-    station_key: str | None = params_dict.get("PASSWORD", None)
-
-    logging.info(f"[{session_id}]: *** Begin Station Update ***")
-    logging.info(
-        f"[{session_id}]: Station ID = {station_id}, Station Key = {station_key}"
-    )
 
     # Exclude ID, password
     params_filtered = {
@@ -31,19 +33,19 @@ def process_request():
 
     measurement_dict, unmatched_params = pws_to_measurement_dict(params_filtered)
 
-    if len(measurement_dict) > 0:
-        logging.info(f"[{session_id}]: Recognized sensors:")
-        for sensor, measurement in measurement_dict.items():
-            logging.info(
-                f"[{session_id}]:   Sensor name = {sensor}; Value = {measurement.value}; Unit = {measurement.unit}"
-            )
-
-    if len(unmatched_params) > 0:
-        logging.info(f"[{session_id}]: Unrecognized parameters:")
-        for param, value in unmatched_params.items():
-            logging.info(f"[{session_id}]:   {param}={value}")
-
-    logging.info(f"[{session_id}]: *** End Station Update ***")
+    # One record per station update, formatted only when emitted. The station
+    # password is never logged.
+    logging.info(
+        "[%d]: Station update from %s\n"
+        "[%d]:   Recognized sensors: %s\n"
+        "[%d]:   Unrecognized parameters: %s",
+        session_id,
+        station_id,
+        session_id,
+        LazyMeasurements(measurement_dict),
+        session_id,
+        LazyFields(unmatched_params),
+    )
 
 
 def main():
@@ -51,21 +53,45 @@ def main():
 
     parser.add_argument("--pws-listen", type=str, required=False, default="127.0.0.1")
     parser.add_argument("--pws-port", type=int, required=False, default=8080)
+    parser.add_argument(
+        "--server-backend", choices=SERVER_BACKENDS, required=False, default="wsgiref"
+    )
+    parser.add_argument("--workers", type=int, required=False, default=4)
+    parser.add_argument("--log-queue", action=argparse.BooleanOptionalAction)
 
     args = parser.parse_args()
 
     app = Bottle()
     app.route(
-        "/weatherstation/updateweatherstation.php",
+        PWS_ROUTE,
         method="GET",
         callback=process_request,
     )
     logging.basicConfig()
     logging.getLogger().setLevel(logging.INFO)
+    # Forked before the logging thread is started
+    prefork_workers = None
+    if args.server_backend == "prefork":
+        prefork_workers = PreforkWorkers(
+            args.pws_listen, args.pws_port, args.workers
+        ).start()
+    log_listener = start_queue_logging() if args.log_queue else None
     try:
-        app.run(host=args.pws_listen, port=args.pws_port)
+        run_server(
+            app,
+            process_params,
+            PWS_ROUTE,
+            backend=args.server_backend,
+            host=args.pws_listen,
+            port=args.pws_port,
+            workers=args.workers,
+            prefork_workers=prefork_workers,
+        )
     except PermissionError as exn:
         logging.error(f"Could not start server: {exn}")
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 import datetime
+import hmac
 import logging
+import re
+import time
+import urllib.parse
 from typing import Any, Callable
-from homeassistant.const import (
+from pwsproto.const import (
     UnitOfPressure,
     UnitOfSpeed,
     UnitOfTemperature,
@@ -14,6 +18,9 @@ from homeassistant.const import (
     CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
 )
 
+from pwsproto import metrics
+from pwsproto.log import LazyFields, LazyMeasurements, WarningRateLimiter
+from pwsproto.ratelimit import Network, RateLimited, TokenBuckets, client_address
 from pwsproto.station import Measurement, WeatherStation
 
 
@@ -29,6 +36,24 @@ def identity(x: str) -> str:
     return x
 
 
+def parse_dateutc(x: str) -> datetime.datetime:
+    """Parse a dateutc value into a timezone-aware UTC datetime.
+
+    Accepts "YYYY-MM-DD HH:MM:SS" (also URL-encoded, e.g. with "+" or "%3A")
+    and "now", which stands for the time of reception.
+    """
+    if "%" in x:
+        x = urllib.parse.unquote(x)
+    if x == "now":
+        return datetime.datetime.now(datetime.timezone.utc)
+    if len(x) > 10 and x[10] == "+":
+        x = f"{x[:10]} {x[11:]}"
+    date = datetime.datetime.fromisoformat(x)
+    if date.tzinfo is None:
+        return date.replace(tzinfo=datetime.timezone.utc)
+    return date.astimezone(datetime.timezone.utc)
+
+
 class ParameterConversion:
     def __init__(
         self,
@@ -47,10 +72,7 @@ class ParameterConversion:
 # Reference: https://support.weather.com/s/article/PWS-Upload-Protocol?language=en_US
 url_param_to_status_dict: dict[str, ParameterConversion] = {
     # Generic fields
-    "dateutc": ParameterConversion(
-        "date",
-        lambda s: datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S"),
-    ),
+    "dateutc": ParameterConversion("date", parse_dateutc),
     "softwaretype": ParameterConversion("software_type", identity),
     # Wind
     "winddir": ParameterConversion("wind_direction", identity, "wind_direction"),
@@ -242,28 +264,97 @@ url_param_to_status_dict: dict[str, ParameterConversion] = {
 }
 
 
+# Numbered extra sensors (temp2f, soiltemp3f, soilmoisture4, leafwetness2...)
+# reuse the conversion of their base parameter; the sensor number is appended to
+# the sensor name (e.g. temp2f -> outdoor_temperature_2). Numbers go from 2 to
+# 16, so that a station cannot create an unbounded number of sensors (each with
+# its own entity and history).
+SENSOR_NUMBER = r"([2-9]|1[0-6])"
+url_param_families: dict[str, str] = {
+    rf"temp{SENSOR_NUMBER}f": "tempf",
+    rf"soiltemp{SENSOR_NUMBER}f": "soiltempf",
+    rf"soilmoisture{SENSOR_NUMBER}": "soilmoisture",
+    rf"leafwetness{SENSOR_NUMBER}": "leafwetness",
+}
+
+
+class PWSDecoder:
+    """Decodes PWS upload parameters into measurements.
+
+    Known parameters are resolved with a single dictionary lookup; numbered
+    sensor families are only tried, as precompiled patterns, for parameters
+    that are not directly known.
+    """
+
+    def __init__(
+        self,
+        params: dict[str, ParameterConversion],
+        families: dict[str, str],
+    ):
+        self.params = dict(params)
+        # All families are matched by one alternation; the index of the group
+        # that matched identifies the family.
+        self.families_pattern = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in families)
+        )
+        self.families = [params[base_param] for base_param in families.values()]
+
+    def lookup(self, param: str) -> ParameterConversion | None:
+        converter = self.params.get(param)
+        if converter is not None:
+            return converter
+        match = self.families_pattern.fullmatch(param)
+        if match is None or match.lastindex is None:
+            return None
+        base = self.families[match.lastindex - 1]
+        return ParameterConversion(
+            f"{base.sensor_name}_{match.group(match.lastindex)}",
+            base.converter,
+            base.reported_unit,
+        )
+
+    def decode(
+        self,
+        fields: dict[str, str],
+    ) -> tuple[dict[str, Measurement], dict[str, str]]:
+        measurement_dict: dict[str, Measurement] = {}
+        unmatched_params: dict[str, str] = {}
+        lookup = self.params.get
+        for given_param, value in fields.items():
+            converter = lookup(given_param)
+            if converter is None:
+                converter = self.lookup(given_param)
+                if converter is None:
+                    unmatched_params[given_param] = value
+                    continue
+            try:
+                measurement_dict[converter.sensor_name] = converter.convert(value)
+            except ValueError as err:
+                logging.warning(f"Parameter error for {given_param}: {err}")
+
+        return measurement_dict, unmatched_params
+
+
+pws_decoder = PWSDecoder(url_param_to_status_dict, url_param_families)
+
+
 def pws_to_measurement_dict(
     fields: dict[str, str],
 ) -> tuple[dict[str, Measurement], dict[str, str]]:
-    measurement_dict: dict[str, Measurement] = {}
-    unmatched_params: dict[str, str] = {}
-    for given_param, value in fields.items():
-        param_matched = False
-        for expected_param in url_param_to_status_dict:
-            if given_param == expected_param:
-                param_matched = True
-                converter = url_param_to_status_dict[expected_param]
-                try:
-                    converted_value = converter.convert(value)
-                    measurement_dict[converter.sensor_name] = converted_value
-                except ValueError as err:
-                    logging.warning(f"Parameter error for {given_param}: {err}")
-                    pass
-                break
-        if not param_matched:
-            unmatched_params[given_param] = value
-
-    return measurement_dict, unmatched_params
+    return pws_decoder.decode(fields)
+
+
+def _password_matches(expected: str, given: str) -> bool:
+    # Constant-time comparison, so that timing does not leak the password.
+    return hmac.compare_digest(expected.encode(), given.encode())
+
+
+class InvalidUpload(ValueError):
+    """An upload that cannot be processed, answered with 400 Bad Request.
+
+    Stations also raise ValueError for uploads without a valid date, which the
+    HTTP front ends answer the same way.
+    """
 
 
 class PWSRequestProcessor:
@@ -271,33 +362,138 @@ class PWSRequestProcessor:
         self,
         stations: list[WeatherStation],
     ):
-        self.stations = stations
+        # Stations indexed by ID; several stations may share the same ID.
+        self.stations_by_id: dict[str, list[WeatherStation]] = {}
+        self.unknown_parameter_warnings = WarningRateLimiter()
+        # When set, uploads are limited per client address (checked by the
+        # HTTP front ends before parsing them) and per authenticated station
+        # ID, before decoding; rejections raise RateLimited.
+        self.address_limiter: TokenBuckets | None = None
+        self.station_limiter: TokenBuckets | None = None
+        # Proxies whose X-Forwarded-For header gives the client address
+        self.trusted_proxies: list[Network] = []
+        for station in stations:
+            self.add_station(station)
+
+    @property
+    def stations(self) -> tuple[WeatherStation, ...]:
+        # A tuple, so that attempts to add stations through it fail instead of
+        # modifying a copy: use add_station/remove_station/replace_stations.
+        return tuple(
+            station for stations in self.stations_by_id.values() for station in stations
+        )
+
+    def add_station(self, station: WeatherStation) -> None:
+        # Station lists are replaced rather than mutated, so that requests being
+        # processed concurrently keep a consistent view.
+        stations = self.stations_by_id.get(station.id, [])
+        self.stations_by_id[station.id] = stations + [station]
+
+    def remove_station(self, station: WeatherStation) -> None:
+        stations = [
+            s for s in self.stations_by_id.get(station.id, []) if s is not station
+        ]
+        if len(stations) == 0:
+            self.stations_by_id.pop(station.id, None)
+        else:
+            self.stations_by_id[station.id] = stations
+
+    def replace_stations(self, stations: list[WeatherStation]) -> None:
+        """Serve the given stations instead of the current ones.
+
+        The new index is built aside and swapped at once: requests being
+        processed complete with the stations they authenticated against.
+        """
+        stations_by_id: dict[str, list[WeatherStation]] = {}
+        for station in stations:
+            stations_by_id.setdefault(station.id, []).append(station)
+        self.stations_by_id = stations_by_id
+
+    def authenticate(self, id: str, password: str) -> list[WeatherStation]:
+        return [
+            station
+            for station in self.stations_by_id.get(id, [])
+            if _password_matches(station.password, password)
+        ]
+
+    def admit_address(
+        self, address: str | None, forwarded_for: str | None = None
+    ) -> None:
+        """Take a token of the client's bucket, the connection being from address.
+
+        forwarded_for is the X-Forwarded-For header, used when address is a
+        trusted proxy.
+        """
+        if self.address_limiter is None:
+            return
+        address = client_address(address, forwarded_for, self.trusted_proxies)
+        if address is None:
+            return
+        retry_after = self.address_limiter.take(address)
+        if retry_after > 0:
+            metrics.RATE_LIMITED_ADDRESS.inc()
+            raise RateLimited(retry_after)
+
+    def warn_unknown_parameters(self, id: str, unmatched_params: dict[str, str]):
+        # One record per upload, each parameter of a station being reported at
+        # most once per interval of the rate limiter.
+        reported = {}
+        suppressed = 0
+        for param, value in unmatched_params.items():
+            count = self.unknown_parameter_warnings.allow((id, param))
+            if count is not None:
+                reported[param] = value
+                suppressed += count
+        if suppressed > 0:
+            logging.warning(
+                "Unknown parameters from %s: %s (%d repeated warnings suppressed)",
+                id,
+                LazyFields(reported),
+                suppressed,
+            )
+        elif len(reported) > 0:
+            logging.warning("Unknown parameters from %s: %s", id, LazyFields(reported))
 
     def process_request(self, params: dict[str, str]) -> None:
         # Grab ID, password
         if "ID" not in params or "PASSWORD" not in params:
-            raise NotImplementedError
+            raise InvalidUpload("Missing station ID/password")
 
-        id = params["ID"]
-        password = params["PASSWORD"]
+        params_filtered = {
+            key: value for key, value in params.items() if key not in ["ID", "PASSWORD"]
+        }
+        self.process_fields(params["ID"], params["PASSWORD"], params_filtered)
 
-        stations_auth = list(
-            filter(
-                lambda station: station.id == id and station.password == password,
-                self.stations,
-            )
-        )
+    def process_fields(self, id: str, password: str, fields: dict[str, str]) -> None:
+        """Process an upload; fields holds the parameters but ID and PASSWORD."""
+        start = time.perf_counter()
+        stations_auth = self.authenticate(id, password)
+        authenticated = time.perf_counter()
+        metrics.AUTHENTICATE_SECONDS.observe(authenticated - start)
 
         if len(stations_auth) == 0:
+            metrics.REJECTED_UPLOADS.inc()
             raise PermissionError("Invalid station ID/password")
+        # Only authenticated uploads count, so that uploads with the ID of a
+        # station but not its password cannot exhaust its bucket.
+        if self.station_limiter is not None:
+            retry_after = self.station_limiter.take(id)
+            if retry_after > 0:
+                metrics.RATE_LIMITED_STATION.inc()
+                raise RateLimited(retry_after)
+        metrics.STATION_UPLOADS.labels(id).inc()
 
-        params_filtered = {
-            key: value for key, value in params.items() if key not in ["ID", "PASSWORD"]
-        }
-        measurement_dict, unmatched_params = pws_to_measurement_dict(params_filtered)
+        measurement_dict, unmatched_params = pws_to_measurement_dict(fields)
+        decoded = time.perf_counter()
+        metrics.DECODE_SECONDS.observe(decoded - authenticated)
 
-        for param, value in unmatched_params.items():
-            logging.warning(f"Unknown parameter: {param}={value}")
+        if len(unmatched_params) > 0:
+            metrics.UNKNOWN_PARAMETERS.inc(len(unmatched_params))
+            if logging.root.isEnabledFor(logging.WARNING):
+                self.warn_unknown_parameters(id, unmatched_params)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("Upload from %s: %s", id, LazyMeasurements(measurement_dict))
 
         for station in stations_auth:
             station.update_measurement(measurement_dict)
+        metrics.UPDATE_SECONDS.observe(time.perf_counter() - decoded)
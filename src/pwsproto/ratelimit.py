@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import ipaddress
+import math
+import threading
+import time
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Too many requests")
+        # Seconds until the next request may be accepted
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(math.ceil(self.retry_after))
+
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+def _is_trusted(address: str, trusted_proxies: list[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_address(
+    address: str | None,
+    forwarded_for: str | None,
+    trusted_proxies: list[Network],
+) -> str | None:
+    """The address of the client of a connection from the given address.
+
+    Behind trusted proxies, the X-Forwarded-For header lists the client and the
+    proxies it went through: it is read from the nearest hop, and the first one
+    that is not a trusted proxy is the client. Earlier hops may be forged by
+    the client and are ignored.
+    """
+    if address is None or not trusted_proxies or forwarded_for is None:
+        return address
+    if not _is_trusted(address, trusted_proxies):
+        return address
+    hops = [hop.strip() for hop in forwarded_for.split(",")]
+    for hop in reversed(hops):
+        if hop and not _is_trusted(hop, trusted_proxies):
+            return hop
+    # Only trusted proxies: the farthest one is the client
+    return hops[0] or address
+
+
+class TokenBuckets:
+    """Token bucket per key, refilled with rate tokens per second up to burst.
+
+    The buckets of at most max_keys keys are kept, least recently used keys
+    being evicted first: a key seen again after its eviction starts with a
+    full bucket, so that a scan of random keys takes bounded memory.
+    """
+
+    def __init__(self, rate: float, burst: float = 10.0, max_keys: int = 10000):
+        if rate <= 0:
+            raise ValueError("The rate must be positive")
+        if burst < 1:
+            raise ValueError("The burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        # Key: (tokens, time of the last refill)
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """Take a token of the key's bucket.
+
+        Returns 0 if there was one, else the seconds until there is one.
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self.buckets.popitem(last=False)
+                self.buckets[key] = (self.burst - 1, now)
+                return 0.0
+            self.buckets.move_to_end(key)
+            tokens, last = bucket
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return 0.0
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
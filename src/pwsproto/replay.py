@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+from bottle import Bottle, request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, TextIO
+import argparse
+import functools
+import gzip
+import logging
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from pwsproto.backends import SERVER_BACKENDS, PreforkWorkers, run_server
+from pwsproto.ha_http_client import UpdateHAAPI
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.pipeline import PublishQueue
+from pwsproto.server import PWS_ROUTE, RequestProcessor
+from pwsproto.station import WeatherStation
+
+
+# Uploads are stored in gzip-compressed text files, one upload per line:
+# <seconds since the first upload>\t<raw query string>
+
+
+class UploadWriter:
+    def __init__(self, path: str):
+        self.file: TextIO = gzip.open(path, "wt", encoding="utf-8")
+        self.start: float | None = None
+        self.lock = threading.Lock()
+
+    def write(self, query_string: str, timestamp: float | None = None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.lock:
+            if self.start is None:
+                self.start = timestamp
+            self.file.write(f"{timestamp - self.start:.3f}\t{query_string}\n")
+
+    def close(self):
+        self.file.close()
+
+
+def read_uploads(path: str) -> Iterator[tuple[float, str]]:
+    with gzip.open(path, "rt", encoding="utf-8") as uploads_file:
+        for line in uploads_file:
+            offset, _, query_string = line.rstrip("\n").partition("\t")
+            if query_string:
+                yield float(offset), query_string
+
+
+def rename_station(query_string: str, suffix: str) -> str:
+    """Query string with the station ID suffixed, for larger fleets."""
+    params = urllib.parse.parse_qsl(query_string, keep_blank_values=True)
+    return urllib.parse.urlencode(
+        [(key, value + suffix if key == "ID" else value) for key, value in params]
+    )
+
+
+def fleet_uploads(path: str, stations: int) -> list[tuple[float, str]]:
+    """Uploads of the file, repeated for each of the stations copies."""
+    uploads = list(read_uploads(path))
+    if stations <= 1:
+        return uploads
+    return [
+        (offset, rename_station(query_string, f"-{copy}"))
+        for offset, query_string in uploads
+        for copy in range(stations)
+    ]
+
+
+def station_credentials(uploads: list[tuple[float, str]]) -> dict[str, str]:
+    credentials = {}
+    for _, query_string in uploads:
+        params = dict(urllib.parse.parse_qsl(query_string, keep_blank_values=True))
+        if "ID" in params and "PASSWORD" in params:
+            credentials[params["ID"]] = params["PASSWORD"]
+    return credentials
+
+
+# Capture
+
+
+def capture(args: argparse.Namespace):
+    """Record the query strings of the uploads received by a PWS endpoint."""
+    writer = UploadWriter(args.output)
+
+    def record_upload():
+        writer.write(request.query_string)
+        return "success\n"
+
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=record_upload)
+    try:
+        app.run(host=args.pws_listen, port=args.pws_port, quiet=True)
+    finally:
+        writer.close()
+
+
+# Synthesis
+
+
+class SyntheticStation:
+    """Station whose measurements drift slowly around daily cycles."""
+
+    def __init__(self, id: str, password: str, rng: random.Random):
+        self.id = id
+        self.password = password
+        self.rng = rng
+        self.mean_temperature = rng.uniform(40.0, 75.0)
+        self.pressure = rng.uniform(29.6, 30.3)
+        self.humidity = rng.uniform(40.0, 90.0)
+        self.wind_direction = rng.uniform(0.0, 360.0)
+        self.wind_speed = rng.uniform(0.0, 10.0)
+        self.rain_daily = 0.0
+
+    def upload(self, timestamp: float) -> str:
+        rng = self.rng
+        hour = timestamp % 86400 / 3600
+        if hour < 1 / 60:
+            self.rain_daily = 0.0
+        # Random walks, pulled back towards plausible values
+        self.pressure += rng.gauss(0, 0.002) + (30.0 - self.pressure) * 0.001
+        self.humidity = min(100.0, max(5.0, self.humidity + rng.gauss(0, 0.5)))
+        self.wind_direction = (self.wind_direction + rng.gauss(0, 10)) % 360
+        self.wind_speed = max(0.0, self.wind_speed + rng.gauss(0, 0.8))
+        if rng.random() < 0.01:
+            self.rain_daily += rng.uniform(0.0, 0.05)
+        temperature = (
+            self.mean_temperature
+            - 8 * math.cos((hour - 3) / 24 * 2 * math.pi)
+            + rng.gauss(0, 0.2)
+        )
+        dew_point = temperature - (100 - self.humidity) / 2.8
+        params = {
+            "ID": self.id,
+            "PASSWORD": self.password,
+            "dateutc": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp)),
+            "winddir": f"{self.wind_direction:.0f}",
+            "windspeedmph": f"{self.wind_speed:.1f}",
+            "windgustmph": f"{self.wind_speed * rng.uniform(1.0, 1.8):.1f}",
+            "tempf": f"{temperature:.1f}",
+            "dewptf": f"{dew_point:.1f}",
+            "humidity": f"{self.humidity:.0f}",
+            "baromin": f"{self.pressure:.2f}",
+            "dailyrainin": f"{self.rain_daily:.2f}",
+            "softwaretype": "pwsproto-synth",
+            "action": "updateraw",
+        }
+        return urllib.parse.urlencode(params)
+
+
+def synthesize(args: argparse.Namespace):
+    """Write the uploads of a synthetic fleet, sending every interval seconds."""
+    rng = random.Random(args.seed)
+    stations = [
+        SyntheticStation(f"SYNTH{i}", f"KEY{i}", rng) for i in range(args.stations)
+    ]
+    start = time.time() if args.start is None else args.start
+    # Stations do not upload in lockstep
+    phases = [rng.uniform(0, args.interval) for _ in stations]
+    uploads = sorted(
+        (index * args.interval + phase, station)
+        for index in range(args.uploads)
+        for phase, station in zip(phases, stations)
+    )
+    writer = UploadWriter(args.output)
+    try:
+        for offset, station in uploads:
+            writer.write(station.upload(start + offset), timestamp=offset)
+    finally:
+        writer.close()
+
+
+# Server under test
+
+
+def serve(args: argparse.Namespace):
+    """Serve the stations of an uploads file, publishing to a stub HA."""
+    uploads = fleet_uploads(args.uploads, args.stations)
+    # Forked before the threads of the stub and the publish queue are started
+    prefork_workers = None
+    if args.server_backend == "prefork":
+        prefork_workers = PreforkWorkers(
+            args.pws_listen, args.pws_port, args.workers
+        ).start()
+    ha_stub = HAStubServer().start()
+    update_ha_api = UpdateHAAPI("token", "127.0.0.1", ha_port=ha_stub.port)
+    publish_queue = PublishQueue(
+        functools.partial(update_ha_api.publish, wait_completion=True)
+    )
+    stations = [
+        WeatherStation(id, password, update_callback=publish_queue)
+        for id, password in station_credentials(uploads).items()
+    ]
+    request_processor = RequestProcessor(stations)
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=request_processor)
+    try:
+        run_server(
+            app,
+            request_processor.handle,
+            PWS_ROUTE,
+            backend=args.server_backend,
+            host=args.pws_listen,
+            port=args.pws_port,
+            workers=args.workers,
+            processor=request_processor,
+            prefork_workers=prefork_workers,
+        )
+    finally:
+        ha_stub.stop()
+
+
+def start_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "pwsproto.replay",
+            "serve",
+            args.uploads,
+            f"--stations={args.stations}",
+            f"--pws-port={port}",
+            f"--server-backend={args.server_backend}",
+            f"--workers={args.workers}",
+        ],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.terminate()
+                raise RuntimeError("Server under test did not start")
+            time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+# Replay
+
+
+class ReplayReport:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.elapsed = 0.0
+
+    def record(self, latency: float, status: str):
+        with self.lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if status != "200")
+
+    def percentile(self, percentile: float) -> float:
+        latencies = sorted(self.latencies)
+        if len(latencies) == 0:
+            return 0.0
+        index = min(
+            len(latencies) - 1, math.ceil(percentile / 100 * len(latencies)) - 1
+        )
+        return latencies[max(0, index)]
+
+    def summary(self) -> str:
+        count = len(self.latencies)
+        lines = [
+            f"uploads:    {count} in {self.elapsed:.2f} s "
+            f"({count / self.elapsed if self.elapsed > 0 else 0:.1f} uploads/s)",
+            f"latency:    mean {statistics.fmean(self.latencies) * 1e3 if count else 0:.2f} ms, "
+            + ", ".join(
+                f"p{percentile} {self.percentile(percentile) * 1e3:.2f} ms"
+                for percentile in (50, 90, 99)
+            )
+            + f", max {max(self.latencies, default=0) * 1e3:.2f} ms",
+            f"errors:     {self.errors} ({self.errors / count * 100 if count else 0:.2f}%)",
+        ]
+        lines.extend(
+            f"  status {status}: {count}"
+            for status, count in sorted(self.statuses.items())
+        )
+        return "\n".join(lines)
+
+
+def replay_uploads(
+    uploads: list[tuple[float, str]],
+    url: str,
+    rate: float | None = None,
+    speed: float = 1.0,
+    concurrency: int = 16,
+    rewrite_date: bool = False,
+    timeout: float = 10.0,
+) -> ReplayReport:
+    """Send the uploads to the PWS endpoint at url.
+
+    Uploads are sent at the given rate (uploads per second, 0 for as fast as
+    possible), or else at their recorded pace accelerated by speed. Paced
+    latencies are measured from the time each upload was due, so that a server
+    falling behind the schedule shows in the latencies.
+    """
+    report = ReplayReport()
+    sessions = threading.local()
+    endpoint = url.rstrip("/") + PWS_ROUTE
+
+    def send(due: float | None, query_string: str):
+        if due is None:
+            due = time.perf_counter()
+        session = getattr(sessions, "session", None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        if rewrite_date:
+            query_string = "&".join(
+                "dateutc=now" if param.startswith("dateutc=") else param
+                for param in query_string.split("&")
+            )
+        try:
+            response = session.get(f"{endpoint}?{query_string}", timeout=timeout)
+            status = str(response.status_code)
+        except requests.RequestException as err:
+            status = type(err).__name__
+        report.record(time.perf_counter() - due, status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, (offset, query_string) in enumerate(uploads):
+            if rate is None:
+                due = start + offset / speed
+            elif rate > 0:
+                due = start + i / rate
+            else:
+                executor.submit(send, None, query_string)
+                continue
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, due, query_string)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def replay(args: argparse.Namespace):
+    uploads = fleet_uploads(args.uploads, args.stations)
+    if args.count is not None:
+        uploads = uploads[: args.count]
+    server = None
+    url = args.url
+    if args.start_server:
+        server, url = start_server(args)
+    try:
+        report = replay_uploads(
+            uploads,
+            url,
+            rate=args.rate,
+            speed=args.speed,
+            concurrency=args.concurrency,
+            rewrite_date=args.rewrite_date,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(report.summary())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = subparsers.add_parser("capture")
+    capture_parser.add_argument("output", type=str)
+    capture_parser.add_argument(
+        "--pws-listen", type=str, required=False, default="127.0.0.1"
+    )
+    capture_parser.add_argument("--pws-port", type=int, required=False, default=8080)
+    capture_parser.set_defaults(function=capture)
+
+    synth_parser = subparsers.add_parser("synth")
+    synth_parser.add_argument("output", type=str)
+    synth_parser.add_argument("--stations", type=int, required=False, default=10)
+    synth_parser.add_argument("--uploads", type=int, required=False, default=100)
+    synth_parser.add_argument("--interval", type=float, required=False, default=16.0)
+    synth_parser.add_argument("--start", type=float, required=False)
+    synth_parser.add_argument("--seed", type=int, required=False, default=0)
+    synth_parser.set_defaults(function=synthesize)
+
+    for name, function in (("replay", replay), ("serve", serve)):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("uploads", type=str)
+        subparser.add_argument("--stations", type=int, required=False, default=1)
+        subparser.add_argument(
+            "--server-backend",
+            choices=SERVER_BACKENDS,
+            required=False,
+            default="threaded",
+        )
+        subparser.add_argument("--workers", type=int, required=False, default=4)
+        subparser.set_defaults(function=function)
+        if name == "serve":
+            subparser.add_argument(
+                "--pws-listen", type=str, required=False, default="127.0.0.1"
+            )
+            subparser.add_argument("--pws-port", type=int, required=False, default=8080)
+            continue
+        subparser.add_argument(
+            "--url", type=str, required=False, default="http://127.0.0.1:8080"
+        )
+        subparser.add_argument("--start-server", action=argparse.BooleanOptionalAction)
+        subparser.add_argument("--rate", type=float, required=False)
+        subparser.add_argument("--speed", type=float, required=False, default=1.0)
+        subparser.add_argument("--concurrency", type=int, required=False, default=16)
+        subparser.add_argument("--count", type=int, required=False)
+        subparser.add_argument("--rewrite-date", action=argparse.BooleanOptionalAction)
+
+    args = parser.parse_args()
+    logging.basicConfig()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
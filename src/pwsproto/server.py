@@ -1,13 +1,33 @@
 #!/usr/bin/env python3
 
-from bottle import Bottle, FormsDict, HTTPError, request
+from bottle import Bottle, FormsDict, HTTPError, request, response
+import functools
+import ipaddress
 import logging
-import os
+import time
 import argparse
 
 from pwsproto.station import WeatherStation
-from pwsproto.ha_http_client import UpdateHAAPI
 from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.pipeline import OVERFLOW_POLICIES, PublishQueueFull
+from pwsproto.backends import SERVER_BACKENDS, PreforkWorkers, run_server
+from pwsproto.units import UNIT_SYSTEMS
+from pwsproto.history import HistoryEvictor, HistoryLocked, HistoryStore
+from pwsproto.config import (
+    Config,
+    ConfigError,
+    ConfigWatcher,
+    PolicyConfig,
+    StationConfig,
+    StationFleet,
+    TargetConfig,
+    load_config,
+    parse_sensor_units,
+)
+from pwsproto import metrics
+from pwsproto.log import start_queue_logging
+from pwsproto.ingest import PWS_ROUTE, IngestApp
+from pwsproto.ratelimit import RateLimited, TokenBuckets
 
 
 class RequestProcessor(PWSRequestProcessor):
@@ -18,64 +38,275 @@ class RequestProcessor(PWSRequestProcessor):
         super().__init__(stations)
 
     def __call__(self):
-        params: FormsDict = request.params  # type: ignore
-        params_dict: dict[str, str] = {key: params[key] for key in params}
+        start = time.perf_counter()
+        try:
+            # Rejected before the parameters are parsed
+            self.admit_address(
+                request.environ.get("REMOTE_ADDR"),
+                request.environ.get("HTTP_X_FORWARDED_FOR"),
+            )
+            params: FormsDict = request.params  # type: ignore
+            params_dict: dict[str, str] = {key: params[key] for key in params}
+            self.handle(params_dict)
+        except RateLimited as e:
+            # A plain response rather than Bottle's error page
+            response.status = 429
+            response.set_header("Retry-After", e.retry_after_header)
+            return str(e)
+        finally:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+    def handle(self, params_dict: dict[str, str]):
         try:
             self.process_request(params_dict)
         except PermissionError as e:
             raise HTTPError(status=403, body=str(e))
+        except PublishQueueFull as e:
+            raise HTTPError(status=503, body=str(e))
+        except ValueError as e:
+            # Missing station ID/password, or invalid date
+            raise HTTPError(status=400, body=str(e))
+
+
+def metrics_endpoint() -> str:
+    response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+    return metrics.REGISTRY.render()
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--ha-host", type=str, required=True)
+    parser.add_argument("--config", type=str, required=False)
+    parser.add_argument(
+        "--config-poll-interval", type=float, required=False, default=5.0
+    )
+    parser.add_argument("--ha-host", type=str, required=False)
     parser.add_argument("--ha-port", type=int, required=False, default=8123)
     parser.add_argument("--ha-use-https", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ha-pool-size", type=int, required=False, default=10)
+    parser.add_argument("--ha-retries", type=int, required=False, default=0)
+    parser.add_argument("--ha-concurrency", type=int, required=False, default=4)
+    parser.add_argument("--ha-deadline", type=float, required=False, default=10.0)
+    parser.add_argument("--ha-wait", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ha-delta", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ha-heartbeat", type=float, required=False, default=300.0)
+    parser.add_argument("--ha-batch-path", type=str, required=False)
+
+    parser.add_argument("--publish-queue-size", type=int, required=False, default=1000)
+    parser.add_argument("--publish-workers", type=int, required=False, default=1)
+    parser.add_argument(
+        "--publish-overflow",
+        choices=OVERFLOW_POLICIES,
+        required=False,
+        default="drop-oldest",
+    )
+    parser.add_argument("--spool-dir", type=str, required=False)
 
     parser.add_argument("--pws-listen", type=str, required=False, default="127.0.0.1")
     parser.add_argument("--pws-port", type=int, required=False, default=8080)
+    parser.add_argument(
+        "--server-backend", choices=SERVER_BACKENDS, required=False, default="wsgiref"
+    )
+    parser.add_argument("--workers", type=int, required=False, default=4)
+    parser.add_argument("--wsgi-ingest", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--rate-limit-address", type=float, required=False, default=0.0)
+    parser.add_argument("--rate-limit-station", type=float, required=False, default=0.0)
+    parser.add_argument("--rate-limit-burst", type=float, required=False, default=10.0)
+    parser.add_argument("--rate-limit-keys", type=int, required=False, default=10000)
+    parser.add_argument(
+        "--trusted-proxy", type=str, action="append", required=False, default=[]
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        required=False,
+        default="WARNING",
+    )
+    parser.add_argument("--log-queue", action=argparse.BooleanOptionalAction)
 
-    parser.add_argument("--pws-station-id", type=str, required=True)
-    parser.add_argument("--pws-station-password", type=str, required=True)
+    parser.add_argument("--pws-station-id", type=str, required=False)
+    parser.add_argument("--pws-station-password", type=str, required=False)
+    parser.add_argument(
+        "--unit-system",
+        choices=list(UNIT_SYSTEMS),
+        required=False,
+        default="native",
+    )
+    parser.add_argument(
+        "--sensor-unit", type=str, action="append", required=False, default=[]
+    )
+    parser.add_argument("--history-dir", type=str, required=False)
+    parser.add_argument(
+        "--history-max-idle", type=float, required=False, default=3600.0
+    )
+    parser.add_argument("--derive", action=argparse.BooleanOptionalAction)
 
     args = parser.parse_args()
 
-    # Standalone mode: HomeAssistant API Updater
+    logging.basicConfig(level=args.log_level)
 
-    # Get HA long-lived token
-    if "LLT" not in os.environ:
-        logging.error("Set the LLT environment variable")
-        exit(1)
+    if args.config is None and (
+        args.ha_host is None
+        or args.pws_station_id is None
+        or args.pws_station_password is None
+    ):
+        parser.error(
+            "--ha-host, --pws-station-id and --pws-station-password are "
+            "required without --config"
+        )
 
-    LLT = os.environ["LLT"]
+    if args.rate_limit_burst < 1:
+        parser.error("--rate-limit-burst must be at least 1")
+    try:
+        trusted_proxies = [
+            ipaddress.ip_network(proxy, strict=False) for proxy in args.trusted_proxy
+        ]
+    except ValueError as err:
+        parser.error(f"Invalid --trusted-proxy: {err}")
+    try:
+        sensor_units = parse_sensor_units(args.sensor_unit)
+    except ConfigError as err:
+        parser.error(str(err))
 
-    update_ha_api = UpdateHAAPI(
-        LLT=LLT,
-        ha_host=args.ha_host,
-        ha_port=args.ha_port,
-        ha_use_https=args.ha_use_https,
+    # Command line options are the defaults of the configuration file
+    default_target = None
+    if args.ha_host is not None:
+        default_target = TargetConfig(
+            host=args.ha_host,
+            port=args.ha_port,
+            use_https=bool(args.ha_use_https),
+            pool_size=args.ha_pool_size,
+            retries=args.ha_retries,
+            concurrency=args.ha_concurrency,
+            deadline=args.ha_deadline,
+            wait=bool(args.ha_wait),
+            delta=args.ha_delta is not False,
+            heartbeat=args.ha_heartbeat,
+            batch_path=args.ha_batch_path,
+        )
+    default_policy = PolicyConfig(
+        queue_size=args.publish_queue_size,
+        workers=args.publish_workers,
+        overflow=args.publish_overflow,
+        spool_dir=args.spool_dir,
     )
-
-    # Initialize stations
-    station = WeatherStation(
-        id=args.pws_station_id,
-        password=args.pws_station_password,
-        update_callback=update_ha_api,
+    load = functools.partial(
+        load_config, default_target=default_target, default_policy=default_policy
     )
-    stations: list[WeatherStation] = [station]
+
+    try:
+        if args.config is not None:
+            config = load(args.config)
+        else:
+            assert default_target is not None
+            config = Config(
+                targets={"default": default_target},
+                policies={"default": default_policy},
+                stations=[
+                    StationConfig(
+                        name=args.pws_station_id,
+                        id=args.pws_station_id,
+                        password=args.pws_station_password,
+                        unit_system=args.unit_system,
+                        sensor_units=sensor_units,
+                        derive=bool(args.derive),
+                    )
+                ],
+            )
+    except ConfigError as err:
+        logging.error(f"Invalid configuration: {err}")
+        exit(1)
+
+    # The server processes are forked before any thread is started
+    prefork_workers = None
+    if args.server_backend == "prefork":
+        prefork_workers = PreforkWorkers(
+            args.pws_listen, args.pws_port, args.workers
+        ).start()
+
+    # Keep the history of measurements
+    history = None
+    if args.history_dir is not None:
+        history = HistoryStore(args.history_dir)
+        try:
+            # Not shared with a backfill writing to the same directory
+            history.lock_directory()
+        except HistoryLocked as err:
+            logging.error(str(err))
+            if prefork_workers is not None:
+                prefork_workers.stop()
+            exit(1)
+
+    request_processor = RequestProcessor([])
+    request_processor.trusted_proxies = trusted_proxies
+    # Uploads per second of each client address and station, 0 for no limit
+    if args.rate_limit_address > 0:
+        request_processor.address_limiter = TokenBuckets(
+            args.rate_limit_address, args.rate_limit_burst, args.rate_limit_keys
+        )
+    if args.rate_limit_station > 0:
+        request_processor.station_limiter = TokenBuckets(
+            args.rate_limit_station, args.rate_limit_burst, args.rate_limit_keys
+        )
+    fleet = StationFleet(request_processor, history)
+    try:
+        fleet.apply(config)
+    except ConfigError as err:
+        # Home Assistant tokens are missing
+        logging.error(str(err))
+        if prefork_workers is not None:
+            prefork_workers.stop()
+        exit(1)
+
+    # Write logs from a separate thread rather than from request threads
+    log_listener = start_queue_logging() if args.log_queue else None
+
+    # Drop the sensors of stations that stopped uploading from memory
+    evictor = None
+    if history is not None and args.history_max_idle > 0:
+        evictor = HistoryEvictor(history, args.history_max_idle).start()
+
+    watcher = None
+    if args.config is not None:
+        watcher = ConfigWatcher(
+            args.config, load, fleet, poll_interval=args.config_poll_interval
+        ).start()
 
     # Create and run server
-    request_processor = RequestProcessor(stations)
     app = Bottle()
     app.route(
-        "/weatherstation/updateweatherstation.php",
+        PWS_ROUTE,
         method="GET",
         callback=request_processor,
     )
+    app.route("/metrics", method="GET", callback=metrics_endpoint)
+    wsgi_app = app
+    if args.wsgi_ingest:
+        # Uploads bypass Bottle, which still serves the other routes
+        wsgi_app = IngestApp(request_processor, fallback=app)
     try:
-        app.run(host=args.pws_listen, port=args.pws_port)
+        run_server(
+            wsgi_app,
+            request_processor.handle,
+            PWS_ROUTE,
+            backend=args.server_backend,
+            host=args.pws_listen,
+            port=args.pws_port,
+            workers=args.workers,
+            processor=request_processor,
+            prefork_workers=prefork_workers,
+        )
     except PermissionError as exn:
         logging.error(f"Could not start server: {exn}")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        if evictor is not None:
+            evictor.stop()
+        fleet.close()
+        if history is not None:
+            history.close()
+        if log_listener is not None:
+            log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,354 @@
+from pathlib import Path
+from typing import Any, Callable
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from pwsproto.ha_http_client import PublishRejected
+from pwsproto.station import WeatherStation
+
+
+SEGMENT_NAME = re.compile(r"([0-9]+)\.log")
+DEAD_LETTERS_NAME = "dead-letters.log"
+
+
+class PublishSpool:
+    """Durable append-only log between station updates and their publication.
+
+    Used as a station update callback, it appends the station's payloads to
+    the current segment file (<directory>/<n>.log, one JSON record per line)
+    and returns. Segments are fsynced at most every fsync interval, outside
+    the lock taken by put(). A replay thread publishes the records in order,
+    and deletes the segments it has fully published. Its position is kept in
+    <directory>/cursor, so that records not published yet are replayed after
+    a restart.
+
+    publish returns False when it should be retried (Home Assistant
+    unavailable): failed publications are retried with an exponential
+    backoff. Records it raises an exception for are rejected for good, and
+    moved to <directory>/dead-letters.log so that they do not block the
+    records behind them.
+
+    When the unpublished backlog exceeds compact_size bytes, the replay thread
+    compacts it into a single segment holding the latest payload of each
+    sensor, while new records go to the next segment.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, dict[str, dict[str, Any]]], bool],
+        directory: str | Path,
+        segment_size: int = 1 << 20,
+        compact_size: int = 16 << 20,
+        fsync_interval: float = 1.0,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.publish = publish
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.compact_size = compact_size
+        self.fsync_interval = fsync_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+
+        self.spooled = 0
+        self.replayed = 0
+        self.retried = 0
+        self.dead_letters = 0
+        self.compactions = 0
+        # Backlog left by the last compaction, which is not compacted again
+        self.compacted_size = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.recover()
+        self.worker = threading.Thread(
+            target=self.run_replay, name="spool", daemon=True
+        )
+        self.worker.start()
+
+    def segment_path(self, number: int) -> Path:
+        return self.directory / f"{number}.log"
+
+    def recover(self):
+        """Resume from the segments and cursor left by a previous run."""
+        segments = []
+        for path in self.directory.iterdir():
+            match = SEGMENT_NAME.fullmatch(path.name)
+            if match is not None:
+                segments.append(int(match.group(1)))
+        segments.sort()
+
+        cursor_segment, cursor_offset = 0, 0
+        cursor_path = self.directory / "cursor"
+        if cursor_path.exists():
+            try:
+                cursor_segment, cursor_offset = map(
+                    int, cursor_path.read_text().split()
+                )
+            except ValueError:
+                logging.warning(f"Ignoring invalid spool cursor {cursor_path}")
+        for number in [number for number in segments if number < cursor_segment]:
+            self.segment_path(number).unlink()
+            segments.remove(number)
+        if len(segments) == 0 or segments[0] != cursor_segment:
+            cursor_offset = 0
+
+        # Append to a new segment rather than after a possibly torn record
+        self.segments = segments
+        self.write_segment = segments[-1] + 1 if len(segments) > 0 else 0
+        self.segments.append(self.write_segment)
+        self.writer = open(self.segment_path(self.write_segment), "ab")
+        self.unsynced = False
+        self.last_sync = time.monotonic()
+
+        self.read_segment = self.segments[0]
+        self.read_offset = cursor_offset
+        self.reader = open(self.segment_path(self.read_segment), "rb")
+        self.reader.seek(cursor_offset)
+        self.backlog = (
+            sum(self.segment_path(number).stat().st_size for number in segments)
+            - cursor_offset
+        )
+        if self.backlog > 0:
+            logging.info(f"Spool: {self.backlog} bytes to replay")
+
+    def __call__(self, station: WeatherStation):
+        self.put(station.id, station.get_ha_payloads())
+
+    def put(self, station_id: str, payloads: dict[str, dict[str, Any]]):
+        record = json.dumps({"station_id": station_id, "payloads": payloads}) + "\n"
+        data = record.encode()
+        descriptors = []
+        with self.condition:
+            if self.writer.tell() >= self.segment_size:
+                descriptors.append(self.roll())
+            self.writer.write(data)
+            self.writer.flush()
+            self.unsynced = True
+            if time.monotonic() - self.last_sync >= self.fsync_interval:
+                descriptors.append(self.take_unsynced())
+            self.backlog += len(data)
+            self.spooled += 1
+            self.condition.notify_all()
+        self.sync(descriptors)
+
+    def roll(self) -> int | None:
+        """Start the next segment; returns take_unsynced() of the previous one."""
+        descriptor = self.take_unsynced()
+        self.writer.close()
+        self.write_segment += 1
+        self.segments.append(self.write_segment)
+        self.writer = open(self.segment_path(self.write_segment), "ab")
+        return descriptor
+
+    def take_unsynced(self) -> int | None:
+        """A descriptor of the segment written to if it needs to be fsynced.
+
+        Called with the lock held, the descriptor being synced by sync() once
+        the lock is released.
+        """
+        self.last_sync = time.monotonic()
+        if not self.unsynced:
+            return None
+        self.unsynced = False
+        return os.dup(self.writer.fileno())
+
+    @staticmethod
+    def sync(descriptors: list[int | None]):
+        for descriptor in descriptors:
+            if descriptor is not None:
+                try:
+                    os.fsync(descriptor)
+                finally:
+                    os.close(descriptor)
+
+    def next_record(self) -> tuple[str, dict[str, dict[str, Any]], int] | None:
+        """Next record to publish, with its size; None when stopping."""
+        while not self.stopping.is_set():
+            if self.backlog > max(self.compact_size, 2 * self.compacted_size):
+                self.compact()
+            with self.condition:
+                line = self.reader.readline()
+                if line.endswith(b"\n"):
+                    try:
+                        record = json.loads(line)
+                        return record["station_id"], record["payloads"], len(line)
+                    except (ValueError, KeyError):
+                        logging.warning(
+                            f"Skipping invalid record in spool segment "
+                            f"{self.read_segment}"
+                        )
+                        self.advance(len(line))
+                        continue
+                if self.read_segment != self.write_segment:
+                    # End of a finished segment, possibly with a torn record
+                    self.backlog -= len(line)
+                    self.next_segment()
+                    continue
+                self.reader.seek(self.read_offset)
+                self.condition.wait(timeout=self.fsync_interval)
+                descriptor = self.take_unsynced()
+            self.sync([descriptor])
+        return None
+
+    def next_segment(self):
+        self.reader.close()
+        self.segment_path(self.read_segment).unlink()
+        self.segments.remove(self.read_segment)
+        self.read_segment = self.segments[0]
+        self.read_offset = 0
+        self.reader = open(self.segment_path(self.read_segment), "rb")
+        self.save_cursor()
+
+    def advance(self, size: int):
+        self.read_offset += size
+        self.backlog -= size
+        self.save_cursor()
+
+    def save_cursor(self):
+        # Not fsynced: after a crash, at worst records already published are
+        # published again.
+        cursor_path = self.directory / "cursor"
+        temporary_path = self.directory / "cursor.tmp"
+        temporary_path.write_text(f"{self.read_segment} {self.read_offset}")
+        os.replace(temporary_path, cursor_path)
+
+    def compact(self):
+        """Replace the backlog by the latest payload of each sensor.
+
+        The segments of the backlog are no longer written to once the
+        compaction starts, so they are read and replaced without the lock.
+        """
+        with self.condition:
+            # The compacted segment comes before the one now written to
+            number = self.write_segment + 1
+            self.write_segment += 1
+            descriptor = self.roll()
+            compacted = self.segments[:-1]
+            backlog = self.backlog
+        self.sync([descriptor])
+
+        latest: dict[str, dict[str, dict[str, Any]]] = {}
+        self.reader.seek(self.read_offset)
+        for line in self.reader:
+            self.merge_record(latest, line)
+        for old_number in compacted:
+            if old_number > self.read_segment:
+                with open(self.segment_path(old_number), "rb") as segment_file:
+                    for line in segment_file:
+                        self.merge_record(latest, line)
+
+        temporary_path = self.directory / "compact.tmp"
+        with open(temporary_path, "wb") as segment_file:
+            for station_id, payloads in latest.items():
+                segment_file.write(
+                    json.dumps(
+                        {"station_id": station_id, "payloads": payloads}
+                    ).encode()
+                    + b"\n"
+                )
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+            compacted_size = segment_file.tell()
+        os.replace(temporary_path, self.segment_path(number))
+
+        self.reader.close()
+        for old_number in compacted:
+            self.segment_path(old_number).unlink()
+        with self.condition:
+            self.segments = [number] + self.segments[len(compacted) :]
+            self.read_segment = number
+            self.read_offset = 0
+            self.reader = open(self.segment_path(number), "rb")
+            # Records put meanwhile are not compacted
+            self.backlog += compacted_size - backlog
+            self.compacted_size = compacted_size
+            self.save_cursor()
+            self.compactions += 1
+        logging.info(f"Spool compacted to {len(latest)} station(s)")
+
+    def merge_record(self, latest: dict[str, dict[str, dict[str, Any]]], line: bytes):
+        if not line.endswith(b"\n"):
+            return
+        try:
+            record = json.loads(line)
+            latest.setdefault(record["station_id"], {}).update(record["payloads"])
+        except (ValueError, KeyError):
+            pass
+
+    def run_replay(self):
+        backoff = self.backoff_initial
+        while (record := self.next_record()) is not None:
+            station_id, payloads, size = record
+            published = self.try_publish(station_id, payloads)
+            if published is not False:
+                with self.condition:
+                    self.advance(size)
+                    if published:
+                        self.replayed += 1
+                    else:
+                        self.dead_letters += 1
+                backoff = self.backoff_initial
+                continue
+            self.retried += 1
+            logging.warning(
+                f"Could not publish station {station_id}, retrying in {backoff}s"
+            )
+            if self.stopping.wait(backoff):
+                return
+            backoff = min(backoff * 2, self.backoff_max)
+            # Read the record again, unless the backlog is compacted meanwhile
+            with self.condition:
+                self.reader.seek(self.read_offset)
+
+    def try_publish(
+        self, station_id: str, payloads: dict[str, dict[str, Any]]
+    ) -> bool | None:
+        """Whether the record was published, None if it was rejected."""
+        try:
+            return self.publish(station_id, payloads)
+        except Exception as err:
+            if isinstance(err, PublishRejected):
+                logging.error(f"{err}, moved to the spool dead letters")
+            else:
+                logging.exception(
+                    f"Could not publish station {station_id}, "
+                    f"moved to the spool dead letters"
+                )
+            self.write_dead_letter(station_id, payloads, err)
+            return None
+
+    def write_dead_letter(
+        self, station_id: str, payloads: dict[str, dict[str, Any]], err: Exception
+    ):
+        record = {"station_id": station_id, "payloads": payloads, "error": str(err)}
+        with open(self.directory / DEAD_LETTERS_NAME, "a") as dead_letters_file:
+            dead_letters_file.write(json.dumps(record) + "\n")
+
+    def metrics(self) -> dict[str, float]:
+        return {
+            "backlog_bytes": self.backlog,
+            "segments": len(self.segments),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "retried": self.retried,
+            "dead_letters": self.dead_letters,
+            "compactions": self.compactions,
+        }
+
+    def stop(self):
+        """Sync the spool and stop replaying; the backlog is kept on disk."""
+        self.stopping.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.worker.join()
+        with self.condition:
+            self.sync([self.take_unsynced()])
+            self.writer.close()
+            self.reader.close()
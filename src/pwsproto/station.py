@@ -1,6 +1,8 @@
+import dataclasses
 import datetime
-from typing import Callable, Any
-from homeassistant.const import (
+import time
+from typing import TYPE_CHECKING, Callable, Any
+from pwsproto.const import (
     UnitOfPressure,
     UnitOfSpeed,
     UnitOfTemperature,
@@ -11,9 +13,14 @@ from homeassistant.const import (
     CONCENTRATION_PARTS_PER_MILLION,
     CONCENTRATION_PARTS_PER_BILLION,
     CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+    SensorDeviceClass,
 )
-from homeassistant.components.sensor.const import SensorDeviceClass
-from homeassistant.components.sensor import SensorEntityDescription
+from pwsproto import metrics
+
+if TYPE_CHECKING:
+    from pwsproto.derived import DerivedQuantities
+    from pwsproto.history import HistoryStore
+    from pwsproto.units import UnitNormalizer
 
 
 def str_to_int(x: str) -> int:
@@ -29,203 +36,265 @@ def identity(x: str) -> str:
 
 
 class Measurement:
+    __slots__ = ("value", "unit")
+
     def __init__(self, value: Any, unit: str | None = None):
         self.value = value
         self.unit = unit
 
 
-SENSOR_MAPPING: dict[str, SensorEntityDescription] = {
+@dataclasses.dataclass(frozen=True, slots=True)
+class SensorDescription:
+    """Subset of Home Assistant's SensorEntityDescription used by stations.
+
+    The integration converts it into a SensorEntityDescription.
+    """
+
+    key: str
+    device_class: str | None = None
+    native_unit_of_measurement: str | None = None
+
+
+SENSOR_MAPPING: dict[str, SensorDescription] = {
     # Generic fields
-    "software_type": SensorEntityDescription(key="software_type"),
+    "software_type": SensorDescription(key="software_type"),
     # Wind
-    "wind_direction": SensorEntityDescription(key="wind_direction"),
-    "wind_speed": SensorEntityDescription(
+    "wind_direction": SensorDescription(key="wind_direction"),
+    "wind_speed": SensorDescription(
         key="wind_speed",
         device_class=SensorDeviceClass.WIND_SPEED,
         native_unit_of_measurement=UnitOfSpeed.MILES_PER_HOUR,
     ),
-    "wind_gust_speed": SensorEntityDescription(
+    "wind_gust_speed": SensorDescription(
         key="wind_gust_speed",
         device_class=SensorDeviceClass.WIND_SPEED,
         native_unit_of_measurement=UnitOfSpeed.MILES_PER_HOUR,
     ),
-    "windgustdir": SensorEntityDescription(key="wind_gust_direction"),
-    "wind_speed_avg_2m": SensorEntityDescription(
+    "windgustdir": SensorDescription(key="wind_gust_direction"),
+    "wind_speed_avg_2m": SensorDescription(
         key="wind_speed_avg_2m",
         device_class=SensorDeviceClass.WIND_SPEED,
         native_unit_of_measurement=UnitOfSpeed.MILES_PER_HOUR,
     ),
-    "winddir_avg2m": SensorEntityDescription(key="wind_direction_avg_2m"),
-    "wind_gust_speed_10m": SensorEntityDescription(
+    "winddir_avg2m": SensorDescription(key="wind_direction_avg_2m"),
+    "wind_gust_speed_10m": SensorDescription(
         key="wind_gust_speed_10m",
         device_class=SensorDeviceClass.WIND_SPEED,
         native_unit_of_measurement=UnitOfSpeed.MILES_PER_HOUR,
     ),
-    "wind_gust_direction_10m": SensorEntityDescription(key="wind_gust_direction_10m"),
+    "wind_gust_direction_10m": SensorDescription(key="wind_gust_direction_10m"),
     # Outdoor temperature/pressure/humidity
-    "outdoor_humidity": SensorEntityDescription(
+    "outdoor_humidity": SensorDescription(
         key="outdoor_humidity",
         device_class=SensorDeviceClass.HUMIDITY,
         native_unit_of_measurement=PERCENTAGE,
     ),
-    "dew_temperature": SensorEntityDescription(
+    "dew_temperature": SensorDescription(
         key="dew_temperature",
         device_class=SensorDeviceClass.TEMPERATURE,
         native_unit_of_measurement=UnitOfTemperature.FAHRENHEIT,
     ),
-    "outdoor_temperature": SensorEntityDescription(
+    "outdoor_temperature": SensorDescription(
         key="outdoor_temperature",
         device_class=SensorDeviceClass.TEMPERATURE,
         native_unit_of_measurement=UnitOfTemperature.FAHRENHEIT,
     ),
     # * for extra outdoor sensors use temp2f, temp3f, and so on
-    "barometric_pressure": SensorEntityDescription(
+    "barometric_pressure": SensorDescription(
         key="barometric_pressure",
         device_class=SensorDeviceClass.ATMOSPHERIC_PRESSURE,
         native_unit_of_measurement=UnitOfPressure.INHG,
     ),
     # General weather info (text)
-    "weather_text": SensorEntityDescription(key="weather_text"),
-    "clouds": SensorEntityDescription(key="clouds"),
+    "weather_text": SensorDescription(key="weather_text"),
+    "clouds": SensorDescription(key="clouds"),
     # Soil
-    "soil_temperature": SensorEntityDescription(
+    "soil_temperature": SensorDescription(
         key="soil_temperature",
         device_class=SensorDeviceClass.TEMPERATURE,
         native_unit_of_measurement=UnitOfTemperature.FAHRENHEIT,
     ),
     # * for sensors 2,3,4 use soiltemp2f, soiltemp3f, and soiltemp4f
-    "soil_moisture": SensorEntityDescription(
+    "soil_moisture": SensorDescription(
         key="soil_moisture",
         device_class=SensorDeviceClass.MOISTURE,
         native_unit_of_measurement=PERCENTAGE,
     ),
     # * for sensors 2,3,4 use soilmoisture2, soilmoisture3, and soilmoisture4
-    "leaf_wetness": SensorEntityDescription(
+    "leaf_wetness": SensorDescription(
         key="leaf_wetness",
         device_class=SensorDeviceClass.MOISTURE,
         native_unit_of_measurement=PERCENTAGE,
     ),
     # + for sensor 2 use leafwetness2
     # Sunlight
-    "solar_radiation": SensorEntityDescription(
+    "solar_radiation": SensorDescription(
         key="solar_radiation",
         device_class=SensorDeviceClass.IRRADIANCE,
         native_unit_of_measurement=UnitOfIrradiance.WATTS_PER_SQUARE_METER,
     ),
-    "uv_index": SensorEntityDescription(
-        key="uv_index", native_unit_of_measurement=UV_INDEX
-    ),
-    "visibility": SensorEntityDescription(key="nm_visibility"),
+    "uv_index": SensorDescription(key="uv_index", native_unit_of_measurement=UV_INDEX),
+    "visibility": SensorDescription(key="nm_visibility"),
     # Rain
-    "rain_hourly": SensorEntityDescription(
+    "rain_hourly": SensorDescription(
         key="rain_hourly",
         device_class=SensorDeviceClass.PRECIPITATION,
         native_unit_of_measurement=UnitOfPrecipitationDepth.INCHES,
     ),
-    "rain_daily": SensorEntityDescription(
+    "rain_daily": SensorDescription(
         key="rain_daily",
         device_class=SensorDeviceClass.PRECIPITATION,
         native_unit_of_measurement=UnitOfPrecipitationDepth.INCHES,
     ),
     # Indoor sensors
-    "indoor_temperature": SensorEntityDescription(
+    "indoor_temperature": SensorDescription(
         key="indoor_temperature",
         device_class=SensorDeviceClass.TEMPERATURE,
         native_unit_of_measurement=UnitOfTemperature.FAHRENHEIT,
     ),
-    "indoor_humidity": SensorEntityDescription(
+    "indoor_humidity": SensorDescription(
         key="indoor_humidity",
         device_class=SensorDeviceClass.HUMIDITY,
         native_unit_of_measurement=PERCENTAGE,
     ),
     # Air quality
-    "pollution_no": SensorEntityDescription(
+    "pollution_no": SensorDescription(
         key="pollution_no", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_no2t": SensorEntityDescription(
+    "pollution_no2t": SensorDescription(
         key="pollution_no2t", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_no2": SensorEntityDescription(
+    "pollution_no2": SensorDescription(
         key="pollution_no2", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_no2y": SensorEntityDescription(
+    "pollution_no2y": SensorDescription(
         key="pollution_no2y", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_nox": SensorEntityDescription(
+    "pollution_nox": SensorDescription(
         key="pollution_nox", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_noy": SensorEntityDescription(
+    "pollution_noy": SensorDescription(
         key="pollution_noy", native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION
     ),
-    "pollution_no3_ion": SensorEntityDescription(
+    "pollution_no3_ion": SensorDescription(
         key="pollution_no3_ion",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_so4_ion": SensorEntityDescription(
+    "pollution_so4_ion": SensorDescription(
         key="pollution_so4_ion",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_sulfur_dioxide": SensorEntityDescription(
+    "pollution_sulfur_dioxide": SensorDescription(
         key="pollution_sulfur_dioxide",
         native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION,
     ),
-    "pollution_sulfur_dioxide_trace": SensorEntityDescription(
+    "pollution_sulfur_dioxide_trace": SensorDescription(
         key="pollution_sulfur_dioxide_trace",
         native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION,
     ),
-    "pollution_carbon_monoxide": SensorEntityDescription(
+    "pollution_carbon_monoxide": SensorDescription(
         key="pollution_carbon_monoxide",
         device_class=SensorDeviceClass.CO,
         native_unit_of_measurement=CONCENTRATION_PARTS_PER_MILLION,
     ),
-    "pollution_carbon_monoxide_trace": SensorEntityDescription(
+    "pollution_carbon_monoxide_trace": SensorDescription(
         key="pollution_carbon_monoxide_trace",
         native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION,
     ),
-    "pollution_elemental_carbon": SensorEntityDescription(
+    "pollution_elemental_carbon": SensorDescription(
         key="pollution_elemental_carbon",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_organic_carbon": SensorEntityDescription(
+    "pollution_organic_carbon": SensorDescription(
         key="pollution_organic_carbon",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_black_carbon": SensorEntityDescription(
+    "pollution_black_carbon": SensorDescription(
         key="pollution_black_carbon",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_uv_aeth": SensorEntityDescription(
+    "pollution_uv_aeth": SensorDescription(
         key="pollution_uv_aeth",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_pm25_mass": SensorEntityDescription(
+    "pollution_pm25_mass": SensorDescription(
         key="pollution_pm25_mass",
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_pm10_mass": SensorEntityDescription(
+    "pollution_pm10_mass": SensorDescription(
         key="pollution_pm10_mass",
         device_class=SensorDeviceClass.PM10,
         native_unit_of_measurement=CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
     ),
-    "pollution_ozone": SensorEntityDescription(
+    "pollution_ozone": SensorDescription(
         key="pollution_ozone",
         native_unit_of_measurement=CONCENTRATION_PARTS_PER_BILLION,
     ),
 }
 
 
+def get_sensor_description(sensor_name: str) -> SensorDescription | None:
+    if sensor_name in SENSOR_MAPPING:
+        return SENSOR_MAPPING[sensor_name]
+    # Numbered extra sensors (e.g. outdoor_temperature_2) share the description
+    # of their base sensor.
+    base_name, _, number = sensor_name.rpartition("_")
+    if number.isdigit() and base_name in SENSOR_MAPPING:
+        return dataclasses.replace(SENSOR_MAPPING[base_name], key=sensor_name)
+    return None
+
+
 class WeatherStationSensor:
-    entity_description: SensorEntityDescription
+    __slots__ = (
+        "name",
+        "entity_description",
+        "last_measurement_date",
+        "last_measurement",
+        "payload",
+    )
+
+    entity_description: SensorDescription
 
     name: str
     last_measurement_date: datetime.datetime | None
     last_measurement: Measurement | None
+    # Home Assistant payload of the last measurement, built on update.
+    payload: dict[str, Any] | None
 
-    def __init__(self, name: str, entity_description: SensorEntityDescription):
+    def __init__(self, name: str, entity_description: SensorDescription):
         self.name = name
         self.entity_description = entity_description
         self.last_measurement = None
         self.last_measurement_date = None
+        self.payload = None
+
+    def update(
+        self,
+        measurement: Measurement,
+        measurement_date: datetime.datetime | None,
+        updated: str | None,
+    ):
+        """Record a measurement; updated is the formatted measurement date."""
+        self.last_measurement = measurement
+        self.last_measurement_date = measurement_date
+
+        attributes = {}
+        if measurement.unit is not None:
+            attributes["unit_of_measurement"] = measurement.unit
+        elif self.entity_description.native_unit_of_measurement is not None:
+            attributes["unit_of_measurement"] = (
+                self.entity_description.native_unit_of_measurement
+            )
+        if self.entity_description.device_class is not None:
+            attributes["device_class"] = self.entity_description.device_class
+        attributes["friendly_name"] = self.name
+        if updated is not None:
+            attributes["updated"] = updated
+
+        self.payload = {
+            "state": str(measurement.value),
+            "attributes": attributes,
+        }
 
 
 class WeatherStation:
@@ -233,6 +302,11 @@ class WeatherStation:
     password: str
     update_callback: Callable[["WeatherStation"], None] | None
     sensors: dict[str, WeatherStationSensor]
+    unit_normalizer: "UnitNormalizer | None"
+    history: "HistoryStore | None"
+    derived: "DerivedQuantities | None"
+    # Names of the sensors published, all if None
+    sensor_allowlist: "set[str] | frozenset[str] | None"
 
     def __init__(
         self,
@@ -240,68 +314,84 @@ class WeatherStation:
         password: str,
         update_callback: Callable[["WeatherStation"], None] | None = None,
         sensors: dict[str, WeatherStationSensor] | None = None,
+        unit_normalizer: "UnitNormalizer | None" = None,
+        history: "HistoryStore | None" = None,
+        derived: "DerivedQuantities | None" = None,
+        sensor_allowlist: "set[str] | frozenset[str] | None" = None,
     ):
         self.id = id
         self.password = password
         self.update_callback = update_callback
+        self.unit_normalizer = unit_normalizer
+        self.history = history
+        self.derived = derived
         if sensors is not None:
             self.sensors = sensors
         else:
             self.sensors = {}
+        self.sensor_allowlist = None
+        self.set_sensor_allowlist(sensor_allowlist)
+
+    def set_sensor_allowlist(
+        self, sensor_allowlist: "set[str] | frozenset[str] | None"
+    ):
+        """Publish only the given sensors, dropping the other known ones."""
+        self.sensor_allowlist = sensor_allowlist
+        if sensor_allowlist is not None:
+            self.sensors = {
+                name: sensor
+                for name, sensor in self.sensors.items()
+                if name in sensor_allowlist
+            }
 
     def update_measurement(self, measurements: dict[str, Measurement]):
         if "date" not in measurements:
             raise ValueError("Date absent from measurement")
         measurements_date = measurements["date"].value
+        if self.unit_normalizer is not None:
+            measurements = self.unit_normalizer.normalize(measurements)
+        if self.derived is not None and measurements_date is not None:
+            derived = self.derived.derive(measurements_date, measurements)
+            if derived:
+                measurements = {**measurements, **derived}
+        if self.history is not None and measurements_date is not None:
+            self.history.record(self.id, measurements_date, measurements)
+        updated = None
+        if measurements_date is not None:
+            updated = measurements_date.strftime("%Y-%m-%dT%H:%M:%S%z")
 
+        start = time.perf_counter()
         for sensor_name, measurement in measurements.items():
             # No date sensor
             if sensor_name == "date":
                 continue
+            # Derived quantities and history still use the other measurements
+            if (
+                self.sensor_allowlist is not None
+                and sensor_name not in self.sensor_allowlist
+            ):
+                continue
 
             if sensor_name not in self.sensors:
-                if sensor_name not in SENSOR_MAPPING:
+                entity_description = get_sensor_description(sensor_name)
+                if entity_description is None:
                     raise ValueError(f"Unknown sensor: {sensor_name}")
                 self.sensors[sensor_name] = WeatherStationSensor(
-                    sensor_name, SENSOR_MAPPING[sensor_name]
+                    sensor_name, entity_description
                 )
-            self.sensors[sensor_name].last_measurement = measurement
-            self.sensors[sensor_name].last_measurement_date = measurements_date
+            self.sensors[sensor_name].update(measurement, measurements_date, updated)
+        metrics.PAYLOADS_SECONDS.observe(time.perf_counter() - start)
 
         if self.update_callback is not None:
             self.update_callback(self)
 
     def get_ha_payloads(self) -> dict[str, dict[str, Any]]:
-        payloads = {}
-
-        for name, sensor in self.sensors.items():
-            # Skip sensors without measurements.
-            if sensor.last_measurement is None:
-                continue
-
-            attributes = {}
-            if (
-                sensor.last_measurement is not None
-                and sensor.last_measurement.unit is not None
-            ):
-                attributes["unit_of_measurement"] = sensor.last_measurement.unit
-            elif sensor.entity_description.native_unit_of_measurement is not None:
-                attributes["unit_of_measurement"] = (
-                    sensor.entity_description.native_unit_of_measurement
-                )
-            if sensor.entity_description.device_class is not None:
-                attributes["device_class"] = sensor.entity_description.device_class
-            attributes["friendly_name"] = name
-            if sensor.last_measurement_date is not None:
-                attributes["updated"] = str(
-                    sensor.last_measurement_date.strftime("%Y-%m-%dT%H:%M:%S%z")
-                )
-
-            payload = {
-                "state": str(sensor.last_measurement.value),
-                "attributes": attributes,
-            }
-
-            payloads[name] = payload
+        """Payloads of the sensors with measurements.
 
-        return payloads
+        Payloads are cached by the sensors and must not be modified.
+        """
+        return {
+            name: sensor.payload
+            for name, sensor in self.sensors.items()
+            if sensor.payload is not None
+        }
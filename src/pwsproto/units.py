@@ -0,0 +1,129 @@
+import logging
+
+from pwsproto.const import (
+    UnitOfPrecipitationDepth,
+    UnitOfPressure,
+    UnitOfSpeed,
+    UnitOfTemperature,
+)
+
+from pwsproto.station import Measurement
+
+
+# Linear conversion of each unit to the reference unit of its quantity:
+# reference value = value * scale + offset
+UNIT_TO_REFERENCE: dict[str, tuple[str, float, float]] = {
+    # Temperature, in °C
+    UnitOfTemperature.CELSIUS: ("temperature", 1.0, 0.0),
+    UnitOfTemperature.FAHRENHEIT: ("temperature", 5 / 9, -160 / 9),
+    UnitOfTemperature.KELVIN: ("temperature", 1.0, -273.15),
+    # Pressure, in hPa
+    UnitOfPressure.PA: ("pressure", 0.01, 0.0),
+    UnitOfPressure.HPA: ("pressure", 1.0, 0.0),
+    UnitOfPressure.KPA: ("pressure", 10.0, 0.0),
+    UnitOfPressure.BAR: ("pressure", 1000.0, 0.0),
+    UnitOfPressure.CBAR: ("pressure", 10.0, 0.0),
+    UnitOfPressure.MBAR: ("pressure", 1.0, 0.0),
+    UnitOfPressure.MMHG: ("pressure", 1.333223684, 0.0),
+    UnitOfPressure.INHG: ("pressure", 33.86388640341, 0.0),
+    UnitOfPressure.PSI: ("pressure", 68.94757293168, 0.0),
+    # Speed, in m/s
+    UnitOfSpeed.FEET_PER_SECOND: ("speed", 0.3048, 0.0),
+    UnitOfSpeed.METERS_PER_SECOND: ("speed", 1.0, 0.0),
+    UnitOfSpeed.KILOMETERS_PER_HOUR: ("speed", 1 / 3.6, 0.0),
+    UnitOfSpeed.KNOTS: ("speed", 1852 / 3600, 0.0),
+    UnitOfSpeed.MILES_PER_HOUR: ("speed", 0.44704, 0.0),
+    # Precipitation depth, in mm
+    UnitOfPrecipitationDepth.MILLIMETERS: ("depth", 1.0, 0.0),
+    UnitOfPrecipitationDepth.CENTIMETERS: ("depth", 10.0, 0.0),
+    UnitOfPrecipitationDepth.INCHES: ("depth", 25.4, 0.0),
+}
+
+UNIT_SYSTEMS: dict[str, dict[str, str]] = {
+    "native": {},
+    "metric": {
+        UnitOfTemperature.FAHRENHEIT: UnitOfTemperature.CELSIUS,
+        UnitOfPressure.INHG: UnitOfPressure.HPA,
+        UnitOfSpeed.MILES_PER_HOUR: UnitOfSpeed.KILOMETERS_PER_HOUR,
+        UnitOfPrecipitationDepth.INCHES: UnitOfPrecipitationDepth.MILLIMETERS,
+    },
+    "imperial": {
+        UnitOfTemperature.CELSIUS: UnitOfTemperature.FAHRENHEIT,
+        UnitOfPressure.HPA: UnitOfPressure.INHG,
+        UnitOfSpeed.KILOMETERS_PER_HOUR: UnitOfSpeed.MILES_PER_HOUR,
+        UnitOfPrecipitationDepth.MILLIMETERS: UnitOfPrecipitationDepth.INCHES,
+    },
+}
+
+
+def linear_conversion(from_unit: str, to_unit: str) -> tuple[float, float]:
+    """Coefficients (scale, offset) converting from_unit into to_unit."""
+    if from_unit not in UNIT_TO_REFERENCE or to_unit not in UNIT_TO_REFERENCE:
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    from_quantity, from_scale, from_offset = UNIT_TO_REFERENCE[from_unit]
+    to_quantity, to_scale, to_offset = UNIT_TO_REFERENCE[to_unit]
+    if from_quantity != to_quantity:
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    return from_scale / to_scale, (from_offset - to_offset) / to_scale
+
+
+class UnitNormalizer:
+    """Converts measurements into the units of a unit system.
+
+    Target units are given per source unit by the unit system, and can be
+    overridden per sensor. The conversion coefficients of each (sensor, unit)
+    pair are computed once, so that a station update is converted in a single
+    pass of multiply-adds.
+    """
+
+    def __init__(
+        self,
+        unit_system: str = "native",
+        sensor_units: dict[str, str] | None = None,
+        precision: int = 3,
+    ):
+        if unit_system not in UNIT_SYSTEMS:
+            raise ValueError(f"Unknown unit system: {unit_system}")
+        self.system_units = UNIT_SYSTEMS[unit_system]
+        self.sensor_units = sensor_units if sensor_units is not None else {}
+        self.precision = precision
+        self.kernels: dict[tuple[str, str], tuple[float, float, str] | None] = {}
+
+    def kernel(self, sensor_name: str, unit: str) -> tuple[float, float, str] | None:
+        key = (sensor_name, unit)
+        if key not in self.kernels:
+            target_unit = self.sensor_units.get(
+                sensor_name, self.system_units.get(unit, unit)
+            )
+            if target_unit == unit:
+                self.kernels[key] = None
+            else:
+                try:
+                    scale, offset = linear_conversion(unit, target_unit)
+                except ValueError as err:
+                    # E.g. a per-sensor unit of another quantity: reported once
+                    logging.warning(f"Sensor {sensor_name} not converted: {err}")
+                    self.kernels[key] = None
+                else:
+                    self.kernels[key] = (scale, offset, target_unit)
+        return self.kernels[key]
+
+    def normalize(self, measurements: dict[str, Measurement]) -> dict[str, Measurement]:
+        normalized = {}
+        kernels = self.kernels
+        precision = self.precision
+        for sensor_name, measurement in measurements.items():
+            unit = measurement.unit
+            value = measurement.value
+            if unit is not None and isinstance(value, (int, float)):
+                try:
+                    kernel = kernels[(sensor_name, unit)]
+                except KeyError:
+                    kernel = self.kernel(sensor_name, unit)
+                if kernel is not None:
+                    scale, offset, target_unit = kernel
+                    measurement = Measurement(
+                        round(value * scale + offset, precision), target_unit
+                    )
+            normalized[sensor_name] = measurement
+        return normalized
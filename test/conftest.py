@@ -0,0 +1,15 @@
+import pytest
+
+try:
+    import pytest_socket  # pyright: ignore[reportMissingImports]
+except ImportError:
+    pytest_socket = None
+
+
+@pytest.fixture(autouse=True)
+def local_sockets(request: pytest.FixtureRequest):
+    # pytest-homeassistant-custom-component blocks sockets for all tests, but
+    # only the integration tests run in Home Assistant: the others use local
+    # servers.
+    if pytest_socket is not None and request.module.__name__ != "test_integration":
+        pytest_socket.enable_socket()
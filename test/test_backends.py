@@ -0,0 +1,270 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from wsgiref.simple_server import make_server
+import ipaddress
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from bottle import Bottle
+import pytest
+
+from pwsproto.backends import PreforkWorkers, pooled_wsgi_server, run_server
+from pwsproto.config import ConfigWatcher, StationFleet, load_config
+from pwsproto.ingest import PWS_ROUTE
+from pwsproto.log import start_queue_logging
+from pwsproto.ratelimit import TokenBuckets
+from pwsproto.server import RequestProcessor, metrics_endpoint
+from pwsproto.station import WeatherStation
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str | urllib.request.Request) -> int:
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status
+    except urllib.error.HTTPError as err:
+        return err.code
+
+
+def _wait_listening(port: int):
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _upload_url(port: int, password: str, temperature: int) -> str:
+    return (
+        f"http://127.0.0.1:{port}{PWS_ROUTE}?ID=STATION&PASSWORD={password}"
+        f"&dateutc=now&tempf={temperature}"
+    )
+
+
+def test_pooled_wsgi_server_concurrent_requests():
+    barrier = threading.Barrier(4, timeout=5)
+
+    def handler():
+        # Only completes if 4 requests are handled at the same time
+        barrier.wait()
+        return "ok"
+
+    app = Bottle()
+    app.route("/", method="GET", callback=handler)
+    server = make_server("127.0.0.1", 0, app, pooled_wsgi_server(4))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    url = f"http://127.0.0.1:{server.server_port}/"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        bodies = list(
+            executor.map(lambda _: urllib.request.urlopen(url).read(), range(4))
+        )
+
+    server.shutdown()
+    server.server_close()
+    assert bodies == [b"ok"] * 4
+
+
+def test_prefork_station_state_across_workers():
+    station = WeatherStation("STATION", "KEY")
+    processor = RequestProcessor([station])
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=processor)
+    port = _free_port()
+    workers = PreforkWorkers("127.0.0.1", port, workers=2, threads=2).start()
+    thread = threading.Thread(target=workers.serve, args=(app,), daemon=True)
+    thread.start()
+    try:
+        _wait_listening(port)
+        # Each request opens a connection, accepted by either process
+        for temperature in range(8):
+            assert _get(_upload_url(port, "KEY", temperature)) == 200
+        measurement = station.sensors["outdoor_temperature"].last_measurement
+        assert measurement is not None
+        assert measurement.value == 7.0
+
+        # Stations changed after the processes were forked apply to all of them
+        processor.replace_stations([WeatherStation("STATION", "NEW")])
+        for temperature in range(4):
+            assert _get(_upload_url(port, "KEY", temperature)) == 403
+            assert _get(_upload_url(port, "NEW", temperature)) == 200
+    finally:
+        workers.stop()
+        thread.join()
+
+
+def test_prefork_config_reload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("LLT", "token")
+    config = (
+        '[targets.default]\nhost = "127.0.0.1"\nport = {port}\n\n'
+        "[policies.default]\nqueue_size = 0\n\n"
+        '[[stations]]\nid = "STATION"\npassword = "{password}"\n'
+    )
+    path = tmp_path / "pws.toml"
+    path.write_text(config.format(port=_free_port(), password="KEY"))
+    port = _free_port()
+    # Forked before the fleet and the watcher, as by the server
+    workers = PreforkWorkers("127.0.0.1", port, workers=2, threads=2).start()
+    processor = RequestProcessor([])
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=processor)
+    fleet = StationFleet(processor)
+    fleet.apply(load_config(path))
+    watcher = ConfigWatcher(path, load_config, fleet, poll_interval=0.01).start(
+        handle_sighup=False
+    )
+    thread = threading.Thread(target=workers.serve, args=(app,), daemon=True)
+    thread.start()
+    try:
+        _wait_listening(port)
+        assert _get(_upload_url(port, "KEY", 70)) == 200
+
+        path.write_text(config.format(port=_free_port(), password="NEW"))
+        watcher.reload_requested.set()
+        deadline = time.monotonic() + 5
+        while _get(_upload_url(port, "KEY", 70)) != 403:
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.01)
+        # Whichever process accepts the connection
+        for temperature in range(4):
+            assert _get(_upload_url(port, "NEW", temperature)) == 200
+    finally:
+        watcher.stop()
+        workers.stop()
+        thread.join()
+        fleet.close()
+
+
+def test_prefork_metrics_of_parent():
+    processor = RequestProcessor([WeatherStation("METRICS", "KEY")])
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=processor)
+    app.route("/metrics", method="GET", callback=metrics_endpoint)
+    port = _free_port()
+    workers = PreforkWorkers("127.0.0.1", port, workers=2, threads=2).start()
+    thread = threading.Thread(target=workers.serve, args=(app,), daemon=True)
+    thread.start()
+    try:
+        _wait_listening(port)
+        for temperature in range(4):
+            assert (
+                _get(
+                    _upload_url(port, "KEY", temperature).replace("STATION", "METRICS")
+                )
+                == 200
+            )
+        # Whichever process accepts the connection, the metrics cover all
+        # uploads
+        for _ in range(4):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                body = response.read().decode()
+            assert 'pws_station_uploads_total{station="METRICS"} 4' in body
+    finally:
+        workers.stop()
+        thread.join()
+
+
+def test_prefork_rate_limits_of_parent():
+    processor = RequestProcessor([WeatherStation("STATION", "KEY")])
+    processor.address_limiter = TokenBuckets(rate=0.001, burst=2)
+    processor.trusted_proxies = [ipaddress.ip_network("127.0.0.1")]
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=processor)
+    port = _free_port()
+    workers = PreforkWorkers("127.0.0.1", port, workers=2, threads=2).start()
+    thread = threading.Thread(target=workers.serve, args=(app,), daemon=True)
+    thread.start()
+
+    def upload(client: str) -> int:
+        request = urllib.request.Request(
+            _upload_url(port, "KEY", 70), headers={"X-Forwarded-For": client}
+        )
+        return _get(request)
+
+    try:
+        _wait_listening(port)
+        # Whichever process accepts the connections, the limits are shared
+        assert [upload("192.0.2.1") for _ in range(4)] == [200, 200, 429, 429]
+        assert upload("192.0.2.2") == 200
+    finally:
+        workers.stop()
+        thread.join()
+
+
+def test_prefork_after_queue_logging():
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    listener = start_queue_logging()
+    try:
+        with pytest.raises(RuntimeError, match="queue logging"):
+            PreforkWorkers("127.0.0.1", _free_port(), workers=1).start()
+    finally:
+        listener.stop()
+        root.handlers[:] = handlers
+
+
+def test_asyncio_handler_does_not_block_event_loop():
+    pytest.importorskip("aiohttp")
+    # Both requests only complete if their handlers run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+
+    def handler(params: dict[str, str]):
+        barrier.wait()
+
+    port = _free_port()
+    server = multiprocessing.get_context("fork").Process(
+        target=run_server,
+        args=(None, handler, "/upload", "asyncio", "127.0.0.1", port, 2),
+        daemon=True,
+    )
+    server.start()
+    try:
+        _wait_listening(port)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            statuses = list(
+                executor.map(
+                    lambda _: _get(f"http://127.0.0.1:{port}/upload"), range(2)
+                )
+            )
+        assert statuses == [200, 200]
+    finally:
+        server.terminate()
+        server.join()
+
+
+def test_asyncio_rejected_uploads():
+    pytest.importorskip("aiohttp")
+    processor = RequestProcessor([WeatherStation("STATION", "KEY")])
+    port = _free_port()
+    server = multiprocessing.get_context("fork").Process(
+        target=run_server,
+        args=(None, processor.handle, PWS_ROUTE, "asyncio", "127.0.0.1", port, 2),
+        kwargs={"processor": processor},
+        daemon=True,
+    )
+    server.start()
+    try:
+        _wait_listening(port)
+        url = f"http://127.0.0.1:{port}{PWS_ROUTE}"
+        assert _get(f"{url}?ID=STATION&tempf=70") == 400
+        assert _get(f"{url}?ID=STATION&PASSWORD=KEY&dateutc=yesterday") == 400
+        assert _get(f"{url}?ID=STATION&PASSWORD=WRONG&dateutc=now") == 403
+        assert _get(f"{url}?ID=STATION&PASSWORD=KEY&dateutc=now&tempf=70") == 200
+    finally:
+        server.terminate()
+        server.join()
@@ -0,0 +1,159 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import csv
+import gzip
+
+from pwsproto.backfill import Backfill, CSVSink, HistorySink, open_log, upload_query
+from pwsproto.config import StationConfig
+from pwsproto.history import HistoryLocked, HistoryStore
+from pwsproto.ingest import parse_query
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import WeatherStation
+from pwsproto.units import UnitNormalizer
+
+import pytest
+
+UPLOADS = [
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A30%3A20&tempf=70&baromin=29.1"
+    "&humidity=40&UV=3&temp2f=60&softwaretype=vws%20versionxx&action=updateraw",
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15 17:31:20&tempf=bad&humidity=41&UV=3.5",
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A32%3A20&tempf=%2D1.5&humidity=42",
+]
+REJECTED = [
+    "ID=STATION&PASSWORD=WRONG&dateutc=2025-02-15+17%3A33%3A20&tempf=80",
+    "ID=STATION&PASSWORD=KEY&dateutc=now&tempf=80",
+    "ID=STATION&PASSWORD=KEY&dateutc=yesterday&tempf=80",
+]
+
+START = datetime(2025, 2, 15, tzinfo=timezone.utc)
+END = datetime(2025, 2, 16, tzinfo=timezone.utc)
+
+
+def _samples(directory: Path) -> dict[str, list[tuple[float, float]]]:
+    history = HistoryStore(directory)
+    return {
+        path.name: history.query("STATION", path.name, START, END)
+        for path in (directory / "STATION").iterdir()
+    }
+
+
+@pytest.fixture
+def stations() -> list[StationConfig]:
+    return [StationConfig("station", "STATION", "KEY", unit_system="metric")]
+
+
+def test_upload_query():
+    query = "ID=STATION&PASSWORD=KEY&tempf=70"
+    assert upload_query(query + "\n") == query
+    assert upload_query(f"12.500\t{query}\n") == query
+    assert (
+        upload_query(
+            f'127.0.0.1 - - [15/Feb/2025:17:30:20 +0000] "GET '
+            f'/weatherstation/updateweatherstation.php?{query} HTTP/1.1" 200 0 "-"\n'
+        )
+        == query
+    )
+
+
+def test_open_log(tmp_path: Path):
+    with gzip.open(tmp_path / "uploads.log", "wt") as log_file:
+        log_file.write("first\nsecond\n")
+    (tmp_path / "plain.log").write_text("first\nsecond\n")
+
+    assert list(open_log(str(tmp_path / "uploads.log"))) == ["first\n", "second\n"]
+    assert list(open_log(str(tmp_path / "plain.log"))) == ["first\n", "second\n"]
+
+
+@pytest.mark.parametrize("batch_size, max_sensors", [(10000, 4096), (1, 1)])
+def test_same_history_as_server(
+    tmp_path: Path,
+    stations: list[StationConfig],
+    batch_size: int,
+    max_sensors: int,
+):
+    history = HistoryStore(tmp_path / "server")
+    processor = PWSRequestProcessor(
+        [
+            WeatherStation(
+                "STATION",
+                "KEY",
+                unit_normalizer=UnitNormalizer("metric"),
+                history=history,
+            )
+        ]
+    )
+    for query in UPLOADS:
+        processor.process_request(parse_query(query))
+    history.flush()
+
+    sink = HistorySink(str(tmp_path / "backfill"), max_sensors=max_sensors)
+    report = Backfill(stations, [sink], batch_size=batch_size).run(UPLOADS + REJECTED)
+    sink.close()
+
+    assert _samples(tmp_path / "backfill") == _samples(tmp_path / "server")
+    assert _samples(tmp_path / "backfill")["outdoor_temperature"] == [
+        (datetime(2025, 2, 15, 17, 30, 20, tzinfo=timezone.utc).timestamp(), 21.111),
+        (datetime(2025, 2, 15, 17, 32, 20, tzinfo=timezone.utc).timestamp(), -18.611),
+    ]
+    assert report.lines == 6
+    assert report.uploads == 6
+    assert report.rejected == 1
+    assert report.undated == 2
+    # tempf=bad, UV=3.5
+    assert report.invalid_values == 2
+
+
+def test_backfill_into_server_history(tmp_path: Path, stations: list[StationConfig]):
+    start = datetime(2025, 2, 15, 17, 30, 20, tzinfo=timezone.utc).timestamp()
+    server = HistoryStore(tmp_path, capacity=8)
+    server.lock_directory()
+    # Live samples, later than the backfilled ones
+    for i in range(2):
+        server.extend(
+            "STATION",
+            "outdoor_temperature",
+            array("d", [start + 86400 + i]),
+            array("d", [10.0]),
+        )
+    with pytest.raises(HistoryLocked):
+        HistorySink(str(tmp_path))
+    server.close()
+
+    sink = HistorySink(str(tmp_path), capacity=8)
+    Backfill(stations, [sink]).run(UPLOADS)
+    sink.close()
+
+    restarted = HistoryStore(tmp_path, capacity=8)
+    day = datetime(2025, 2, 15, tzinfo=timezone.utc)
+    assert restarted.query(
+        "STATION", "outdoor_temperature", day, day + timedelta(days=2)
+    ) == [
+        (start, 21.111),
+        (start + 120, -18.611),
+        (start + 86400, 10.0),
+        (start + 86401, 10.0),
+    ]
+    # The saved rollups are completed with the backfilled segments
+    buckets = restarted.aggregate(
+        "STATION", "outdoor_temperature", day, day + timedelta(days=2)
+    )
+    assert [count for *_, count in buckets] == [2, 2]
+
+
+def test_csv_sink(tmp_path: Path, stations: list[StationConfig]):
+    sink = CSVSink(str(tmp_path / "measurements.csv"))
+    Backfill(stations, [sink]).run(UPLOADS[:1])
+    sink.close()
+
+    with open(tmp_path / "measurements.csv", newline="") as csv_file:
+        rows = list(csv.reader(csv_file))
+    timestamp = str(datetime(2025, 2, 15, 17, 30, 20, tzinfo=timezone.utc).timestamp())
+    assert rows[0] == ["station", "timestamp", "sensor", "value", "unit"]
+    assert sorted(rows[1:]) == [
+        ["STATION", timestamp, "barometric_pressure", "985.439", "hPa"],
+        ["STATION", timestamp, "outdoor_humidity", "40.0", "%"],
+        ["STATION", timestamp, "outdoor_temperature", "21.111", "°C"],
+        ["STATION", timestamp, "outdoor_temperature_2", "15.556", "°C"],
+        ["STATION", timestamp, "uv_index", "3.0", "UV index"],
+    ]
@@ -0,0 +1,341 @@
+from pathlib import Path
+import re
+import time
+
+from pwsproto.config import (
+    Config,
+    ConfigError,
+    ConfigWatcher,
+    PolicyConfig,
+    StationFleet,
+    TargetConfig,
+    load_config,
+    parse_config,
+)
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.pws_request import PWSRequestProcessor
+
+import pytest
+
+
+CONFIG = """
+[targets.default]
+host = "127.0.0.1"
+port = {port}
+
+[policies.default]
+queue_size = 0
+
+[[stations]]
+id = "STATION1"
+password = "secret1"
+
+[[stations]]
+name = "garden"
+id = "STATION2"
+password = "secret2"
+sensors = ["outdoor_temperature"]
+"""
+
+
+@pytest.fixture
+def ha_stub():
+    server = HAStubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def token(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("LLT", "token")
+
+
+def _write_config(path: Path, port: int, extra: str = "") -> Path:
+    path.write_text(CONFIG.format(port=port) + extra)
+    return path
+
+
+def _upload(id: str, password: str, tempf: str) -> dict[str, str]:
+    return {
+        "ID": id,
+        "PASSWORD": password,
+        "dateutc": "2024-01-01 00:00:00",
+        "tempf": tempf,
+        "humidity": "40",
+    }
+
+
+def test_load_config(tmp_path: Path):
+    config = load_config(_write_config(tmp_path / "pws.toml", 8123))
+
+    assert config.targets["default"] == TargetConfig(host="127.0.0.1", port=8123)
+    assert config.policies["default"] == PolicyConfig(queue_size=0)
+    assert [station.name for station in config.stations] == ["STATION1", "garden"]
+    assert config.stations[0].sensors is None
+    assert config.stations[1].sensors == frozenset({"outdoor_temperature"})
+
+
+def test_default_target_and_policy():
+    default_target = TargetConfig(host="ha.local")
+    config = parse_config(
+        {"stations": [{"id": "STATION", "password": "secret"}]},
+        default_target=default_target,
+    )
+
+    assert config.targets == {"default": default_target}
+    assert config.policies == {"default": PolicyConfig()}
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {"stations": [{"id": "STATION", "password": "secret"}]},
+        {"stations": [{"id": "STATION"}]},
+        {"stations": [{"id": "STATION", "password": "secret", "colour": "red"}]},
+        {
+            "targets": {"default": {"host": "ha.local"}},
+            "stations": [
+                {"id": "STATION", "password": "secret"},
+                {"id": "STATION", "password": "other"},
+            ],
+        },
+        {
+            "targets": {"default": {"host": "ha.local"}},
+            "stations": [{"id": "STATION", "password": "secret", "policy": "fast"}],
+        },
+        {
+            "targets": {"default": {"host": "ha.local"}},
+            "policies": {"default": {"overflow": "drop-newest"}},
+        },
+        {
+            "targets": {"default": {"host": "ha.local"}},
+            "stations": [
+                {
+                    "id": "STATION",
+                    "password": "secret",
+                    "sensor_units": {"outdoor_temperature": "degrees"},
+                }
+            ],
+        },
+    ],
+)
+def test_invalid_config(document):
+    with pytest.raises(ConfigError):
+        parse_config(document)
+
+
+@pytest.mark.parametrize(
+    "document, path",
+    [
+        ({"stations": [{"id": "STATION", "password": 123456}]}, "stations[0].password"),
+        (
+            {"targets": {"default": {"host": "ha.local", "concurrency": "4"}}},
+            "targets.default.concurrency",
+        ),
+        (
+            {"targets": {"default": {"host": "ha.local", "retries": True}}},
+            "targets.default.retries",
+        ),
+        ({"policies": {"fast": {"spool_dir": 1}}}, "policies.fast.spool_dir"),
+        (
+            {"stations": [{"id": "STATION", "password": "secret", "sensors": [1]}]},
+            "stations[0].sensors",
+        ),
+        (
+            {"stations": [{"id": "S", "password": "secret", "sensor_units": {"a": 1}}]},
+            "stations[0].sensor_units",
+        ),
+    ],
+)
+def test_invalid_config_types(document, path: str):
+    with pytest.raises(ConfigError, match=rf"Invalid value of {re.escape(path)}:"):
+        parse_config(document)
+
+
+def test_config_types():
+    config = parse_config(
+        {
+            "targets": {"default": {"host": "ha.local", "port": None, "deadline": 5}},
+            "stations": [
+                {
+                    "id": "STATION",
+                    "password": "secret",
+                    "sensors": ["outdoor_temperature"],
+                    "sensor_units": {"outdoor_temperature": "°C"},
+                }
+            ],
+        }
+    )
+    assert config.targets["default"].deadline == 5
+    assert config.stations[0].sensors == frozenset(["outdoor_temperature"])
+
+
+def test_fleet_publishes_allowed_sensors(tmp_path: Path, ha_stub: HAStubServer):
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+    fleet.apply(load_config(_write_config(tmp_path / "pws.toml", ha_stub.port)))
+
+    processor.process_request(_upload("STATION1", "secret1", "70"))
+    processor.process_request(_upload("STATION2", "secret2", "60"))
+    with pytest.raises(PermissionError):
+        processor.process_request(_upload("STATION2", "secret1", "60"))
+    fleet.close()
+
+    assert ha_stub.states["sensor.station1_outdoor_temperature"]["state"] == "70.0"
+    assert ha_stub.states["sensor.station1_outdoor_humidity"]["state"] == "40.0"
+    assert ha_stub.states["sensor.station2_outdoor_temperature"]["state"] == "60.0"
+    assert "sensor.station2_outdoor_humidity" not in ha_stub.states
+
+
+def test_fleet_sensor_units(tmp_path: Path, ha_stub: HAStubServer):
+    path = _write_config(
+        tmp_path / "pws.toml",
+        ha_stub.port,
+        'unit_system = "metric"\n'
+        'sensor_units = { outdoor_temperature = "K", rain_daily = "cm" }\n',
+    )
+    config = load_config(path)
+    assert config.stations[1].sensor_units == (
+        ("outdoor_temperature", "K"),
+        ("rain_daily", "cm"),
+    )
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+    fleet.apply(config)
+
+    processor.process_request(_upload("STATION1", "secret1", "50"))
+    processor.process_request(_upload("STATION2", "secret2", "50"))
+    fleet.close()
+
+    assert ha_stub.states["sensor.station1_outdoor_temperature"]["state"] == "50.0"
+    temperature = ha_stub.states["sensor.station2_outdoor_temperature"]
+    assert temperature["state"] == "283.15"
+    assert temperature["attributes"]["unit_of_measurement"] == "K"
+
+
+def test_reload_keeps_station_state(tmp_path: Path):
+    path = _write_config(tmp_path / "pws.toml", 8123)
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor, grace_period=0.0)
+    fleet.apply(load_config(path))
+    station = fleet.stations["STATION1"]
+    client = fleet.clients["default"][1]
+    station.update_callback = None
+    processor.process_request(_upload("STATION1", "secret1", "70"))
+
+    path.write_text(
+        CONFIG.format(port=8123).replace('"secret1"', '"changed"')
+        + '\n[[stations]]\nid = "STATION3"\npassword = "secret3"\n'
+    )
+    fleet.apply(load_config(path))
+
+    # Same station and sensors, new password
+    assert fleet.stations["STATION1"] is station
+    payload = station.sensors["outdoor_temperature"].payload
+    assert payload is not None
+    assert payload["state"] == "70.0"
+    assert processor.authenticate("STATION1", "secret1") == []
+    assert processor.authenticate("STATION1", "changed") == [station]
+    assert len(processor.authenticate("STATION3", "secret3")) == 1
+    # The unchanged target keeps its client
+    assert fleet.clients["default"][1] is client
+
+    path.write_text(CONFIG.format(port=8123))
+    fleet.apply(load_config(path))
+    assert processor.authenticate("STATION3", "secret3") == []
+    fleet.close()
+
+
+def test_reload_restricts_sensors(tmp_path: Path):
+    path = _write_config(tmp_path / "pws.toml", 8123)
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+    fleet.apply(load_config(path))
+    station = fleet.stations["STATION1"]
+    station.update_callback = None
+    processor.process_request(_upload("STATION1", "secret1", "70"))
+
+    path.write_text(
+        CONFIG.format(port=8123).replace(
+            '"secret1"', '"secret1"\nsensors = ["outdoor_humidity"]'
+        )
+    )
+    fleet.apply(load_config(path))
+    fleet.close()
+
+    assert list(station.get_ha_payloads()) == ["outdoor_humidity"]
+
+
+def test_watcher_keeps_config_on_error(tmp_path: Path):
+    path = _write_config(tmp_path / "pws.toml", 8123)
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+    fleet.apply(load_config(path))
+    watcher = ConfigWatcher(path, load_config, fleet, poll_interval=0.01).start(
+        handle_sighup=False
+    )
+
+    path.write_text("[[stations]\n")
+    watcher.reload_requested.set()
+    time.sleep(0.1)
+    assert len(processor.authenticate("STATION1", "secret1")) == 1
+
+    path.write_text(CONFIG.format(port=8123).replace('"secret1"', '"changed"'))
+    watcher.reload_requested.set()
+    end = time.monotonic() + 5.0
+    while len(processor.authenticate("STATION1", "changed")) == 0:
+        assert time.monotonic() < end, "Timed out"
+        time.sleep(0.01)
+    watcher.stop()
+    fleet.close()
+
+
+def test_watcher_survives_unexpected_errors(tmp_path: Path):
+    path = _write_config(tmp_path / "pws.toml", 8123)
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+    loads = []
+
+    def load(path: str | Path) -> Config:
+        loads.append(path)
+        if len(loads) == 1:
+            raise RuntimeError("Unexpected")
+        return load_config(path)
+
+    watcher = ConfigWatcher(path, load, fleet, poll_interval=0.01).start(
+        handle_sighup=False
+    )
+    watcher.reload_requested.set()
+    end = time.monotonic() + 5.0
+    while len(loads) < 1:
+        assert time.monotonic() < end, "Timed out"
+        time.sleep(0.01)
+    watcher.reload_requested.set()
+    while len(processor.authenticate("STATION1", "secret1")) == 0:
+        assert time.monotonic() < end, "Timed out"
+        time.sleep(0.01)
+    assert watcher.thread.is_alive()
+    watcher.stop()
+    fleet.close()
+
+
+def test_many_stations_start_fast(tmp_path: Path):
+    path = tmp_path / "pws.toml"
+    stations = "".join(
+        f'[[stations]]\nid = "STATION{i}"\npassword = "secret{i}"\n'
+        for i in range(10000)
+    )
+    path.write_text(CONFIG.format(port=8123).split("[[stations]]")[0] + stations)
+    processor = PWSRequestProcessor([])
+    fleet = StationFleet(processor)
+
+    start = time.perf_counter()
+    fleet.apply(load_config(path))
+    elapsed = time.perf_counter() - start
+
+    assert len(processor.stations) == 10000
+    # A single client and publisher are shared by the stations
+    assert len(fleet.clients) == 1
+    assert len(fleet.publishers) == 1
+    assert elapsed < 2.0
+    fleet.close()
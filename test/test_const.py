@@ -0,0 +1,61 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+
+from homeassistant import const as ha_const
+from homeassistant.components.sensor import const as ha_sensor_const
+
+import pwsproto
+from pwsproto import const
+from pwsproto.station import SENSOR_MAPPING
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "UnitOfTemperature",
+        "UnitOfPressure",
+        "UnitOfSpeed",
+        "UnitOfPrecipitationDepth",
+        "UnitOfIrradiance",
+    ],
+)
+def test_units_match_home_assistant(name: str):
+    ha_units = getattr(ha_const, name)
+    for unit in getattr(const, name):
+        assert ha_units[unit.name] == unit
+
+
+def test_constants_match_home_assistant():
+    for name in (
+        "PERCENTAGE",
+        "UV_INDEX",
+        "CONCENTRATION_PARTS_PER_MILLION",
+        "CONCENTRATION_PARTS_PER_BILLION",
+        "CONCENTRATION_MICROGRAMS_PER_CUBIC_METER",
+    ):
+        assert getattr(const, name) == getattr(ha_const, name)
+
+
+def test_device_classes_match_home_assistant():
+    for device_class in const.SensorDeviceClass:
+        assert ha_sensor_const.SensorDeviceClass[device_class.name] == device_class
+    for description in SENSOR_MAPPING.values():
+        if description.device_class is not None:
+            ha_sensor_const.SensorDeviceClass(description.device_class)
+
+
+@pytest.mark.parametrize("module", ["pwsproto.probe", "pwsproto.server"])
+def test_entry_points_do_not_import_home_assistant(module: str):
+    code = f"import sys, {module}; print('homeassistant' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": str(Path(pwsproto.__file__).parents[1])},
+    )
+    assert result.stdout.strip() == "False"
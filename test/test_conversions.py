@@ -1,5 +1,10 @@
+from datetime import datetime, timezone
+
+from pwsproto.pws_request import parse_dateutc
 from pwsproto.station import str_to_float, str_to_int
 
+import pytest
+
 
 def test_int_conversion():
     assert str_to_int("1") == 1
@@ -7,3 +12,23 @@ def test_int_conversion():
 
 def test_float_conversion():
     assert str_to_float("1.0") == 1.0
+
+
+def test_dateutc_conversion():
+    expected = datetime(2000, 1, 1, 10, 32, 35, tzinfo=timezone.utc)
+    assert parse_dateutc("2000-01-01 10:32:35") == expected
+    assert parse_dateutc("2000-01-01+10%3A32%3A35") == expected
+    assert parse_dateutc("2000-01-01%2010%3A32%3A35") == expected
+    assert parse_dateutc("2000-01-01T11:32:35+01:00") == expected
+    assert parse_dateutc("2000-01-01 10:32:35").tzinfo == timezone.utc
+
+
+def test_dateutc_conversion_now():
+    before = datetime.now(timezone.utc)
+    date = parse_dateutc("now")
+    assert before <= date <= datetime.now(timezone.utc)
+
+
+def test_dateutc_conversion_invalid():
+    with pytest.raises(ValueError):
+        parse_dateutc("yesterday")
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from homeassistant.const import UnitOfSpeed
+from pwsproto.derived import DerivedQuantities, SlidingMax, SlidingSum
+from pwsproto.station import Measurement, WeatherStation
+
+import pytest
+
+
+def test_sliding_max():
+    window = SlidingMax(10)
+    assert window.add(0, 5.0) == 5.0
+    assert window.add(1, 3.0) == 5.0
+    assert window.add(2, 4.0) == 5.0
+    # 5.0 expires, 4.0 remains the maximum
+    assert window.add(10, 1.0) == 4.0
+    assert window.add(12, 2.0) == 2.0
+    assert window.add(13, 7.0) == 7.0
+    assert len(window.samples) == 1
+
+
+def test_sliding_sum():
+    window = SlidingSum(10)
+    window.add(0, 1.0)
+    window.add(5, 2.0)
+    assert window.total == 3.0
+    assert window.mean() == pytest.approx(1.5)
+    window.add(10, 6.0)
+    assert window.total == 8.0
+    assert window.mean() == pytest.approx(4.0)
+    window.add(30, 1.0)
+    assert window.total == 1.0
+
+
+def _upload(minutes: float, **values: float) -> dict[str, Measurement]:
+    measurements = {
+        name: Measurement(value, UnitOfSpeed.MILES_PER_HOUR if "wind" in name else None)
+        for name, value in values.items()
+    }
+    measurements["date"] = Measurement(
+        datetime(2000, 1, 1, 23, 30) + timedelta(minutes=minutes)
+    )
+    return measurements
+
+
+def test_derived_wind():
+    derived = DerivedQuantities()
+    upload = _upload(0, wind_speed=4.0, wind_gust_speed=10.0)
+    result = derived.derive(upload["date"].value, upload)
+    assert result["wind_speed_avg_2m"].value == 4.0
+    assert result["wind_speed_avg_2m"].unit == UnitOfSpeed.MILES_PER_HOUR
+    assert result["wind_gust_speed_10m"].value == 10.0
+
+    upload = _upload(1, wind_speed=8.0, wind_gust_speed=6.0)
+    result = derived.derive(upload["date"].value, upload)
+    assert result["wind_speed_avg_2m"].value == 6.0
+    assert result["wind_gust_speed_10m"].value == 10.0
+
+    upload = _upload(10, wind_speed=2.0, wind_gust_speed=3.0)
+    result = derived.derive(upload["date"].value, upload)
+    assert result["wind_speed_avg_2m"].value == 2.0
+    assert result["wind_gust_speed_10m"].value == 6.0
+
+
+def test_derived_rain():
+    derived = DerivedQuantities()
+    for minutes, rain_daily, rain_hourly in (
+        (0, 1.0, 0.0),
+        (20, 1.5, 0.5),
+        (40, 1.75, 0.75),
+        # Midnight reset of the daily accumulation
+        (50, 0.25, 1.0),
+        # The first half inch is out of the window
+        (80, 0.25, 0.5),
+    ):
+        upload = _upload(minutes, rain_daily=rain_daily)
+        result = derived.derive(upload["date"].value, upload)
+        assert result["rain_hourly"].value == pytest.approx(rain_hourly)
+
+
+def test_derived_sent_by_station():
+    derived = DerivedQuantities()
+    upload = _upload(0, wind_speed=4.0, wind_speed_avg_2m=3.0, rain_daily=0.5)
+    upload["rain_hourly"] = Measurement(0.1)
+    assert derived.derive(upload["date"].value, upload) == {}
+
+
+def test_derived_late_upload():
+    derived = DerivedQuantities()
+    upload = _upload(5, wind_speed=4.0)
+    derived.derive(upload["date"].value, upload)
+    upload = _upload(0, wind_speed=100.0)
+    assert derived.derive(upload["date"].value, upload) == {}
+    upload = _upload(6, wind_speed=8.0)
+    assert derived.derive(upload["date"].value, upload)[
+        "wind_speed_avg_2m"
+    ].value == pytest.approx(6.0)
+
+
+def test_station_derived():
+    station = WeatherStation("test_user", "test_password", derived=DerivedQuantities())
+    station.update_measurement(_upload(0, wind_speed=4.0, rain_daily=0.5))
+    payloads = station.get_ha_payloads()
+    assert payloads["wind_speed_avg_2m"]["state"] == "4.0"
+    assert payloads["rain_hourly"]["state"] == "0.0"
+    assert "wind_gust_speed_10m" not in payloads
@@ -0,0 +1,250 @@
+import time
+from datetime import datetime
+
+from pwsproto import metrics
+from pwsproto.ha_http_client import PublishRejected, UpdateHAAPI
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.station import Measurement, WeatherStation
+
+import pytest
+
+
+@pytest.fixture
+def ha_stub():
+    server = HAStubServer().start()
+    yield server
+    server.stop()
+
+
+def _sample_station(update_callback: UpdateHAAPI) -> WeatherStation:
+    return WeatherStation("test_station", "test_password", update_callback)
+
+
+def _sample_measurement_dict(temperature: float) -> dict[str, Measurement]:
+    return {
+        "date": Measurement(datetime(1999, 12, 31, 23, 59, 59)),
+        "outdoor_temperature": Measurement(temperature),
+        "outdoor_humidity": Measurement(40.0),
+        "barometric_pressure": Measurement(29.1),
+    }
+
+
+def test_update_ha_api_states(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI("token", "127.0.0.1", ha_port=ha_stub.port)
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    update_ha_api.close()
+
+    assert len(ha_stub.states) == 3
+    state = ha_stub.states["sensor.test_station_outdoor_temperature"]
+    assert state["state"] == "70.0"
+
+
+def test_update_ha_api_reuses_connection(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=1
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    station.update_measurement(_sample_measurement_dict(71.0))
+    update_ha_api.close()
+
+    assert ha_stub.requests == 4
+    assert ha_stub.connections == 1
+
+
+def test_update_ha_api_keeps_sensor_order(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=4, wait=False
+    )
+    station = _sample_station(update_ha_api)
+    for temperature in range(50):
+        station.update_measurement(_sample_measurement_dict(float(temperature)))
+    update_ha_api.close()
+
+    history = ha_stub.history["sensor.test_station_outdoor_temperature"]
+    assert history == [f"{temperature}.0" for temperature in range(50)]
+
+
+def test_update_ha_api_retries(ha_stub: HAStubServer):
+    ha_stub.available = False
+    update_ha_api = UpdateHAAPI("token", "127.0.0.1", ha_port=ha_stub.port, retries=2)
+    station = _sample_station(update_ha_api)
+    station.update_measurement(
+        {
+            "date": Measurement(datetime(1999, 12, 31, 23, 59, 59)),
+            "outdoor_temperature": Measurement(70.0),
+        }
+    )
+    update_ha_api.close()
+
+    assert ha_stub.requests == 3
+    assert len(ha_stub.states) == 0
+
+
+def test_update_ha_api_does_not_wait(ha_stub: HAStubServer):
+    ha_stub.delay = 0.5
+    update_ha_api = UpdateHAAPI("token", "127.0.0.1", ha_port=ha_stub.port)
+    station = _sample_station(update_ha_api)
+
+    start = time.monotonic()
+    station.update_measurement(_sample_measurement_dict(70.0))
+    assert time.monotonic() - start < ha_stub.delay
+
+    update_ha_api.close()
+    assert len(ha_stub.states) == 3
+
+
+def test_update_ha_api_deadline(ha_stub: HAStubServer):
+    ha_stub.delay = 0.5
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, deadline=0.1, wait=True
+    )
+
+    start = time.monotonic()
+    assert not update_ha_api.publish(
+        "test_station", {"outdoor_temperature": {"state": "70.0"}}
+    )
+    assert time.monotonic() - start < ha_stub.delay
+
+    update_ha_api.close()
+
+
+@pytest.mark.parametrize("batch_path", [None, "/api/pwsproto/states"])
+def test_update_ha_api_rejected(batch_path: str | None):
+    ha_stub = HAStubServer(batch_path=batch_path).start()
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, batch_path=batch_path
+    )
+    payloads = {
+        "outdoor_temperature": {"state": "70.0"},
+        "outdoor-humidity": {"state": "40.0"},
+    }
+    # Uppercase station IDs are lowercased, but the sensor name is invalid
+    with pytest.raises(PublishRejected) as rejected:
+        update_ha_api.publish("STATION", payloads, wait_completion=True)
+    assert rejected.value.sensor_names == ["outdoor-humidity"]
+    assert list(ha_stub.states) == ["sensor.station_outdoor_temperature"]
+
+    # Unavailability is retried rather than rejected
+    ha_stub.available = False
+    assert not update_ha_api.publish(
+        "STATION", {"outdoor_temperature": {"state": "71.0"}}, wait_completion=True
+    )
+    update_ha_api.close()
+    ha_stub.stop()
+
+
+def test_update_ha_api_delta(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=1
+    )
+    station = _sample_station(update_ha_api)
+    sent = metrics.HA_PUSHES_SENT.value
+    suppressed = metrics.HA_PUSHES_SUPPRESSED.value
+    station.update_measurement(_sample_measurement_dict(70.0))
+    station.update_measurement(_sample_measurement_dict(70.0))
+    station.update_measurement(_sample_measurement_dict(71.0))
+    update_ha_api.close()
+
+    assert update_ha_api.published_states is not None
+    assert update_ha_api.published_states.pushes_sent == 4
+    assert update_ha_api.published_states.pushes_suppressed == 5
+    assert metrics.HA_PUSHES_SENT.value - sent == 4
+    assert metrics.HA_PUSHES_SUPPRESSED.value - suppressed == 5
+    assert 'pws_ha_pushes_total{outcome="suppressed"}' in metrics.REGISTRY.render()
+    assert ha_stub.requests == 4
+    state = ha_stub.states["sensor.test_station_outdoor_temperature"]
+    assert state["state"] == "71.0"
+
+
+def test_update_ha_api_heartbeat(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, heartbeat_interval=0
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    station.update_measurement(_sample_measurement_dict(70.0))
+    update_ha_api.close()
+
+    assert ha_stub.requests == 6
+
+
+def test_update_ha_api_delta_retries_failed(ha_stub: HAStubServer):
+    ha_stub.available = False
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=1, wait=True
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    ha_stub.available = True
+    station.update_measurement(_sample_measurement_dict(70.0))
+    update_ha_api.close()
+
+    assert ha_stub.requests == 6
+    assert len(ha_stub.states) == 3
+
+
+def test_update_ha_api_batch():
+    ha_stub = HAStubServer(batch_path="/api/pwsproto/states").start()
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, batch_path="/api/pwsproto/states"
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    update_ha_api.close()
+    ha_stub.stop()
+
+    assert ha_stub.requests == 1
+    assert len(ha_stub.states) == 3
+    state = ha_stub.states["sensor.test_station_outdoor_temperature"]
+    assert state["state"] == "70.0"
+
+
+def test_update_ha_api_batch_fallback(ha_stub: HAStubServer):
+    update_ha_api = UpdateHAAPI(
+        "token",
+        "127.0.0.1",
+        ha_port=ha_stub.port,
+        wait=True,
+        batch_path="/api/pwsproto/states",
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    station.update_measurement(_sample_measurement_dict(71.0))
+    update_ha_api.close()
+
+    # Failed batch, 3 sensors, then only the changed sensor
+    assert ha_stub.requests == 5
+    assert len(ha_stub.states) == 3
+    assert not update_ha_api.batch_available()
+
+
+def test_update_ha_api_batch_not_applied(ha_stub: HAStubServer):
+    handle_post = ha_stub.handle_post
+    webhook_requests = []
+
+    def handle_unregistered_webhook(path: str, body: bytes):
+        # Home Assistant answers webhooks nobody registered with 200
+        if path == "/api/webhook/pwsproto":
+            webhook_requests.append(body)
+            return 200, {}
+        return handle_post(path, body)
+
+    ha_stub.handle_post = handle_unregistered_webhook  # type: ignore[method-assign]
+    update_ha_api = UpdateHAAPI(
+        "token",
+        "127.0.0.1",
+        ha_port=ha_stub.port,
+        wait=True,
+        batch_path="/api/webhook/pwsproto",
+    )
+    station = _sample_station(update_ha_api)
+    station.update_measurement(_sample_measurement_dict(70.0))
+    update_ha_api.close()
+
+    # Sent again one by one
+    assert len(webhook_requests) == 1
+    assert ha_stub.requests == 3
+    assert len(ha_stub.states) == 3
+    assert not update_ha_api.batch_available()
@@ -0,0 +1,256 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import threading
+
+from pwsproto.history import (
+    HistoryLocked,
+    HistoryStore,
+    Rollup,
+    Segment,
+    SensorHistory,
+)
+from pwsproto.station import Measurement, WeatherStation
+
+from unittest.mock import patch
+import pytest
+
+
+def test_rollup():
+    rollup = Rollup(60, retention=100)
+    for timestamp, value in ((0, 1.0), (30, 3.0), (60, 5.0), (10, 2.0)):
+        rollup.add(timestamp, value)
+    assert rollup.query(0, 120) == [
+        (0, 1.0, 3.0, 2.0, 3),
+        (60, 5.0, 5.0, 5.0, 1),
+    ]
+    assert rollup.query(60, 120) == [(60, 5.0, 5.0, 5.0, 1)]
+
+
+def test_rollup_retention():
+    rollup = Rollup(60, retention=10)
+    for i in range(25):
+        rollup.add(i * 60, float(i))
+    buckets = rollup.query(0, 25 * 60)
+    assert len(buckets) <= 10
+    assert buckets[-1] == (24 * 60, 24.0, 24.0, 24.0, 1)
+
+
+def test_sensor_history_memory():
+    history = SensorHistory(capacity=8)
+    for i in range(20):
+        history.append(float(i), float(i) * 2)
+    # Without a directory, spilled samples are discarded
+    samples = history.query(0, 20)
+    assert samples[-1] == (19.0, 38.0)
+    assert len(samples) <= 8
+    assert history.aggregate(0, 3600, 60) == [(0, 0.0, 38.0, 19.0, 20)]
+
+
+def test_sensor_history_spill(tmp_path: Path):
+    history = SensorHistory(tmp_path, capacity=8)
+    for i in range(20):
+        history.append(float(i), float(i) * 2)
+    assert len(history.segments) > 0
+    assert history.query(0, 20) == [(float(i), float(i) * 2) for i in range(20)]
+    assert history.query(5, 15) == [(float(i), float(i) * 2) for i in range(5, 15)]
+
+    history.flush()
+    reloaded = SensorHistory(tmp_path, capacity=8)
+    assert reloaded.query(0, 20) == [(float(i), float(i) * 2) for i in range(20)]
+    assert reloaded.aggregate(0, 3600, 60) == [(0, 0.0, 38.0, 19.0, 20)]
+    reloaded.append(20.0, 40.0)
+    reloaded.flush()
+    assert len(list(tmp_path.glob("*.seg"))) == len(reloaded.segments)
+
+
+def test_sensor_history_grows(tmp_path: Path):
+    history = SensorHistory(tmp_path, capacity=8)
+    assert len(history.timestamps) == 0
+    for i in range(3):
+        history.append(float(i), float(i))
+    assert len(history.timestamps) == 3
+    history.extend(array("d", range(3, 20)), array("d", range(3, 20)))
+    assert len(history.timestamps) == 8
+    assert history.query(0, 20) == [(float(i), float(i)) for i in range(20)]
+    history.flush()
+    # Released once spilled
+    assert len(history.timestamps) == 0
+    history.append(20.0, 20.0)
+    assert history.query(15, 25) == [(float(i), float(i)) for i in range(15, 21)]
+
+
+def test_sensor_history_saved_rollups(tmp_path: Path):
+    history = SensorHistory(tmp_path, capacity=8)
+    for i in range(20):
+        history.append(float(i), float(i) * 2)
+    history.flush()
+    # Segments written after the rollups were saved, e.g. by a backfill
+    with_backfill = SensorHistory(tmp_path, capacity=8, resolutions={})
+    with_backfill.extend(array("d", [60, 61]), array("d", [1.0, 3.0]))
+    with_backfill.flush()
+
+    with patch.object(
+        Segment, "samples", autospec=True, side_effect=Segment.samples
+    ) as samples:
+        reloaded = SensorHistory(tmp_path, capacity=8)
+    # Only the backfilled segment is replayed
+    assert [call.args[0].path.name for call in samples.call_args_list] == [
+        with_backfill.segments[-1].path.name
+    ]
+    assert reloaded.aggregate(0, 3600, 60) == [
+        (0, 0.0, 38.0, 19.0, 20),
+        (60, 1.0, 3.0, 2.0, 2),
+    ]
+
+
+def test_sensor_history_extend(tmp_path: Path):
+    appended = SensorHistory(tmp_path / "appended", capacity=8)
+    extended = SensorHistory(tmp_path / "extended", capacity=8)
+    timestamps = array("d", range(30))
+    values = array("d", (float(i) * 2 for i in range(30)))
+    for timestamp, value in zip(timestamps[:3], values[:3]):
+        appended.append(timestamp, value)
+        extended.append(timestamp, value)
+    for timestamp, value in zip(timestamps[3:], values[3:]):
+        appended.append(timestamp, value)
+    # Wraps around the ring buffer and spills several times
+    extended.extend(timestamps[3:], values[3:])
+
+    assert extended.query(0, 30) == appended.query(0, 30)
+    assert extended.aggregate(0, 3600, 60) == appended.aggregate(0, 3600, 60)
+    extended.flush()
+    assert SensorHistory(tmp_path / "extended").query(0, 30) == appended.query(0, 30)
+
+
+def test_sensor_history_truncated_segment(tmp_path: Path):
+    history = SensorHistory(tmp_path, capacity=8)
+    for i in range(20):
+        history.append(float(i), float(i) * 2)
+    history.flush()
+    assert list(tmp_path.glob("*.tmp")) == []
+    # Left by a crash while writing
+    path = history.segments[-1].path
+    path.write_bytes(path.read_bytes()[:-4])
+
+    reloaded = SensorHistory(tmp_path, capacity=8)
+    assert len(reloaded.segments) == len(history.segments) - 1
+    assert path.with_name(path.name + ".bad").exists()
+    reloaded.append(20.0, 40.0)
+    assert reloaded.query(20, 21) == [(20.0, 40.0)]
+
+
+def test_rollup_drops_expired_late_samples():
+    rollup = Rollup(60, retention=10)
+    for i in range(10, 20):
+        rollup.add(i * 60, float(i))
+    rollup.add(0, 0.0)
+    assert rollup.query(0, 20 * 60)[0] == (10 * 60, 10.0, 10.0, 10.0, 1)
+
+
+def test_sensor_history_out_of_order(tmp_path: Path):
+    history = SensorHistory(tmp_path, capacity=8)
+    history.extend(array("d", [1000, 1001]), array("d", [1.0, 2.0]))
+    # Older samples, e.g. backfilled or from a station with a late clock
+    history.extend(array("d", range(10, 16)), array("d", range(6)))
+    history.append(20.0, 6.0)
+    history.flush()
+
+    expected = [(float(t), float(t - 10)) for t in range(10, 16)] + [(20.0, 6.0)]
+    assert history.query(0, 100) == expected
+    assert SensorHistory(tmp_path, capacity=8).query(0, 100) == expected
+    assert [timestamp for timestamp, _ in history.query(0, 2000)][-2:] == [
+        1000.0,
+        1001.0,
+    ]
+
+
+def test_sensor_history_unknown_resolution():
+    with pytest.raises(ValueError, match="No rollup"):
+        SensorHistory().aggregate(0, 60, 30)
+
+
+def test_history_store_evict(tmp_path: Path):
+    history = HistoryStore(tmp_path, capacity=8)
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    with patch("pwsproto.history.time.monotonic", return_value=0.0):
+        history.record("idle", start, {"outdoor_temperature": Measurement(1.0)})
+    with patch("pwsproto.history.time.monotonic", return_value=100.0):
+        history.record("active", start, {"outdoor_temperature": Measurement(2.0)})
+        assert history.evict(max_idle=50.0) == 1
+    assert list(history.sensors) == [("active", "outdoor_temperature")]
+    assert history.query(
+        "idle", "outdoor_temperature", start, start + timedelta(minutes=1)
+    ) == [(start.timestamp(), 1.0)]
+    assert history.evict() == 2
+    assert history.sensors == {}
+
+
+def test_history_store_loads_without_lock(tmp_path: Path):
+    history = HistoryStore(tmp_path)
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    loading = threading.Event()
+    loaded = threading.Event()
+    open_segment = Segment.open
+
+    def slow_open(path: Path) -> Segment:
+        loading.set()
+        assert loaded.wait(5)
+        return open_segment(path)
+
+    segment = SensorHistory(tmp_path / "slow" / "outdoor_temperature")
+    segment.append(start.timestamp(), 1.0)
+    segment.flush()
+    with patch.object(Segment, "open", side_effect=slow_open):
+        thread = threading.Thread(
+            target=history.query, args=("slow", "outdoor_temperature", start, start)
+        )
+        thread.start()
+        assert loading.wait(5)
+        # Other sensors are recorded while the slow one is loaded
+        history.record("fast", start, {"outdoor_temperature": Measurement(2.0)})
+        loaded.set()
+        thread.join()
+    assert set(history.sensors) == {
+        ("fast", "outdoor_temperature"),
+        ("slow", "outdoor_temperature"),
+    }
+
+
+def test_history_store_lock(tmp_path: Path):
+    server = HistoryStore(tmp_path)
+    server.lock_directory()
+    backfill = HistoryStore(tmp_path)
+    with pytest.raises(HistoryLocked):
+        backfill.lock_directory()
+    server.close()
+    backfill.lock_directory()
+    backfill.close()
+
+
+def test_station_history():
+    history = HistoryStore()
+    station = WeatherStation("test_user", "test_password", history=history)
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    for minute in range(90):
+        station.update_measurement(
+            {
+                "date": Measurement(start + timedelta(minutes=minute)),
+                "outdoor_temperature": Measurement(float(minute)),
+                "software_type": Measurement("vws versionxx"),
+            }
+        )
+
+    samples = history.query(
+        "test_user", "outdoor_temperature", start, start + timedelta(minutes=10)
+    )
+    assert [value for _, value in samples] == [float(i) for i in range(10)]
+    assert history.query("test_user", "software_type", start, start) == []
+
+    hourly = history.aggregate(
+        "test_user", "outdoor_temperature", start, start + timedelta(hours=2)
+    )
+    assert [(minimum, maximum, mean) for _, minimum, maximum, mean, _ in hourly] == [
+        (0.0, 59.0, 29.5),
+        (60.0, 89.0, 74.5),
+    ]
@@ -0,0 +1,140 @@
+from typing import Any
+from wsgiref.util import setup_testing_defaults
+
+from bottle import Bottle
+
+from pwsproto.ingest import PWS_ROUTE, IngestApp, parse_query
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.server import RequestProcessor
+from pwsproto.station import WeatherStation
+
+import pytest
+
+QUERY = (
+    "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A30%3A20&winddir=230"
+    "&windspeedmph=12&tempf=70&humidity=40&weather=Sonnig&clouds="
+    "&softwaretype=vws%20versionxx&action=updateraw"
+)
+
+
+class Response:
+    def __init__(self):
+        self.status: str | None = None
+        self.headers: list[tuple[str, str]] = []
+
+    def __call__(self, status: str, headers: list[tuple[str, str]], exc_info=None):
+        self.status = status
+        self.headers = headers
+
+
+def _request(app: Any, path: str, query: str = "") -> tuple[str, bytes]:
+    environ: dict[str, Any] = {"PATH_INFO": path, "QUERY_STRING": query}
+    setup_testing_defaults(environ)
+    response = Response()
+    body = b"".join(app(environ, response))
+    assert response.status is not None
+    return response.status, body
+
+
+@pytest.fixture
+def station() -> WeatherStation:
+    return WeatherStation("STATION", "KEY")
+
+
+@pytest.fixture
+def processor(station: WeatherStation) -> PWSRequestProcessor:
+    return PWSRequestProcessor([station])
+
+
+def test_parse_query():
+    assert parse_query(QUERY) == {
+        "ID": "STATION",
+        "PASSWORD": "KEY",
+        "dateutc": "2025-02-15 17:30:20",
+        "winddir": "230",
+        "windspeedmph": "12",
+        "tempf": "70",
+        "humidity": "40",
+        "weather": "Sonnig",
+        "clouds": "",
+        "softwaretype": "vws versionxx",
+        "action": "updateraw",
+    }
+
+
+def test_parse_query_edge_cases():
+    assert parse_query("") == {}
+    assert parse_query("a=1&&a=2&flag&weather=%C3%A9t%C3%A9") == {
+        "a": "2",
+        "flag": "",
+        "weather": "été",
+    }
+
+
+def test_upload(processor: PWSRequestProcessor, station: WeatherStation):
+    status, _ = _request(IngestApp(processor), PWS_ROUTE, QUERY)
+
+    assert status == "200 OK"
+    temperature = station.sensors["outdoor_temperature"].last_measurement
+    software_type = station.sensors["software_type"].last_measurement
+    assert temperature is not None and software_type is not None
+    assert temperature.value == 70.0
+    assert software_type.value == "vws versionxx"
+
+
+def test_same_measurements_as_bottle_route(processor: PWSRequestProcessor):
+    bottle_station = WeatherStation("STATION", "KEY")
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=RequestProcessor([bottle_station]))
+    _request(app, PWS_ROUTE, QUERY)
+    _request(IngestApp(processor), PWS_ROUTE, QUERY)
+
+    assert bottle_station.get_ha_payloads() == processor.stations[0].get_ha_payloads()
+
+
+@pytest.mark.parametrize("app_type", ["ingest", "bottle"])
+@pytest.mark.parametrize(
+    "query, status",
+    [
+        ("ID=STATION&PASSWORD=WRONG&tempf=70", "403 Forbidden"),
+        ("ID=STATION&tempf=70", "400 Bad Request"),
+        ("ID=STATION&PASSWORD=KEY&tempf=70", "400 Bad Request"),
+        ("ID=STATION&PASSWORD=KEY&dateutc=yesterday&tempf=70", "400 Bad Request"),
+    ],
+)
+def test_rejected_upload(
+    processor: PWSRequestProcessor, app_type: str, query: str, status: str
+):
+    if app_type == "ingest":
+        app = IngestApp(processor)
+    else:
+        app = Bottle()
+        app.route(
+            PWS_ROUTE,
+            method="GET",
+            callback=RequestProcessor([WeatherStation("STATION", "KEY")]),
+        )
+    assert _request(app, PWS_ROUTE, query)[0] == status
+
+
+def test_fallback(processor: PWSRequestProcessor):
+    app = Bottle()
+    app.route("/metrics", method="GET", callback=lambda: "metrics")
+
+    assert _request(IngestApp(processor, fallback=app), "/metrics") == (
+        "200 OK",
+        b"metrics",
+    )
+    assert _request(IngestApp(processor), "/metrics")[0] == "404 Not Found"
+
+
+def test_mounted_under_bottle(processor: PWSRequestProcessor, station: WeatherStation):
+    app = Bottle()
+    app.mount(
+        "/weatherstation/", IngestApp(processor, path="/updateweatherstation.php")
+    )
+
+    status, _ = _request(app, PWS_ROUTE, QUERY)
+
+    assert status == "200 OK"
+    assert "outdoor_temperature" in station.sensors
@@ -0,0 +1,139 @@
+from http import HTTPStatus
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+
+from custom_components.pwsproto.const import BATCH_ROUTE, DOMAIN, PWS_ROUTE  # noqa: E402
+
+CONFIG = {
+    DOMAIN: {
+        "stations": [
+            {"id": "STATION", "password": "secret"},
+            {
+                "id": "GARDEN",
+                "password": "secret",
+                "sensors": ["outdoor_temperature"],
+                "unit_system": "metric",
+            },
+        ]
+    }
+}
+
+
+def _upload(id: str, password: str, tempf: str) -> dict[str, str]:
+    return {
+        "ID": id,
+        "PASSWORD": password,
+        "dateutc": "2024-01-01 00:00:00",
+        "tempf": tempf,
+        "humidity": "40",
+        "softwaretype": "test",
+    }
+
+
+def _state(hass: HomeAssistant, entity_id: str) -> str:
+    state = hass.states.get(entity_id)
+    assert state is not None
+    return state.state
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    yield
+
+
+@pytest.fixture
+async def client(hass: HomeAssistant, hass_client_no_auth):
+    assert await async_setup_component(hass, DOMAIN, CONFIG)
+    await hass.async_block_till_done()
+    return await hass_client_no_auth()
+
+
+async def test_upload_updates_entities(hass: HomeAssistant, client):
+    response = await client.get(PWS_ROUTE, params=_upload("STATION", "secret", "70"))
+    assert response.status == HTTPStatus.OK
+    await hass.async_block_till_done()
+
+    temperature = hass.states.get("sensor.station_outdoor_temperature")
+    assert temperature is not None
+    # Converted to the unit system of Home Assistant
+    assert temperature.state == "21.1"
+    assert temperature.attributes["unit_of_measurement"] == "°C"
+    assert _state(hass, "sensor.station_outdoor_humidity") == "40.0"
+    assert _state(hass, "sensor.station_software_type") == "test"
+
+    response = await client.get(PWS_ROUTE, params=_upload("STATION", "secret", "50"))
+    assert response.status == HTTPStatus.OK
+    await hass.async_block_till_done()
+    assert _state(hass, "sensor.station_outdoor_temperature") == "10.0"
+
+
+async def test_sensor_allowlist(hass: HomeAssistant, client):
+    response = await client.get(PWS_ROUTE, params=_upload("GARDEN", "secret", "50"))
+    assert response.status == HTTPStatus.OK
+    await hass.async_block_till_done()
+
+    assert _state(hass, "sensor.garden_outdoor_temperature") == "10.0"
+    assert hass.states.get("sensor.garden_outdoor_humidity") is None
+
+
+async def test_upload_rejected(hass: HomeAssistant, client):
+    response = await client.get(PWS_ROUTE, params=_upload("STATION", "wrong", "70"))
+    assert response.status == HTTPStatus.FORBIDDEN
+    await hass.async_block_till_done()
+
+    assert hass.states.async_entity_ids("sensor") == []
+
+
+async def test_upload_invalid(hass: HomeAssistant, client):
+    response = await client.get(PWS_ROUTE, params={"ID": "STATION", "tempf": "70"})
+    assert response.status == HTTPStatus.BAD_REQUEST
+    assert await response.text() == "Missing station ID/password"
+
+    response = await client.get(
+        PWS_ROUTE, params={**_upload("STATION", "secret", "70"), "dateutc": "yesterday"}
+    )
+    assert response.status == HTTPStatus.BAD_REQUEST
+    await hass.async_block_till_done()
+    assert hass.states.async_entity_ids("sensor") == []
+
+
+async def test_batch_states(hass: HomeAssistant, hass_client):
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: {}})
+    await hass.async_block_till_done()
+    client = await hass_client()
+
+    response = await client.post(
+        BATCH_ROUTE,
+        json={
+            "station_id": "station",
+            "states": {
+                "sensor.station_outdoor_temperature": {
+                    "state": "70.0",
+                    "attributes": {"unit_of_measurement": "°F"},
+                },
+                "sensor.station_outdoor_humidity": {"state": "40.0"},
+                # Not a valid entity ID
+                "sensor.STATION_outdoor_humidity": {"state": "40.0"},
+            },
+        },
+    )
+    assert response.status == HTTPStatus.OK
+    assert await response.json() == {"applied": 2}
+    temperature = hass.states.get("sensor.station_outdoor_temperature")
+    assert temperature is not None
+    assert temperature.state == "70.0"
+    assert temperature.attributes["unit_of_measurement"] == "°F"
+    assert _state(hass, "sensor.station_outdoor_humidity") == "40.0"
+
+    response = await client.post(BATCH_ROUTE, data="not json")
+    assert response.status == HTTPStatus.BAD_REQUEST
+
+
+async def test_batch_states_requires_auth(hass: HomeAssistant, client):
+    response = await client.post(BATCH_ROUTE, json={"states": {}})
+    assert response.status == HTTPStatus.UNAUTHORIZED
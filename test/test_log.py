@@ -0,0 +1,92 @@
+from logging.handlers import BufferingHandler
+import logging
+
+from pwsproto.log import (
+    LazyFields,
+    LazyMeasurements,
+    WarningRateLimiter,
+    start_queue_logging,
+)
+from pwsproto.probe import process_params
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.station import Measurement, WeatherStation
+
+from unittest.mock import patch
+import pytest
+
+
+def test_lazy_fields():
+    assert str(LazyFields({"a": 1, "b": "x"})) == "a=1, b=x"
+    assert (
+        str(LazyMeasurements({"t": Measurement(70.0, "°F"), "s": Measurement("v")}))
+        == "t=70.0 °F, s=v"
+    )
+
+
+def test_lazy_fields_not_formatted_when_dropped():
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("Formatted")
+
+    logger = logging.getLogger("test_lazy")
+    logger.setLevel(logging.WARNING)
+    logger.info("%s", LazyFields({"a": Unformattable()}))
+
+
+def test_warning_rate_limiter():
+    limiter = WarningRateLimiter(interval=10.0, max_keys=2)
+    with patch("pwsproto.log.time.monotonic", return_value=0.0):
+        assert limiter.allow("a") == 0
+        assert limiter.allow("a") is None
+        assert limiter.allow("a") is None
+    with patch("pwsproto.log.time.monotonic", return_value=10.0):
+        assert limiter.allow("a") == 2
+        assert limiter.allow("b") == 0
+        # "a" is the least recently warned key
+        assert limiter.allow("c") == 0
+        assert "a" not in limiter.warned
+        assert limiter.allow("b") is None
+
+
+def test_unknown_parameters_rate_limited(caplog: pytest.LogCaptureFixture):
+    processor = PWSRequestProcessor([WeatherStation("station", "password")])
+    params = {
+        "ID": "station",
+        "PASSWORD": "password",
+        "dateutc": "now",
+        "action": "updateraw",
+        "unknown": "1",
+    }
+    with caplog.at_level(logging.WARNING):
+        processor.process_request(params)
+        processor.process_request(params)
+    assert [record.getMessage() for record in caplog.records] == [
+        "Unknown parameters from station: action=updateraw, unknown=1"
+    ]
+
+
+def test_probe_does_not_log_password(caplog: pytest.LogCaptureFixture):
+    with caplog.at_level(logging.INFO):
+        process_params(
+            {"ID": "station", "PASSWORD": "secret", "tempf": "70", "action": "x"}
+        )
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert "outdoor_temperature=70.0" in message
+    assert "action=x" in message
+    assert "secret" not in message
+
+
+def test_queue_logging():
+    logger = logging.getLogger("test_queue")
+    logger.propagate = False
+    handler = BufferingHandler(capacity=100)
+    logger.addHandler(handler)
+    listener = start_queue_logging(logger)
+    try:
+        assert handler not in logger.handlers
+        logger.warning("Upload from %s", "station")
+    finally:
+        listener.stop()
+        logger.handlers.clear()
+    assert [record.getMessage() for record in handler.buffer] == ["Upload from station"]
@@ -32,3 +32,28 @@ def test_pws_to_measurement_dict_unknown():
     assert len(sample_measurements) == 0
     assert len(unmatched_params) == 1
     assert "nonxist" in unmatched_params
+
+
+def test_pws_to_measurement_dict_numbered_sensors():
+    sample_measurements, unmatched_params = pws_to_measurement_dict(
+        {
+            "temp2f": "50.0",
+            "soiltemp3f": "48.5",
+            "soilmoisture4": "30",
+            "leafwetness2": "12",
+            "temp16f": "51.0",
+            "temp1f": "42.0",
+            "temp17f": "42.0",
+            "soilmoisture100": "42",
+        }
+    )
+    assert set(unmatched_params) == {"temp1f", "temp17f", "soilmoisture100"}
+    assert sample_measurements["outdoor_temperature_16"].value == 51.0
+    assert sample_measurements["outdoor_temperature_2"].value == 50.0
+    assert (
+        sample_measurements["outdoor_temperature_2"].unit
+        == url_param_to_status_dict["tempf"].reported_unit
+    )
+    assert sample_measurements["soil_temperature_3"].value == 48.5
+    assert sample_measurements["soil_moisture_4"].value == 30.0
+    assert sample_measurements["leaf_wetness_2"].value == 12.0
@@ -0,0 +1,73 @@
+from pwsproto import metrics
+from pwsproto.metrics import Counter, GaugeCallback, Histogram, Registry
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.server import metrics_endpoint
+from pwsproto.station import WeatherStation
+
+import pytest
+
+
+def test_counter_render():
+    registry = Registry()
+    counter = Counter("test_total", "Test counter", ("station",), registry=registry)
+    counter.labels("a").inc()
+    counter.labels("a").inc(2)
+    counter.labels('b"\\').inc()
+    assert registry.render().splitlines() == [
+        "# HELP test_total Test counter",
+        "# TYPE test_total counter",
+        'test_total{station="a"} 3.0',
+        'test_total{station="b\\"\\\\"} 1.0',
+    ]
+
+
+def test_histogram_render():
+    registry = Registry()
+    histogram = Histogram("test_seconds", "Test", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 2.65",
+        "test_seconds_count 4",
+    ]
+
+
+def test_gauge_callback_render():
+    registry = Registry()
+    GaugeCallback("queue", "Queue", lambda: {"depth": 3}, registry=registry)
+    assert registry.render().splitlines() == [
+        "# HELP queue_depth Queue: depth",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+    ]
+
+
+def test_process_request_metrics():
+    processor = PWSRequestProcessor([WeatherStation("metrics_station", "password")])
+    uploads = metrics.STATION_UPLOADS.labels("metrics_station")
+    decode_count = sum(metrics.DECODE_SECONDS.counts)
+    unknown = metrics.UNKNOWN_PARAMETERS.labels().value
+    rejected = metrics.REJECTED_UPLOADS.labels().value
+
+    processor.process_request(
+        {
+            "ID": "metrics_station",
+            "PASSWORD": "password",
+            "dateutc": "now",
+            "tempf": "70",
+            "unknown": "1",
+        }
+    )
+    with pytest.raises(PermissionError):
+        processor.process_request({"ID": "metrics_station", "PASSWORD": "wrong"})
+
+    assert uploads.value == 1
+    assert sum(metrics.DECODE_SECONDS.counts) == decode_count + 1
+    assert metrics.UNKNOWN_PARAMETERS.labels().value == unknown + 1
+    assert metrics.REJECTED_UPLOADS.labels().value == rejected + 1
+    text = metrics_endpoint()
+    assert 'pws_station_uploads_total{station="metrics_station"} 1.0' in text
+    assert 'pws_stage_seconds_count{stage="update"}' in text
@@ -0,0 +1,107 @@
+from typing import Any
+import threading
+
+from pwsproto.pipeline import PublishQueue, PublishQueueFull
+
+import pytest
+
+
+class BlockingPublisher:
+    def __init__(self):
+        self.published: list[tuple[str, dict[str, Any]]] = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, station_id: str, payloads: dict[str, Any]):
+        self.started.set()
+        self.release.wait()
+        self.published.append((station_id, payloads))
+
+
+def _payload(state: str) -> dict[str, Any]:
+    return {"state": state, "attributes": {}}
+
+
+def _busy_queue(**kwargs: Any) -> tuple[PublishQueue, BlockingPublisher]:
+    # Queue whose single worker is stuck publishing station "busy"
+    publisher = BlockingPublisher()
+    queue = PublishQueue(publisher, workers=1, **kwargs)
+    queue.put("busy", {"temperature": _payload("0")})
+    assert publisher.started.wait(timeout=5)
+    return queue, publisher
+
+
+def test_publish_queue_publishes():
+    publisher = BlockingPublisher()
+    publisher.release.set()
+    queue = PublishQueue(publisher)
+    queue.put("station", {"temperature": _payload("42")})
+    queue.stop()
+
+    assert publisher.published == [("station", {"temperature": _payload("42")})]
+    assert queue.metrics()["published"] == 1
+    assert queue.depth == 0
+
+
+def test_publish_queue_coalesces():
+    queue, publisher = _busy_queue()
+    queue.put("station", {"temperature": _payload("1"), "pressure": _payload("2")})
+    queue.put("station", {"temperature": _payload("3")})
+    assert queue.depth == 1
+    publisher.release.set()
+    queue.stop()
+
+    assert publisher.published[1] == (
+        "station",
+        {"temperature": _payload("3"), "pressure": _payload("2")},
+    )
+    assert queue.coalesced == 1
+
+
+def test_publish_queue_drop_oldest():
+    queue, publisher = _busy_queue(max_size=2, overflow="drop-oldest")
+    for i in range(3):
+        queue.put(f"station{i}", {"temperature": _payload(str(i))})
+    assert queue.depth == 2
+    assert queue.lag > 0
+    publisher.release.set()
+    queue.stop()
+
+    assert [station_id for station_id, _ in publisher.published] == [
+        "busy",
+        "station1",
+        "station2",
+    ]
+    assert queue.dropped == 1
+
+
+def test_publish_queue_reject():
+    queue, publisher = _busy_queue(max_size=1, overflow="reject")
+    queue.put("station0", {"temperature": _payload("0")})
+    with pytest.raises(PublishQueueFull):
+        queue.put("station1", {"temperature": _payload("1")})
+    # Updates of a pending station are still coalesced
+    queue.put("station0", {"temperature": _payload("2")})
+    publisher.release.set()
+    queue.stop()
+
+    assert queue.rejected == 1
+    assert publisher.published[1] == ("station0", {"temperature": _payload("2")})
+
+
+def test_publish_queue_block():
+    queue, publisher = _busy_queue(max_size=1, overflow="block")
+    queue.put("station0", {"temperature": _payload("0")})
+    blocked = threading.Thread(
+        target=queue.put, args=("station1", {"temperature": _payload("1")})
+    )
+    blocked.start()
+    blocked.join(timeout=0.1)
+    assert blocked.is_alive()
+
+    publisher.release.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive()
+    queue.stop()
+
+    assert len(publisher.published) == 3
@@ -90,3 +90,48 @@ def test_request_processor_auth_fail_multiple():
         request_station1 = _sample_request(1, False)
         processor.process_request(request_station1)
         callback.assert_not_called()
+
+
+def test_request_processor_shared_id():
+    callback = MagicMock()
+    stations = [
+        WeatherStation("shared", "test_password", update_callback=callback),
+        WeatherStation("shared", "test_password", update_callback=callback),
+        WeatherStation("shared", "other_password", update_callback=callback),
+    ]
+    processor = PWSRequestProcessor(stations)
+    processor.process_request(_sample_request_dict("shared", "test_password"))
+    assert callback.call_count == 2
+    callback.assert_any_call(stations[0])
+    callback.assert_any_call(stations[1])
+
+
+def test_request_processor_add_remove_station():
+    callback = MagicMock()
+    processor = PWSRequestProcessor([])
+    with pytest.raises(PermissionError, match="Invalid station ID/password"):
+        processor.process_request(_sample_request(0, True))
+
+    station = _sample_stations(1, callback)[0]
+    processor.add_station(station)
+    assert processor.stations == (station,)
+    with pytest.raises(AttributeError):
+        processor.stations.append(station)  # type: ignore[attr-defined]
+    processor.process_request(_sample_request(0, True))
+    callback.assert_called_once_with(station)
+
+    processor.remove_station(station)
+    assert len(processor.stations) == 0
+    with pytest.raises(PermissionError, match="Invalid station ID/password"):
+        processor.process_request(_sample_request(0, True))
+
+
+def test_request_processor_date_now():
+    callback = MagicMock()
+    stations = _sample_stations(1, callback)
+    processor = PWSRequestProcessor(stations)
+    request = _sample_request(0, True)
+    request["dateutc"] = "now"
+    processor.process_request(request)
+    callback.assert_called_once_with(stations[0])
+    assert stations[0].sensors["outdoor_temperature"].last_measurement_date is not None
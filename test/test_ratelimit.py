@@ -0,0 +1,160 @@
+from typing import Any
+from wsgiref.util import setup_testing_defaults
+
+from bottle import Bottle
+
+from pwsproto.ingest import PWS_ROUTE, IngestApp
+from pwsproto.pws_request import PWSRequestProcessor
+from pwsproto.ratelimit import RateLimited, TokenBuckets, client_address
+from pwsproto.server import RequestProcessor
+from pwsproto.station import WeatherStation
+
+from unittest.mock import patch
+import ipaddress
+import pytest
+
+QUERY = "ID=STATION&PASSWORD=KEY&dateutc=2025-02-15+17%3A30%3A20&tempf=70"
+
+
+def _request(
+    app: Any, query: str, address: str, forwarded_for: str | None = None
+) -> tuple[str, dict[str, str], bytes]:
+    environ: dict[str, Any] = {
+        "PATH_INFO": PWS_ROUTE,
+        "QUERY_STRING": query,
+        "REMOTE_ADDR": address,
+    }
+    if forwarded_for is not None:
+        environ["HTTP_X_FORWARDED_FOR"] = forwarded_for
+    setup_testing_defaults(environ)
+    response: dict[str, Any] = {}
+
+    def start_response(status: str, headers: list[tuple[str, str]], exc_info=None):
+        response["status"] = status
+        response["headers"] = dict(headers)
+
+    body = b"".join(app(environ, start_response))
+    return response["status"], response["headers"], body
+
+
+def test_token_buckets():
+    buckets = TokenBuckets(rate=0.5, burst=2)
+    with patch("pwsproto.ratelimit.time.monotonic", return_value=0.0):
+        assert buckets.take("a") == 0
+        assert buckets.take("a") == 0
+        assert buckets.take("a") == 2.0
+        assert buckets.take("b") == 0
+    with patch("pwsproto.ratelimit.time.monotonic", return_value=1.0):
+        assert buckets.take("a") == 1.0
+    with patch("pwsproto.ratelimit.time.monotonic", return_value=100.0):
+        # Refilled up to the burst only
+        assert buckets.take("a") == 0
+        assert buckets.take("a") == 0
+        assert buckets.take("a") > 0
+
+
+def test_token_buckets_bounded():
+    buckets = TokenBuckets(rate=1.0, burst=1, max_keys=2)
+    with patch("pwsproto.ratelimit.time.monotonic", return_value=0.0):
+        buckets.take("a")
+        buckets.take("b")
+        buckets.take("a")
+        for i in range(100):
+            buckets.take(f"scan{i}")
+    assert len(buckets.buckets) == 2
+    assert list(buckets.buckets) == ["scan98", "scan99"]
+
+
+def test_token_buckets_invalid():
+    with pytest.raises(ValueError):
+        TokenBuckets(rate=0.0)
+    with pytest.raises(ValueError):
+        TokenBuckets(rate=1.0, burst=0.5)
+
+
+def test_client_address():
+    proxies = [ipaddress.ip_network("10.0.0.0/8"), ipaddress.ip_network("::1")]
+    assert client_address("192.0.2.1", None, proxies) == "192.0.2.1"
+    # The header of untrusted connections is ignored
+    assert client_address("192.0.2.1", "198.51.100.1", proxies) == "192.0.2.1"
+    assert client_address("192.0.2.1", "198.51.100.1", []) == "192.0.2.1"
+    assert client_address("10.0.0.1", None, proxies) == "10.0.0.1"
+    assert client_address("10.0.0.1", "198.51.100.1", proxies) == "198.51.100.1"
+    # Hops before the first untrusted one may be forged
+    assert (
+        client_address("::1", "203.0.113.9, 198.51.100.1, 10.1.2.3", proxies)
+        == "198.51.100.1"
+    )
+    assert client_address("10.0.0.1", "10.0.0.2,10.0.0.3", proxies) == "10.0.0.2"
+    assert client_address("10.0.0.1", "unknown", proxies) == "unknown"
+
+
+def test_station_limit_counts_authenticated_uploads():
+    station = WeatherStation("STATION", "KEY")
+    processor = PWSRequestProcessor([station])
+    processor.station_limiter = TokenBuckets(rate=0.001, burst=1)
+    params = {"ID": "STATION", "PASSWORD": "KEY", "dateutc": "now", "tempf": "70"}
+
+    for _ in range(3):
+        with pytest.raises(PermissionError):
+            processor.process_request({**params, "PASSWORD": "WRONG"})
+    processor.process_request(params)
+    with patch("pwsproto.pws_request.pws_to_measurement_dict") as decode:
+        with pytest.raises(RateLimited):
+            processor.process_request({**params, "tempf": "80"})
+        decode.assert_not_called()
+    measurement = station.sensors["outdoor_temperature"].last_measurement
+    assert measurement is not None
+    assert measurement.value == 70.0
+
+
+@pytest.mark.parametrize("app_type", ["ingest", "bottle"])
+def test_address_limit(app_type: str):
+    station = WeatherStation("STATION", "KEY")
+    if app_type == "ingest":
+        processor = PWSRequestProcessor([station])
+        app = IngestApp(processor)
+    else:
+        processor = RequestProcessor([station])
+        app = Bottle()
+        app.route(PWS_ROUTE, method="GET", callback=processor)
+    processor.address_limiter = TokenBuckets(rate=0.001, burst=2)
+
+    assert _request(app, QUERY, "192.0.2.1")[0] == "200 OK"
+    assert _request(app, "ID=STATION&PASSWORD=WRONG", "192.0.2.1")[0] == (
+        "403 Forbidden"
+    )
+    with patch.object(processor, "process_fields") as process_fields:
+        status, headers, body = _request(app, QUERY, "192.0.2.1")
+        process_fields.assert_not_called()
+    assert status == "429 Too Many Requests"
+    assert int(headers["Retry-After"]) > 0
+    assert body == b"Too many requests"
+    # Other clients are not limited
+    assert _request(app, QUERY, "192.0.2.2")[0] == "200 OK"
+
+
+@pytest.mark.parametrize("app_type", ["ingest", "bottle"])
+def test_address_limit_behind_proxy(app_type: str):
+    station = WeatherStation("STATION", "KEY")
+    if app_type == "ingest":
+        processor = PWSRequestProcessor([station])
+        app = IngestApp(processor)
+    else:
+        processor = RequestProcessor([station])
+        app = Bottle()
+        app.route(PWS_ROUTE, method="GET", callback=processor)
+    processor.address_limiter = TokenBuckets(rate=0.001, burst=1)
+    processor.trusted_proxies = [ipaddress.ip_network("127.0.0.1")]
+
+    assert _request(app, QUERY, "127.0.0.1", "192.0.2.1")[0] == "200 OK"
+    assert _request(app, QUERY, "127.0.0.1", "192.0.2.1")[0] == (
+        "429 Too Many Requests"
+    )
+    # Each client behind the proxy has its own bucket
+    assert _request(app, QUERY, "127.0.0.1", "192.0.2.2")[0] == "200 OK"
+    # Clients cannot choose their bucket
+    assert _request(app, QUERY, "192.0.2.3", "192.0.2.4")[0] == "200 OK"
+    assert _request(app, QUERY, "192.0.2.3", "192.0.2.5")[0] == (
+        "429 Too Many Requests"
+    )
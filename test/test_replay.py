@@ -0,0 +1,104 @@
+from argparse import Namespace
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+import threading
+import urllib.parse
+
+from bottle import Bottle
+
+from pwsproto.backends import pooled_wsgi_server
+from pwsproto.pws_request import pws_to_measurement_dict
+from pwsproto.replay import (
+    fleet_uploads,
+    read_uploads,
+    replay_uploads,
+    station_credentials,
+    synthesize,
+)
+from pwsproto.server import PWS_ROUTE, RequestProcessor
+from pwsproto.station import WeatherStation
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _synthesize(path: Path, stations: int = 3, uploads: int = 5):
+    synthesize(
+        Namespace(
+            output=str(path),
+            stations=stations,
+            uploads=uploads,
+            interval=16.0,
+            start=946684800.0,
+            seed=0,
+        )
+    )
+
+
+def test_synthesize(tmp_path: Path):
+    path = tmp_path / "fleet.gz"
+    _synthesize(path)
+    uploads = list(read_uploads(str(path)))
+    assert len(uploads) == 15
+    offsets = [offset for offset, _ in uploads]
+    assert offsets == sorted(offsets)
+
+    params = dict(urllib.parse.parse_qsl(uploads[0][1]))
+    assert params["ID"].startswith("SYNTH")
+    assert params["dateutc"].startswith("2000-01-01 00:00:")
+    del params["ID"], params["PASSWORD"]
+    measurements, unmatched = pws_to_measurement_dict(params)
+    assert "outdoor_temperature" in measurements
+    assert list(unmatched) == ["action"]
+
+
+def test_fleet_uploads(tmp_path: Path):
+    path = tmp_path / "fleet.gz"
+    _synthesize(path, stations=2, uploads=1)
+    uploads = fleet_uploads(str(path), stations=3)
+    assert len(uploads) == 6
+    credentials = station_credentials(uploads)
+    assert sorted(credentials) == [
+        f"SYNTH{station}-{copy}" for station in range(2) for copy in range(3)
+    ]
+    assert credentials["SYNTH1-2"] == "KEY1"
+
+
+def test_replay_uploads(tmp_path: Path):
+    path = tmp_path / "fleet.gz"
+    _synthesize(path)
+    uploads = list(read_uploads(str(path)))
+    stations = [
+        WeatherStation(id, password)
+        for id, password in station_credentials(uploads).items()
+    ]
+    # One station has the wrong password
+    stations[0].password = "wrong"
+    app = Bottle()
+    app.route(PWS_ROUTE, method="GET", callback=RequestProcessor(stations))
+    server = make_server(
+        "127.0.0.1", 0, app, pooled_wsgi_server(4), handler_class=QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        report = replay_uploads(
+            uploads,
+            f"http://127.0.0.1:{server.server_port}",
+            rate=0,
+            concurrency=4,
+            rewrite_date=True,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(report.latencies) == 15
+    assert report.statuses == {"200": 10, "403": 5}
+    assert report.errors == 5
+    assert report.percentile(50) <= report.percentile(99)
+    assert "errors:     5 (33.33%)" in report.summary()
+    assert stations[1].sensors["outdoor_temperature"].last_measurement is not None
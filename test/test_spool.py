@@ -0,0 +1,227 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+import functools
+import json
+import threading
+import time
+
+from pwsproto.ha_http_client import UpdateHAAPI
+from pwsproto.ha_stub import HAStubServer
+from pwsproto.spool import PublishSpool
+from pwsproto.station import Measurement, WeatherStation
+
+from unittest.mock import patch
+import pytest
+
+
+class RecordingPublisher:
+    def __init__(self, available: bool = True):
+        self.available = available
+        self.published: list[tuple[str, dict[str, Any]]] = []
+
+    def __call__(self, station_id: str, payloads: dict[str, Any]) -> bool:
+        if not self.available:
+            return False
+        self.published.append((station_id, payloads))
+        return True
+
+
+@pytest.fixture
+def ha_stub():
+    server = HAStubServer().start()
+    yield server
+    server.stop()
+
+
+def _payload(state: str) -> dict[str, Any]:
+    return {"state": state, "attributes": {}}
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "Timed out"
+        time.sleep(0.01)
+
+
+def test_spool_publishes_in_order(tmp_path: Path):
+    publisher = RecordingPublisher()
+    spool = PublishSpool(publisher, tmp_path, segment_size=64)
+    for i in range(10):
+        spool.put("station", {"temperature": _payload(str(i))})
+    _wait_for(lambda: spool.replayed == 10)
+    spool.stop()
+
+    assert [
+        payloads["temperature"]["state"] for _, payloads in publisher.published
+    ] == [str(i) for i in range(10)]
+    assert spool.backlog == 0
+    # Published segments are deleted
+    assert len(list(tmp_path.glob("*.log"))) == 1
+
+
+def test_spool_replays_after_restart(tmp_path: Path):
+    spool = PublishSpool(
+        RecordingPublisher(available=False), tmp_path, backoff_initial=10
+    )
+    for i in range(3):
+        spool.put("station", {"temperature": _payload(str(i))})
+    spool.stop()
+
+    publisher = RecordingPublisher()
+    spool = PublishSpool(publisher, tmp_path)
+    _wait_for(lambda: spool.replayed == 3)
+    spool.put("station", {"temperature": _payload("3")})
+    _wait_for(lambda: spool.replayed == 4)
+    spool.stop()
+    assert [
+        payloads["temperature"]["state"] for _, payloads in publisher.published
+    ] == [
+        "0",
+        "1",
+        "2",
+        "3",
+    ]
+
+    # Nothing is replayed twice
+    publisher = RecordingPublisher()
+    spool = PublishSpool(publisher, tmp_path)
+    spool.stop()
+    assert publisher.published == []
+
+
+def test_spool_skips_torn_record(tmp_path: Path):
+    (tmp_path / "0.log").write_bytes(
+        b'{"station_id": "station", "payloads": {"temperature": '
+        b'{"state": "1", "attributes": {}}}}\n{"station_id": "sta'
+    )
+    publisher = RecordingPublisher()
+    spool = PublishSpool(publisher, tmp_path)
+    spool.put("station", {"temperature": _payload("2")})
+    _wait_for(lambda: spool.replayed == 2)
+    spool.stop()
+    assert [
+        payloads["temperature"]["state"] for _, payloads in publisher.published
+    ] == [
+        "1",
+        "2",
+    ]
+    assert spool.backlog == 0
+
+
+def test_spool_compacts_backlog(tmp_path: Path):
+    spool = PublishSpool(
+        RecordingPublisher(available=False),
+        tmp_path,
+        segment_size=256,
+        backoff_initial=10,
+    )
+    for i in range(100):
+        spool.put("station", {"temperature": _payload(str(i))})
+        spool.put("station", {"humidity": _payload(str(i))})
+        spool.put("other", {"temperature": _payload(str(i))})
+    spool.stop()
+
+    # The backlog is compacted on restart, before being replayed
+    publisher = RecordingPublisher()
+    spool = PublishSpool(publisher, tmp_path, compact_size=1024)
+    _wait_for(lambda: spool.backlog == 0)
+    spool.stop()
+
+    assert spool.compactions == 1
+    assert publisher.published == [
+        ("station", {"temperature": _payload("99"), "humidity": _payload("99")}),
+        ("other", {"temperature": _payload("99")}),
+    ]
+
+
+def test_spool_ha_outage(ha_stub: HAStubServer, tmp_path: Path):
+    ha_stub.available = False
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=1
+    )
+    spool = PublishSpool(
+        functools.partial(update_ha_api.publish, wait_completion=True),
+        tmp_path,
+        backoff_initial=0.01,
+    )
+    station = WeatherStation("test_station", "test_password", spool)
+    for temperature in (70.0, 71.0):
+        station.update_measurement(
+            {
+                "date": Measurement(datetime(1999, 12, 31, 23, 59, 59)),
+                "outdoor_temperature": Measurement(temperature),
+                "outdoor_humidity": Measurement(40.0),
+            }
+        )
+    _wait_for(lambda: spool.retried >= 2)
+    assert ha_stub.states == {}
+
+    ha_stub.available = True
+    _wait_for(lambda: spool.replayed == 2)
+    spool.stop()
+    update_ha_api.close()
+
+    assert ha_stub.states["sensor.test_station_outdoor_temperature"]["state"] == "71.0"
+    assert ha_stub.states["sensor.test_station_outdoor_humidity"]["state"] == "40.0"
+
+
+def test_spool_dead_letters(ha_stub: HAStubServer, tmp_path: Path):
+    update_ha_api = UpdateHAAPI(
+        "token", "127.0.0.1", ha_port=ha_stub.port, concurrency=1
+    )
+    spool = PublishSpool(
+        functools.partial(update_ha_api.publish, wait_completion=True),
+        tmp_path,
+        backoff_initial=10,
+    )
+    # Rejected with a 400 error, which must not block the next records
+    spool.put("STATION", {"outdoor-temperature": _payload("70.0")})
+    spool.put("STATION", {"outdoor_temperature": _payload("71.0")})
+    _wait_for(lambda: spool.replayed == 1)
+    spool.stop()
+    update_ha_api.close()
+
+    assert spool.retried == 0
+    assert spool.dead_letters == 1
+    assert spool.backlog == 0
+    assert ha_stub.states["sensor.station_outdoor_temperature"]["state"] == "71.0"
+    dead_letters = (tmp_path / "dead-letters.log").read_text().splitlines()
+    assert len(dead_letters) == 1
+    dead_letter = json.loads(dead_letters[0])
+    assert dead_letter["payloads"] == {"outdoor-temperature": _payload("70.0")}
+    assert "outdoor-temperature" in dead_letter["error"]
+
+
+def test_spool_put_during_compaction(tmp_path: Path):
+    publisher = RecordingPublisher(available=False)
+    spool = PublishSpool(publisher, tmp_path, compact_size=1024, backoff_initial=0.01)
+    compacting = threading.Event()
+    resume = threading.Event()
+    merge_record = PublishSpool.merge_record
+
+    def slow_merge_record(self, latest, line):
+        compacting.set()
+        assert resume.wait(5)
+        merge_record(self, latest, line)
+
+    with patch.object(PublishSpool, "merge_record", slow_merge_record):
+        for i in range(100):
+            spool.put("station", {"temperature": _payload(str(i))})
+        assert compacting.wait(5)
+        put = threading.Thread(
+            target=spool.put, args=("station", {"humidity": _payload("40")})
+        )
+        put.start()
+        # Not blocked by the compaction in progress
+        put.join(1)
+        assert not put.is_alive()
+        resume.set()
+        _wait_for(lambda: spool.compactions == 1)
+    publisher.available = True
+    _wait_for(lambda: spool.backlog == 0)
+    spool.stop()
+
+    assert publisher.published[-1] == ("station", {"humidity": _payload("40")})
+    assert ("station", {"temperature": _payload("99")}) in publisher.published
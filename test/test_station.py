@@ -155,3 +155,45 @@ def test_station_get_ha_payloads():
     assert len(payload_compare) == len(expected_payloads), (
         f"Payloads differ: {payloads} vs. {expected_payloads}"
     )
+
+
+def test_station_update_numbered_sensor():
+    station = WeatherStation("test_user", "test_password")
+    station.update_measurement(
+        {
+            "date": Measurement(datetime(1999, 12, 31, 23, 59, 59)),
+            "outdoor_temperature_2": Measurement(50.0, UnitOfTemperature.FAHRENHEIT),
+        }
+    )
+
+    sensor = station.sensors["outdoor_temperature_2"]
+    assert sensor.entity_description.key == "outdoor_temperature_2"
+    assert sensor.entity_description.device_class == SensorDeviceClass.TEMPERATURE
+
+
+@patch(
+    "pwsproto.station.SENSOR_MAPPING",
+    {
+        "temperature": SensorEntityDescription(key="temperature"),
+        "pressure": SensorEntityDescription(key="pressure"),
+    },
+)
+def test_station_get_ha_payloads_cached():
+    station = WeatherStation("test_user", "test_password")
+    station.update_measurement(_sample_measurement_dict(have_date=True))
+    payloads = station.get_ha_payloads()
+
+    station.update_measurement(
+        {
+            "date": Measurement(datetime(2000, 1, 1, 0, 0, 0)),
+            "temperature": Measurement(43.0),
+        }
+    )
+    updated_payloads = station.get_ha_payloads()
+
+    assert updated_payloads["pressure"] is payloads["pressure"]
+    assert updated_payloads["temperature"]["state"] == "43.0"
+    assert (
+        updated_payloads["temperature"]["attributes"]["updated"]
+        == "2000-01-01T00:00:00"
+    )
@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from homeassistant.const import (
+    PERCENTAGE,
+    UnitOfPrecipitationDepth,
+    UnitOfPressure,
+    UnitOfSpeed,
+    UnitOfTemperature,
+)
+from pwsproto.station import Measurement, WeatherStation
+from pwsproto.units import UnitNormalizer, linear_conversion
+
+import pytest
+
+
+def test_linear_conversion():
+    scale, offset = linear_conversion(
+        UnitOfTemperature.FAHRENHEIT, UnitOfTemperature.CELSIUS
+    )
+    assert 212 * scale + offset == pytest.approx(100)
+    scale, offset = linear_conversion(
+        UnitOfTemperature.CELSIUS, UnitOfTemperature.FAHRENHEIT
+    )
+    assert -40 * scale + offset == pytest.approx(-40)
+    with pytest.raises(ValueError, match="Cannot convert"):
+        linear_conversion(UnitOfTemperature.CELSIUS, UnitOfPressure.HPA)
+
+
+def test_normalizer_metric():
+    normalizer = UnitNormalizer("metric")
+    measurements = normalizer.normalize(
+        {
+            "outdoor_temperature": Measurement(32.0, UnitOfTemperature.FAHRENHEIT),
+            "barometric_pressure": Measurement(29.92, UnitOfPressure.INHG),
+            "wind_speed": Measurement(10.0, UnitOfSpeed.MILES_PER_HOUR),
+            "rain_daily": Measurement(1.0, UnitOfPrecipitationDepth.INCHES),
+            "outdoor_humidity": Measurement(40.0, PERCENTAGE),
+            "software_type": Measurement("vws versionxx"),
+        }
+    )
+    assert measurements["outdoor_temperature"].value == 0.0
+    assert measurements["outdoor_temperature"].unit == UnitOfTemperature.CELSIUS
+    assert measurements["barometric_pressure"].value == pytest.approx(1013.207)
+    assert measurements["barometric_pressure"].unit == UnitOfPressure.HPA
+    assert measurements["wind_speed"].value == pytest.approx(16.093)
+    assert measurements["rain_daily"].value == 25.4
+    assert measurements["outdoor_humidity"].value == 40.0
+    assert measurements["software_type"].value == "vws versionxx"
+
+
+def test_normalizer_sensor_override():
+    normalizer = UnitNormalizer(
+        "metric", sensor_units={"wind_speed": UnitOfSpeed.METERS_PER_SECOND}
+    )
+    measurements = normalizer.normalize(
+        {
+            "wind_speed": Measurement(10.0, UnitOfSpeed.MILES_PER_HOUR),
+            "wind_gust_speed": Measurement(10.0, UnitOfSpeed.MILES_PER_HOUR),
+        }
+    )
+    assert measurements["wind_speed"].unit == UnitOfSpeed.METERS_PER_SECOND
+    assert measurements["wind_speed"].value == pytest.approx(4.47)
+    assert measurements["wind_gust_speed"].unit == UnitOfSpeed.KILOMETERS_PER_HOUR
+
+
+def test_normalizer_incompatible_override():
+    normalizer = UnitNormalizer(
+        "metric", sensor_units={"wind_speed": UnitOfTemperature.CELSIUS}
+    )
+    measurements = normalizer.normalize(
+        {"wind_speed": Measurement(10.0, UnitOfSpeed.MILES_PER_HOUR)}
+    )
+    assert measurements["wind_speed"].unit == UnitOfSpeed.MILES_PER_HOUR
+    assert measurements["wind_speed"].value == 10.0
+
+
+def test_station_unit_normalizer():
+    station = WeatherStation(
+        "test_user", "test_password", unit_normalizer=UnitNormalizer("metric")
+    )
+    station.update_measurement(
+        {
+            "date": Measurement(datetime(1999, 12, 31, 23, 59, 59)),
+            "outdoor_temperature": Measurement(212.0, UnitOfTemperature.FAHRENHEIT),
+        }
+    )
+    payload = station.get_ha_payloads()["outdoor_temperature"]
+    assert payload["state"] == "100.0"
+    assert payload["attributes"]["unit_of_measurement"] == UnitOfTemperature.CELSIUS